@@ -16,7 +16,7 @@ from __future__ import absolute_import
 
 import logging
 
-from . import auth, config, control, gen
+from . import _lazy
 
 __version__ = '1.11.1'
 
@@ -27,3 +27,8 @@ USER_AGENT = u'ESP'
 SERVICE_AGENT = u'EF_PYTHON/' + __version__
 
 __all__ = ['auth', 'config', 'control', 'gen']
+
+# the subpackages are imported when first used, so that e.g using auth does
+# not import the generated messages used by config and control
+_lazy.make_lazy(__name__, **dict(
+    (name, _lazy.importer(__name__ + u'.' + name)) for name in __all__))
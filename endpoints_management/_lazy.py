@@ -0,0 +1,70 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Defers computing the attributes of a module until they are first used.
+
+Importing the generated message modules, and apitools with them, is a
+large part of the time taken to import this package, so the packages that
+expose them do so lazily.
+"""
+
+from __future__ import absolute_import
+
+import importlib
+import sys
+import types
+
+
+def make_lazy(name, **loaders):
+    """Replaces a loaded module with one that computes some attributes on use.
+
+    Args:
+      name (string): the name of the module, normally its `__name__`
+      **loaders: maps the name of each lazy attribute to a function of no
+        arguments that computes it
+
+    Returns:
+      :class:`types.ModuleType`: the module that replaced the named one
+    """
+    lazy = _LazyModule(sys.modules[name], loaders)
+    sys.modules[name] = lazy
+    return lazy
+
+
+def importer(name):
+    """Creates a function that imports the module with the given name."""
+    return lambda: importlib.import_module(name)
+
+
+class _LazyModule(types.ModuleType):
+    """A module whose lazy attributes are computed when first accessed."""
+
+    def __init__(self, module, loaders):
+        super(_LazyModule, self).__init__(module.__name__, module.__doc__)
+        self.__dict__.update(module.__dict__)
+        # keep the replaced module alive, as python 2 clears the globals of
+        # a module when it is deleted
+        self.__dict__[u'_lazy_module'] = module
+        self.__dict__[u'_lazy_loaders'] = loaders
+
+    def __getattr__(self, name):
+        loader = self.__dict__[u'_lazy_loaders'].get(name)
+        if loader is None:
+            raise AttributeError(u"'module' object has no attribute '%s'" % name)
+        value = loader()
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(self._lazy_loaders))
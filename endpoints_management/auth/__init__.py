@@ -24,5 +24,6 @@ cache.register_backend("lru_cache", "endpoints_management.auth.caches", "LruBack
 
 def create_authenticator(issuers_to_provider_ids, issuer_uri_configs):
     key_uri_supplier = suppliers.KeyUriSupplier(issuer_uri_configs)
-    jwks_supplier = suppliers.JwksSupplier(key_uri_supplier)
+    jwks_supplier = suppliers.JwksSupplier(key_uri_supplier,
+                                           refresh_in_background=True)
     return tokens.Authenticator(issuers_to_provider_ids, jwks_supplier)
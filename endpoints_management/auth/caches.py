@@ -12,31 +12,361 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Defines a dogpile in-memory cache backend that supports size management."""
+"""Defines in-memory caches that support size management.
+
+:class:`LruBackend` is a dogpile.cache backend, and :class:`ExpiringLruCache` is
+a standalone cache whose entries each have their own expiration time.
+Both may be sharded to reduce contention between threads, and count their
+hits, misses and evictions.
+
+:class:`InFlight` shares the value computed for a key among the threads that
+need it at the same time, e.g to fill a cache after a miss.
+"""
 
 from __future__ import absolute_import
 
+import sys
+import threading
+import time
+
 from dogpile.cache import api
-import pylru
+
+
+_DEFAULT_NUM_SHARDS = 8
+
+_STAT_NAMES = (u"hits", u"misses", u"evictions")
 
 
 class LruBackend(api.CacheBackend):
-    """A dogpile.cache backend that uses LRU as the size management."""
+    """A dogpile.cache backend that uses LRU as the size management.
+
+    The entries are spread over shards by the hash of their keys. Each shard
+    is an LRU cache with its own lock, so that concurrent requests seldom
+    wait for each other; the least recently used entry of a shard is evicted
+    when that shard is full.
+
+    Thread safe.
+    """
 
     def __init__(self, options):
         """Initializes an LruBackend.
 
         Args:
-          options: a dictionary that contains configuration options.
+          options: a dictionary that contains configuration options:
+
+            * `capacity`: the maximum number of entries; defaults to 200
+            * `max_size`: if set, the maximum total size of the entries in
+              bytes, as estimated by `sizer`
+            * `sizer`: a function that estimates the size in bytes of a key and
+              its value; defaults to their shallow size
+            * `num_shards`: the number of shards; defaults to 8
+
+        Raises:
+          ValueError: if `capacity` or `num_shards` is not positive
         """
         capacity = options[u"capacity"] if u"capacity" in options else 200
-        self._cache = pylru.lrucache(capacity)
+        max_size = options.get(u"max_size")
+        self._shards = _create_shards(
+            capacity, max_size, options.get(u"num_shards", _DEFAULT_NUM_SHARDS))
+        if max_size is not None:
+            self._sizer = options.get(u"sizer", _approximate_size)
+        else:
+            self._sizer = None
+
+    @property
+    def stats(self):
+        """Counts the hits, misses and evictions of all the shards."""
+        return _sum_stats(self._shards)
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
 
     def get(self, key):
-        return self._cache[key] if key in self._cache else api.NO_VALUE
+        return self._shard(key).get(key, api.NO_VALUE)
+
+    def get_multi(self, keys):
+        return [self.get(key) for key in keys]
 
     def set(self, key, value):
-        self._cache[key] = value
+        size = self._sizer(key, value) if self._sizer is not None else 0
+        self._shard(key).set(key, value, size)
+
+    def set_multi(self, mapping):
+        for key, value in mapping.items():
+            self.set(key, value)
+
+    def delete(self, key):
+        self._shard(key).delete(key)
+
+    def delete_multi(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+
+class ExpiringLruCache(object):
+    """An LRU cache whose entries each expire at their own time.
+
+    The cache is bounded by its number of entries and, optionally, by the
+    total of the sizes given for its entries, e.g their approximate size in
+    bytes; the least recently used entries are evicted to stay within both.
+
+    Like :class:`LruBackend`, the entries may be spread over shards that each
+    have their own lock and bounds.
+
+    Thread safe.
+    """
+
+    def __init__(self, capacity=200, max_size=None, timer=None, num_shards=1):
+        """Initializes an ExpiringLruCache.
+
+        Args:
+          capacity: the maximum number of entries.
+          max_size: if set, the maximum total size of the entries.
+          timer: a function that returns the current time in seconds since the
+            epoch; defaults to `time.time`.
+          num_shards: the number of shards; with a single shard, the least
+            recently used entry of the whole cache is evicted first.
+
+        Raises:
+          ValueError: if `capacity` or `num_shards` is not positive
+        """
+        self._timer = timer
+        self._shards = _create_shards(capacity, max_size, num_shards)
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    @property
+    def size(self):
+        """The total size of the entries."""
+        return sum(shard.size for shard in self._shards)
+
+    @property
+    def stats(self):
+        """Counts the hits, misses and evictions of all the shards.
+
+        Looking up an expired entry counts as a miss.
+        """
+        return _sum_stats(self._shards)
+
+    def get(self, key):
+        """Obtains the value for a key.
+
+        Returns:
+          the value, or None if the key is absent or its entry has expired.
+        """
+        return self._shard(key).get(key, None, now=self._now())
+
+    def set(self, key, value, expiry, size=0):
+        """Adds or replaces the entry for a key.
+
+        Args:
+          key: the key.
+          value: the value; it must not be None.
+          expiry: the time, in seconds since the epoch, at which the entry
+            expires.
+          size: the size of the entry.
+        """
+        self._shard(key).set(key, value, size, expiry=expiry)
 
     def delete(self, key):
-        del self._cache[key]
+        self._shard(key).delete(key)
+
+    def _shard(self, key):
+        shards = self._shards
+        if len(shards) == 1:
+            return shards[0]
+        return shards[hash(key) % len(shards)]
+
+    def _now(self):
+        if self._timer is not None:
+            return self._timer()
+        return time.time()
+
+
+def _create_shards(capacity, max_size, num_shards):
+    if capacity <= 0 or num_shards <= 0:
+        raise ValueError(u"capacity and num_shards must be positive")
+    num_shards = min(num_shards, capacity)
+    if max_size is not None:
+        max_size = _divide_up(max_size, num_shards)
+    return [_LruShard(_divide_up(capacity, num_shards), max_size)
+            for _ in range(num_shards)]
+
+
+def _sum_stats(shards):
+    stats = dict.fromkeys(_STAT_NAMES, 0)
+    for shard in shards:
+        for name, count in shard.stats().items():
+            stats[name] += count
+    return stats
+
+
+# the fields of the links in the list of entries of an _LruShard
+_PREV, _NEXT, _KEY, _VALUE, _SIZE, _EXPIRY = range(6)
+
+
+class _LruShard(object):
+    """An LRU cache guarded by a lock.
+
+    The entries are links in a circular doubly linked list, from the least
+    to the most recently used, so that they are reordered and evicted in
+    constant time.  Entries may have an expiry, after which they are
+    removed when next looked up.
+    """
+
+    def __init__(self, capacity, max_size):
+        self._capacity = capacity
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._links = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None, 0, None]
+        self.size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __len__(self):
+        return len(self._links)
+
+    def stats(self):
+        with self._lock:
+            return {u"hits": self._hits, u"misses": self._misses,
+                    u"evictions": self._evictions}
+
+    def get(self, key, default, now=None):
+        with self._lock:
+            link = self._links.get(key)
+            if link is None:
+                self._misses += 1
+                return default
+            self._unlink(link)
+            expiry = link[_EXPIRY]
+            if expiry is not None and now is not None and now >= expiry:
+                del self._links[key]
+                self.size -= link[_SIZE]
+                self._misses += 1
+                return default
+            self._append(link)
+            self._hits += 1
+            return link[_VALUE]
+
+    def set(self, key, value, size, expiry=None):
+        with self._lock:
+            link = self._links.get(key)
+            if link is not None:
+                self._unlink(link)
+                self.size -= link[_SIZE]
+                link[_VALUE] = value
+                link[_SIZE] = size
+                link[_EXPIRY] = expiry
+            else:
+                link = [None, None, key, value, size, expiry]
+                self._links[key] = link
+            self._append(link)
+            self.size += size
+            self._evict()
+
+    def delete(self, key):
+        with self._lock:
+            link = self._links.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+                self.size -= link[_SIZE]
+
+    def _append(self, link):
+        root = self._root
+        last = root[_PREV]
+        link[_PREV] = last
+        link[_NEXT] = root
+        last[_NEXT] = link
+        root[_PREV] = link
+
+    def _unlink(self, link):  # pylint: disable=no-self-use
+        prev_link, next_link = link[_PREV], link[_NEXT]
+        prev_link[_NEXT] = next_link
+        next_link[_PREV] = prev_link
+
+    def _evict(self):
+        links = self._links
+        while len(links) > self._capacity or (
+                self._max_size is not None and self.size > self._max_size and
+                links):
+            oldest = self._root[_NEXT]
+            self._unlink(oldest)
+            del links[oldest[_KEY]]
+            self.size -= oldest[_SIZE]
+            self._evictions += 1
+
+
+def _divide_up(total, parts):
+    return -(-total // parts)
+
+
+def _approximate_size(key, value):
+    if isinstance(value, api.CachedValue):
+        value = value.payload
+    return sys.getsizeof(key) + sys.getsizeof(value)
+
+
+class InFlight(object):
+    """Shares the outcome of a call among the threads that make it concurrently.
+
+    Thread safe.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> _Call
+
+    def do(self, key, func):
+        """Calls `func`, unless a call for `key` is already in flight.
+
+        Args:
+          key: identifies the call.
+          func: the call to make; it takes no arguments.
+
+        Returns:
+          the result of the call in flight, or else of `func`.
+
+        Raises:
+          Exception: the error raised by the call in flight, or else by `func`.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            in_flight = call is not None
+            if not in_flight:
+                call = _Call()
+                self._calls[key] = call
+
+        if in_flight:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class _Call(object):
+    """A call made by InFlight."""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
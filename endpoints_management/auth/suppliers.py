@@ -17,20 +17,44 @@
 from __future__ import absolute_import
 
 import datetime
-from dogpile import cache
+import logging
+import os
+import threading
+import time
+import weakref
+
 from jwkest import jwk
+from jwkest import jws
 import requests
 import ssl
 
+from . import caches
+
+_logger = logging.getLogger(__name__)
+
 
 _HTTP_PROTOCOL_PREFIX = u"http://"
 _HTTPS_PROTOCOL_PREFIX = u"https://"
 
 _OPEN_ID_CONFIG_PATH = u".well-known/openid-configuration"
 
+_JWKS_TTL = datetime.timedelta(minutes=5)
+_JWKS_REFRESH_AHEAD = datetime.timedelta(minutes=1)
+_JWKS_MAX_STALENESS = datetime.timedelta(hours=1)
+_JWKS_MIN_REFRESH_INTERVAL = datetime.timedelta(seconds=30)
+_JWKS_MAX_TTL = datetime.timedelta(days=1)
+
+_HTTP_TIMEOUT_SECS = 10
+
+_session = None  # pylint: disable=invalid-name
+_session_lock = threading.Lock()  # pylint: disable=invalid-name
+
 
 class KeyUriSupplier(object):  # pylint: disable=too-few-public-methods
-    """A supplier that provides the `jwks_uri` for an issuer."""
+    """A supplier that provides the `jwks_uri` for an issuer.
+
+    Concurrent OpenID discoveries for an issuer share a single request.
+    """
 
     def __init__(self, issuer_uri_configs):
         """Construct an instance of KeyUriSupplier.
@@ -40,6 +64,7 @@ class KeyUriSupplier(object):  # pylint: disable=too-few-public-methods
             configuration.
         """
         self._issuer_uri_configs = issuer_uri_configs
+        self._discoveries = caches.InFlight()
 
     def supply(self, issuer):
         """Supplies the `jwks_uri` for the given issuer.
@@ -67,31 +92,79 @@ class KeyUriSupplier(object):  # pylint: disable=too-few-public-methods
         # discovery.
         open_id_valid = issuer_uri_config.open_id_valid
         if open_id_valid:
-            discovered_jwks_uri = _discover_jwks_uri(issuer)
+            discovered_jwks_uri = self._discoveries.do(
+                issuer, lambda: _discover_jwks_uri(issuer))
             self._issuer_uri_configs[issuer] = IssuerUriConfig(False,
                                                                discovered_jwks_uri)
             return discovered_jwks_uri
 
 
 class JwksSupplier(object):  # pylint: disable=too-few-public-methods
-    """A supplier that returns the Json Web Token Set of an issuer."""
+    """A supplier that returns the Json Web Token Set of an issuer.
+
+    Key sets are cached for the `max-age` in the `Cache-Control` header of
+    their response, or else for a fixed time.  If background refresh is enabled, a
+    daemon thread refreshes each cached key set shortly before it expires,
+    and the cached keys continue to be supplied while it does so, or if it
+    fails, for up to a maximum staleness; so once an issuer's keys have been
+    fetched, supplying them does not wait on the network.  Otherwise, expired
+    key sets are fetched when next supplied.
+
+    In either case, a key set that does not include the requested key id is
+    refetched immediately, but not more often than a minimum refresh
+    interval.  Key sets whose response had an `ETag` are refetched
+    conditionally, so an unchanged key set is not sent again.
+
+    Key sets are indexed by key id and key type, so that only the keys that
+    can verify a token are supplied for it.
+
+    Concurrent fetches of an issuer's key set, whether for supplying it or
+    refreshing it, share a single request.
+    """
 
-    def __init__(self, key_uri_supplier):
+    def __init__(self, key_uri_supplier, refresh_in_background=False,
+                 ttl=_JWKS_TTL,
+                 refresh_ahead=_JWKS_REFRESH_AHEAD,
+                 max_staleness=_JWKS_MAX_STALENESS,
+                 min_refresh_interval=_JWKS_MIN_REFRESH_INTERVAL):
         """Constructs an instance of JwksSupplier.
 
         Args:
           key_uri_supplier: a KeyUriSupplier instance that returns the `jwks_uri`
             based on the given issuer.
+          refresh_in_background: whether to refresh cached key sets in a
+            background thread.
+          ttl: how long key sets are cached; also the minimum time for which
+            they are cached if their response advertises a `max-age`.
+          refresh_ahead: how long before they expire key sets are refreshed in
+            the background.
+          max_staleness: how long after they expire key sets may be supplied
+            while they cannot be refreshed in the background.
+          min_refresh_interval: the minimum time between fetches of an issuer's
+            key set prompted by unknown key ids.
         """
         self._key_uri_supplier = key_uri_supplier
-        self._jwks_cache = cache.make_region().configure(
-            u"dogpile.cache.memory", expiration_time=datetime.timedelta(minutes=5))
-
-    def supply(self, issuer):
+        self._refresh_in_background = refresh_in_background
+        self._ttl_secs = ttl.total_seconds()
+        self._max_ttl_secs = max(self._ttl_secs, _JWKS_MAX_TTL.total_seconds())
+        self._refresh_ahead_secs = refresh_ahead.total_seconds()
+        self._max_staleness_secs = max_staleness.total_seconds()
+        self._min_refresh_interval_secs = min_refresh_interval.total_seconds()
+        self._lock = threading.Lock()
+        self._entries = {}  # issuer -> _JwksEntry
+        self._fetches = caches.InFlight()
+        self._refresher_pid = None  # of the process whose refresher started
+        self._stopped = threading.Event()
+
+    def supply(self, issuer, kid=None, alg=None):
         """Supplies the `Json Web Key Set` for the given issuer.
 
         Args:
           issuer: the issuer.
+          kid: if set, the id of the key that is needed; only the keys with
+            this id are supplied, if there are any.
+          alg: if set, and `kid` is not, the signing algorithm that the key is
+            needed for; only the keys of the type it uses are supplied.
 
         Returns:
           The successfully retrieved Json Web Key Set. None is returned if the
@@ -101,34 +174,180 @@ class JwksSupplier(object):  # pylint: disable=too-few-public-methods
           UnauthenticatedException: When this method cannot supply JWKS for the
             given issuer (e.g. unknown issuer, HTTP request error).
         """
-        def _retrieve_jwks():
-            """Retrieve the JWKS from the given jwks_uri when cache misses."""
-            jwks_uri = self._key_uri_supplier.supply(issuer)
+        now = time.time()
+        entry = self._entries.get(issuer)
+        if entry is None or now >= entry.expiry + self._max_staleness_secs:
+            entry = self._refresh(issuer)
+        elif now >= entry.expiry and not self._refreshing_in_background():
+            entry = self._refresh(issuer)
+        elif (kid is not None and kid not in entry.kids and
+              now >= entry.fetched + self._min_refresh_interval_secs):
+            try:
+                entry = self._refresh(issuer)
+            except UnauthenticatedException:
+                _logger.warn(u"could not refresh the keys of %s for key id %s",
+                             issuer, kid, exc_info=True)
+
+        if self._refresh_in_background:
+            self._start_refresher()
+        return entry.candidates(kid, alg)
+
+    def stop(self):
+        """Stops refreshing key sets in the background."""
+        self._stopped.set()
+
+    def _refresh(self, issuer):
+        return self._fetches.do(issuer, lambda: self._fetch(issuer))
+
+    def _fetch(self, issuer):
+        with self._lock:
+            previous = self._entries.get(issuer)
+        keys, max_age, etag = self._retrieve_jwks(issuer, previous)
+        ttl_secs = self._ttl_secs
+        if max_age is not None:
+            ttl_secs = min(max(max_age, ttl_secs), self._max_ttl_secs)
+        now = time.time()
+        entry = _JwksEntry(keys, now, now + ttl_secs, etag=etag)
+        with self._lock:
+            self._entries[issuer] = entry
+        return entry
+
+    def _refreshing_in_background(self):
+        return (self._refresh_in_background and
+                self._refresher_pid == os.getpid())
+
+    def _start_refresher(self):
+        # a forked process does not inherit the refresh thread, so it starts
+        # its own
+        pid = os.getpid()
+        if self._refresher_pid == pid:
+            return
+        with self._lock:
+            if self._refresher_pid == pid:
+                return
+            self._refresher_pid = pid
+        # the thread only holds a weak reference, so that it ends once this
+        # supplier is no longer used
+        thread = threading.Thread(target=_refresh_periodically,
+                                  args=(weakref.ref(self), self._stopped))
+        thread.daemon = True
+        try:
+            thread.start()
+        except Exception:  # pylint: disable=broad-except
+            _logger.exception(u"Failed to start the JWKS refresh thread.")
+            self._refresh_in_background = False
 
-            if not jwks_uri:
-                raise UnauthenticatedException(u"Cannot find the `jwks_uri` for issuer "
-                                               u"%s: either the issuer is unknown or "
-                                               u"the OpenID discovery failed" % issuer)
+    def _refresh_due(self):
+        """Refreshes the key sets that are due to be refreshed.
 
+        Returns:
+          the number of seconds until the next key set is due to be refreshed.
+        """
+        now = time.time()
+        next_due = now + self._refresh_ahead_secs
+        for issuer, entry in self._entries.items():
+            due = entry.expiry - self._refresh_ahead_secs
+            if now < due:
+                next_due = min(next_due, due)
+                continue
             try:
-                response = requests.get(jwks_uri)
-                json_response = response.json()
-            except Exception as exception:
-                message = u"Cannot retrieve valid verification keys from the `jwks_uri`"
-                raise UnauthenticatedException(message, exception)
-
-            if u"keys" in json_response:
-                # De-serialize the JSON as a JWKS object.
-                jwks_keys = jwk.KEYS()
-                jwks_keys.load_jwks(response.text)
-                return jwks_keys._keys
-            else:
-                # The JSON is a dictionary mapping from key id to X.509 certificates.
-                # Thus we extract the public key from the X.509 certificates and
-                # construct a JWKS object.
-                return _extract_x509_certificates(json_response)
+                self._refresh(issuer)
+            except Exception:  # pylint: disable=broad-except
+                _logger.warn(u"could not refresh the keys of %s", issuer,
+                             exc_info=True)
+                next_due = min(next_due, now + self._min_refresh_interval_secs)
+        return max(next_due - now, 1)
 
-        return self._jwks_cache.get_or_create(issuer, _retrieve_jwks)
+    def _retrieve_jwks(self, issuer, previous=None):
+        """Retrieve the JWKS from the given jwks_uri when cache misses.
+
+        Args:
+          issuer: the issuer.
+          previous: the cached _JwksEntry of the issuer, if any; if it has an
+            ETag, its keys are reused when they have not been modified.
+
+        Returns:
+          a tuple of the keys, the `max-age` of the response in seconds or
+          None, and the ETag of the response or None.
+        """
+        jwks_uri = self._key_uri_supplier.supply(issuer)
+
+        if not jwks_uri:
+            raise UnauthenticatedException(u"Cannot find the `jwks_uri` for issuer "
+                                           u"%s: either the issuer is unknown or "
+                                           u"the OpenID discovery failed" % issuer)
+
+        headers = {}
+        if previous is not None and previous.etag:
+            headers[u"If-None-Match"] = previous.etag
+        try:
+            response = _http_get(jwks_uri, headers=headers)
+            if headers and response.status_code == requests.codes.not_modified:
+                return (previous.keys, _max_age(response),
+                        response.headers.get(u"ETag", previous.etag))
+            json_response = response.json()
+        except Exception as exception:
+            message = u"Cannot retrieve valid verification keys from the `jwks_uri`"
+            raise UnauthenticatedException(message, exception)
+
+        if u"keys" in json_response:
+            # De-serialize the JSON as a JWKS object.
+            jwks_keys = jwk.KEYS()
+            jwks_keys.load_jwks(response.text)
+            keys = jwks_keys._keys
+        else:
+            # The JSON is a dictionary mapping from key id to X.509 certificates.
+            # Thus we extract the public key from the X.509 certificates and
+            # construct a JWKS object.
+            keys = _extract_x509_certificates(json_response)
+        return keys, _max_age(response), response.headers.get(u"ETag")
+
+
+class _JwksEntry(object):
+    """A cached key set."""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, keys, fetched, expiry, etag=None):
+        self.keys = keys
+        self.fetched = fetched
+        self.expiry = expiry
+        self.etag = etag
+        self._keys_by_kid = _index_keys(keys, u"kid")
+        self._keys_by_kty = _index_keys(keys, u"kty")
+
+    @property
+    def kids(self):
+        return self._keys_by_kid.viewkeys()
+
+    def candidates(self, kid, alg):
+        """Obtains the keys that may verify a token with the given header."""
+        if kid:
+            return self._keys_by_kid.get(kid, self.keys)
+        kty = jws.alg2keytype(alg) if alg else None
+        if kty:
+            return self._keys_by_kty.get(kty.upper(), [])
+        return self.keys
+
+
+def _index_keys(keys, attribute):
+    index = {}
+    for key in keys:
+        value = getattr(key, attribute, None)
+        if value:
+            if attribute == u"kty":
+                value = value.upper()
+            index.setdefault(value, []).append(key)
+    return index
+
+
+def _refresh_periodically(supplier_ref, stopped):
+    while not stopped.is_set():
+        supplier = supplier_ref()
+        if supplier is None:
+            return
+        wait_secs = supplier._refresh_due()  # pylint: disable=protected-access
+        del supplier
+        stopped.wait(wait_secs)
 
 
 def _extract_x509_certificates(x509_certificates):
@@ -150,10 +369,48 @@ def _extract_x509_certificates(x509_certificates):
     return keys
 
 
+def _get_session():
+    """Obtains the session that pools the connections to issuers."""
+    global _session  # pylint: disable=global-statement,invalid-name
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        return _session
+
+
+def _http_get(url, headers=None):
+    return _get_session().get(url, headers=headers,
+                              timeout=_HTTP_TIMEOUT_SECS)
+
+
+def _max_age(response):
+    """Obtains the `max-age` in seconds from the Cache-Control of a response.
+
+    Returns:
+      the max-age, 0 if the response may not be cached, or None if the
+      response does not specify either.
+    """
+    cache_control = response.headers.get(u"Cache-Control")
+    if not cache_control:
+        return None
+    max_age = None
+    for directive in cache_control.split(u","):
+        name, _, value = directive.strip().partition(u"=")
+        name = name.lower()
+        if name in (u"no-cache", u"no-store"):
+            return 0
+        if name == u"max-age":
+            try:
+                max_age = max(int(value.strip(u'"')), 0)
+            except ValueError:
+                pass
+    return max_age
+
+
 def _discover_jwks_uri(issuer):
     open_id_url = _construct_open_id_url(issuer)
     try:
-        response = requests.get(open_id_url)
+        response = _http_get(open_id_url)
         return response.json().get(u"jwks_uri")
     except Exception as error:
         raise UnauthenticatedException(u"Cannot discover the jwks uri", error)
@@ -17,22 +17,31 @@
 from __future__ import absolute_import
 
 import datetime
-import jwkest
+import hashlib
+import threading
 import time
 
-from dogpile import cache
-from jwkest import jws
-from jwkest import jwt
+from jwkest import jws, jwt
 
-from . import suppliers
+from . import caches, suppliers, verifiers
 
 INT_TYPES = (int, long)
 
+_MAX_CACHE_TTL = datetime.timedelta(minutes=5)
+
+_REJECTED_TOKEN_TTL = datetime.timedelta(seconds=30)
+
+_CACHE_NUM_SHARDS = 8
+
 
 class Authenticator(object):  # pylint: disable=too-few-public-methods
     """Decodes and verifies the signature of auth tokens."""
 
-    def __init__(self, issuers_to_provider_ids, jwks_supplier, cache_capacity=200):
+    def __init__(self, issuers_to_provider_ids, jwks_supplier, cache_capacity=200,
+                 cache_max_bytes=None, max_cache_ttl=_MAX_CACHE_TTL,
+                 rejected_token_capacity=1000,
+                 rejected_token_ttl=_REJECTED_TOKEN_TTL, verifier=None,
+                 cache_num_shards=_CACHE_NUM_SHARDS):
         """Construct an instance of AuthTokenDecoder.
 
         Args:
@@ -40,20 +49,91 @@ class Authenticator(object):  # pylint: disable=too-few-public-methods
             IDs defined in the service configuration.
           jwks_supplier: an instance of JwksSupplier that supplies JWKS based on
             issuer.
-          cache_capacity: the cache_capacity with default value of 200.
+          cache_capacity: the cache_capacity with default value of 200; both
+            decoded JWT claims and successful authentications are cached.
+          cache_max_bytes: if set, limits the approximate memory used by cached
+            JWT claims.
+          max_cache_ttl: the longest time that decoded JWT claims are cached;
+            they are never cached beyond the expiration of their token.
+          rejected_token_capacity: the number of malformed or unverifiable
+            tokens whose rejection is cached; 0 disables the cache.
+          rejected_token_ttl: how long the rejection of a token is cached.
+          verifier: verifies the signatures of tokens; defaults to the fastest
+            verifier in `endpoints_management.auth.verifiers` that is
+            available.
+          cache_num_shards: the number of shards in each cache, each with its
+            own lock; the capacities and `cache_max_bytes` are divided
+            between them.
         """
         self._issuers_to_provider_ids = issuers_to_provider_ids
         self._jwks_supplier = jwks_supplier
+        if verifier is None:
+            verifier = verifiers.create_verifier()
+        self._verifier = verifier
+        self._max_cache_ttl_secs = max_cache_ttl.total_seconds()
+        self._cache = caches.ExpiringLruCache(cache_capacity,
+                                              max_size=cache_max_bytes,
+                                              num_shards=cache_num_shards)
+        # (token digest, auth info, service name) -> UserInfo
+        self._authenticated = caches.ExpiringLruCache(
+            cache_capacity, num_shards=cache_num_shards)
+        self._rejected_token_ttl_secs = rejected_token_ttl.total_seconds()
+        self._rejected_tokens = None
+        if rejected_token_capacity > 0:
+            self._rejected_tokens = caches.ExpiringLruCache(
+                rejected_token_capacity, num_shards=cache_num_shards)
+        # concurrent requests with the same token decode and verify it once
+        self._decoding = caches.InFlight()
+        self._stats_lock = threading.Lock()
+        self._stats = dict.fromkeys(_STAT_NAMES, 0)
+
+    @property
+    def stats(self):
+        """Counts the work done to verify tokens.
+
+        Returns:
+          dict: maps each of the following to its count
 
-        arguments = {u"capacity": cache_capacity}
-        expiration_time = datetime.timedelta(minutes=5)
-        self._cache = cache.make_region().configure(u"lru_cache",
-                                                    arguments=arguments,
-                                                    expiration_time=expiration_time)
+            * `verifications`: the signatures that were verified
+            * `rejected_tokens`: the tokens that were found to be malformed or
+              had a bad signature, and were added to the rejected token cache
+            * `rejected_token_hits`: the tokens that were rejected from the
+              cache without being decoded again
+        """
+        with self._stats_lock:
+            return dict(self._stats)
+
+    @property
+    def cache_stats(self):
+        """Counts the hits, misses and evictions of each cache.
+
+        Returns:
+          dict: maps `jwt_claims`, `authentications` and, unless it is
+            disabled, `rejected_tokens` to the stats of that cache
+        """
+        stats = {u"jwt_claims": self._cache.stats,
+                 u"authentications": self._authenticated.stats}
+        if self._rejected_tokens is not None:
+            stats[u"rejected_tokens"] = self._rejected_tokens.stats
+        return stats
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _reject(self, cache_key, error):
+        if self._rejected_tokens is not None:
+            self._count(u"rejected_tokens")
+            self._rejected_tokens.set(
+                cache_key, error, time.time() + self._rejected_token_ttl_secs)
 
     def authenticate(self, auth_token, auth_info, service_name):
         """Authenticates the current auth token.
 
+        Successful authentications are cached for as long as the token's
+        claims, so authenticating the same token for the same method again
+        skips all the checks.
+
         Args:
           auth_token: the auth token.
           auth_info: the auth configurations of the API method being called.
@@ -68,8 +148,14 @@ class Authenticator(object):  # pylint: disable=too-few-public-methods
             * the audiences are not allowed;
             * the auth token has already expired.
         """
+        cache_key = _cache_key(auth_token)
+        authenticated_key = (cache_key, auth_info, service_name)
+        user_info = self._authenticated.get(authenticated_key)
+        if user_info is not None:
+            return user_info
+
         try:
-            jwt_claims = self.get_jwt_claims(auth_token)
+            jwt_claims = self._get_jwt_claims(auth_token, cache_key)
         except Exception as error:
             raise suppliers.UnauthenticatedException(u"Cannot decode the auth token",
                                                      error)
@@ -93,10 +179,13 @@ class Authenticator(object):  # pylint: disable=too-few-public-methods
         has_service_name = service_name in audiences
 
         allowed_audiences = auth_info.get_allowed_audiences(provider_id)
-        intersected_audiences = set(allowed_audiences).intersection(audiences)
-        if not has_service_name and not intersected_audiences:
+        if not has_service_name and not any(
+                audience in allowed_audiences for audience in audiences):
             raise suppliers.UnauthenticatedException(u"Audiences not allowed")
 
+        expiry = self._cache_expiry(jwt_claims)
+        if expiry is not None:
+            self._authenticated.set(authenticated_key, user_info, expiry)
         return user_info
 
     def get_jwt_claims(self, auth_token):
@@ -106,7 +195,11 @@ class Authenticator(object):  # pylint: disable=too-few-public-methods
         immediately in case of a cache hit. When cache misses, the method tries to
         decode the given auth token, verify its signature, and check the existence
         of required JWT claims. When successful, the decoded JWT claims are loaded
-        into the cache and then returned.
+        into the cache until the token expires, or for at most the maximum cache
+        TTL, and then returned. When the token is malformed or its signature
+        is bad, the error is cached briefly, and raised again for the same
+        token without decoding it. Concurrent calls for a token that is not
+        cached share a single decoding and verification.
 
         Args:
           auth_token: the auth token to be decoded.
@@ -118,21 +211,86 @@ class Authenticator(object):  # pylint: disable=too-few-public-methods
           UnauthenticatedException: When the signature verification fails, or when
             required claims are missing.
         """
+        return self._get_jwt_claims(auth_token, _cache_key(auth_token))
 
-        def _decode_and_verify():
-            jwt_claims = jwt.JWT().unpack(auth_token).payload()
-            _verify_required_claims_exist(jwt_claims)
+    def _get_jwt_claims(self, auth_token, cache_key):
 
+        def _decode_and_verify():
+            try:
+                unpacked = jwt.JWT().unpack(auth_token)
+                jwt_claims = unpacked.payload()
+                _verify_required_claims_exist(jwt_claims)
+            except Exception as exception:
+                self._reject(cache_key, exception)
+                raise
+
+            # failures to supply the keys are not the token's fault, so they
+            # are not cached
             issuer = jwt_claims[u"iss"]
-            keys = self._jwks_supplier.supply(issuer)
+            headers = unpacked.headers
+            keys = self._jwks_supplier.supply(issuer,
+                                              kid=headers.get(u"kid"),
+                                              alg=headers.get(u"alg"))
             try:
-                return jws.JWS().verify_compact(auth_token, keys)
-            except (jwkest.BadSignature, jws.NoSuitableSigningKeys,
-                    jws.SignerAlgError) as exception:
-                raise suppliers.UnauthenticatedException(u"Signature verification failed",
-                                                         exception)
+                self._count(u"verifications")
+                self._verifier.verify(unpacked, keys)
+            except suppliers.UnauthenticatedException as error:
+                # like failures to supply the keys, a missing key may be
+                # supplied once the issuer's keys are refreshed, e.g after it
+                # rotates them
+                if not _lacks_signing_key(error):
+                    self._reject(cache_key, error)
+                raise
+            return jwt_claims
+
+        jwt_claims = self._cache.get(cache_key)
+        if jwt_claims is not None:
+            return jwt_claims
+
+        if self._rejected_tokens is not None:
+            error = self._rejected_tokens.get(cache_key)
+            if error is not None:
+                self._count(u"rejected_token_hits")
+                raise error
+
+        def _decode_verify_and_cache():
+            jwt_claims = _decode_and_verify()
+            expiry = self._cache_expiry(jwt_claims)
+            if expiry is not None:
+                # the token's size approximates that of its claims
+                self._cache.set(cache_key, jwt_claims, expiry,
+                                size=len(cache_key) + len(auth_token))
+            return jwt_claims
+
+        return self._decoding.do(cache_key, _decode_verify_and_cache)
+
+    def _cache_expiry(self, jwt_claims):
+        """Obtains when cached results for a token should expire.
+
+        Returns:
+          the expiry in seconds since the epoch, or None if the results
+          should not be cached.
+        """
+        expiration = jwt_claims[u"exp"]
+        if not isinstance(expiration, INT_TYPES):
+            return None
+        now = time.time()
+        expiry = min(expiration, now + self._max_cache_ttl_secs)
+        return expiry if expiry > now else None
+
+
+_STAT_NAMES = (u"verifications", u"rejected_tokens", u"rejected_token_hits")
+
+
+def _lacks_signing_key(error):
+    """Determines if verification failed as none of the keys could be used."""
+    return any(isinstance(arg, jws.NoSuitableSigningKeys) for arg in error.args)
+
 
-        return self._cache.get_or_create(auth_token, _decode_and_verify)
+def _cache_key(auth_token):
+    if isinstance(auth_token, unicode):
+        auth_token = auth_token.encode(u"utf-8")
+    return hashlib.sha256(auth_token).digest()
 
 
 class UserInfo(object):
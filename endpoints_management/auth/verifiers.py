@@ -0,0 +1,270 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Verifies the signatures of auth tokens.
+
+A verifier has a single method, ``verify(unpacked_token, keys)``, that raises
+:class:`endpoints_management.auth.suppliers.UnauthenticatedException` unless
+one of `keys` verifies the signature of a token that has been unpacked by
+:class:`jwkest.jwt.JWT`.
+
+:class:`JwkestVerifier` verifies signatures with jwkest.
+:class:`CryptographyVerifier` verifies RSA and ECDSA signatures with the
+native implementations in the optional `cryptography` package, and caches the
+public keys it loads from the JSON Web Keys. :func:`create_verifier` uses it
+when `cryptography` is installed.
+
+"""
+
+from __future__ import absolute_import
+
+import logging
+import threading
+
+import jwkest
+import pylru
+from jwkest import jws
+
+from . import suppliers
+
+_logger = logging.getLogger(__name__)
+
+_KEY_CACHE_CAPACITY = 100
+
+_NOT_LOADED = object()
+cryptography = _NOT_LOADED  # pylint: disable=invalid-name
+
+
+def has_cryptography():
+    """Determines if the `cryptography` package is installed."""
+    global cryptography  # pylint: disable=global-statement,invalid-name
+    if cryptography is _NOT_LOADED:
+        try:
+            import cryptography as loaded  # pylint: disable=redefined-outer-name
+        except ImportError:
+            loaded = None
+        cryptography = loaded
+    return cryptography is not None
+
+
+def create_verifier():
+    """Creates the fastest verifier that is available."""
+    if has_cryptography():
+        return CryptographyVerifier()
+    return JwkestVerifier()
+
+
+class JwkestVerifier(object):  # pylint: disable=too-few-public-methods
+    """Verifies signatures with jwkest."""
+
+    def verify(self, unpacked_token, keys):
+        """Verifies the signature of a token.
+
+        Args:
+          unpacked_token: the token, unpacked by :class:`jwkest.jwt.JWT`.
+          keys: the JSON Web Keys that may have signed the token.
+
+        Raises:
+          UnauthenticatedException: if none of the keys verifies the signature.
+        """
+        auth_token = b".".join(unpacked_token.b64part)
+        try:
+            jws.JWS().verify_compact(auth_token, keys)
+        except (jwkest.BadSignature, jws.NoSuitableSigningKeys,
+                jws.SignerAlgError) as exception:
+            raise suppliers.UnauthenticatedException(u"Signature verification failed",
+                                                     exception)
+
+
+class CryptographyVerifier(object):  # pylint: disable=too-few-public-methods
+    """Verifies signatures with the `cryptography` package.
+
+    Keys are chosen as jwkest does. RSA, RSA-PSS and ECDSA signatures are
+    verified natively, using public keys that are loaded once per JSON Web
+    Key; tokens with other algorithms are verified by jwkest.
+
+    Thread safe.
+    """
+
+    def __init__(self, key_cache_capacity=_KEY_CACHE_CAPACITY):
+        """Constructor.
+
+        Args:
+          key_cache_capacity (int): the number of loaded public keys to cache
+
+        Raises:
+          ImportError: if `cryptography` is not installed
+        """
+        if not has_cryptography():
+            _logger.error(u'cryptography is needed by CryptographyVerifier')
+            raise ImportError(u'No module named cryptography')
+        self._algs = _cryptography_algs()
+        self._fallback = JwkestVerifier()
+        self._lock = threading.Lock()
+        self._public_keys = pylru.lrucache(key_cache_capacity)
+
+    def verify(self, unpacked_token, keys):
+        """Verifies the signature of a token.
+
+        Args:
+          unpacked_token: the token, unpacked by :class:`jwkest.jwt.JWT`.
+          keys: the JSON Web Keys that may have signed the token.
+
+        Raises:
+          UnauthenticatedException: if none of the keys verifies the signature.
+        """
+        alg = unpacked_token.headers.get(u"alg")
+        verify_signature = self._algs.get(alg)
+        if verify_signature is None:
+            self._fallback.verify(unpacked_token, keys)
+            return
+
+        candidates = _pick_keys(keys, alg, unpacked_token.headers.get(u"kid"))
+        if not candidates:
+            raise suppliers.UnauthenticatedException(
+                u"Signature verification failed",
+                jws.NoSuitableSigningKeys(u"No key for algorithm: %s" % alg))
+
+        sign_input = b".".join(unpacked_token.b64part[:2])
+        signature = unpacked_token.part[2]
+        for key in candidates:
+            public_key = self._public_key(key)
+            if public_key is None:
+                verified = _verify_with_jwkest(alg, sign_input, signature, key)
+            else:
+                verified = verify_signature(public_key, signature, sign_input)
+            if verified:
+                return
+
+        raise suppliers.UnauthenticatedException(u"Signature verification failed",
+                                                 jwkest.BadSignature())
+
+    def _public_key(self, key):
+        cache_key = (key.kid, id(key))
+        with self._lock:
+            cached = self._public_keys.get(cache_key)
+        # the cached key is kept, so its id is not reused while it is cached
+        if cached is not None and cached[0] is key:
+            return cached[1]
+
+        public_key = _load_public_key(key)
+        with self._lock:
+            self._public_keys[cache_key] = (key, public_key)
+        return public_key
+
+
+def _pick_keys(keys, alg, kid):
+    """Picks the keys that may verify a signature like jwkest does."""
+    kty = jws.alg2keytype(alg).upper()
+    picked = []
+    for key in keys:
+        if key.kty.upper() != kty:
+            continue
+        if kid and kid != key.kid:
+            continue
+        if key.alg and key.alg != alg:
+            continue
+        picked.append(key)
+    return picked
+
+
+def _verify_with_jwkest(alg, sign_input, signature, key):
+    try:
+        return jws.SIGNER_ALGS[alg].verify(sign_input, signature,
+                                           key.get_key(alg=alg, private=False))
+    except jwkest.BadSignature:
+        return False
+
+
+def _load_public_key(key):
+    """Loads the public key of a JSON Web Key with `cryptography`.
+
+    Returns:
+      the public key, or None if it cannot be loaded.
+    """
+    # pylint: disable=import-error
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
+    try:
+        if key.kty.upper() == u"RSA":
+            numbers = rsa.RSAPublicNumbers(long(key.e), long(key.n))
+            return numbers.public_key(default_backend())
+        if key.kty.upper() == u"EC":
+            crv = key.crv or key.curve.name()
+            curve = getattr(ec, _CURVE_NAMES[crv])()
+            numbers = ec.EllipticCurvePublicNumbers(long(key.x), long(key.y),
+                                                    curve)
+            return numbers.public_key(default_backend())
+    except (AttributeError, KeyError, TypeError, ValueError):
+        _logger.warn(u"could not load the key with kid %s", key.kid,
+                     exc_info=True)
+    return None
+
+
+def _cryptography_algs():
+    """Creates funcs that verify signatures for each supported algorithm."""
+    # pylint: disable=import-error
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec, padding, utils
+
+    def rsa_verifier(hash_class, pss=False):
+        if pss:
+            pad = padding.PSS(mgf=padding.MGF1(hash_class()),
+                              salt_length=hash_class.digest_size)
+        else:
+            pad = padding.PKCS1v15()
+
+        def verify(public_key, signature, sign_input):
+            try:
+                public_key.verify(signature, sign_input, pad, hash_class())
+                return True
+            except (InvalidSignature, ValueError):
+                return False
+        return verify
+
+    def ecdsa_verifier(hash_class):
+        def verify(public_key, signature, sign_input):
+            # JWS ECDSA signatures are R and S of the curve's size, in order
+            size = (public_key.curve.key_size + 7) // 8
+            if len(signature) != 2 * size:
+                return False
+            r = int(signature[:size].encode(u"hex"), 16)
+            s = int(signature[size:].encode(u"hex"), 16)
+            try:
+                public_key.verify(utils.encode_dss_signature(r, s), sign_input,
+                                  ec.ECDSA(hash_class()))
+                return True
+            except (InvalidSignature, ValueError):
+                return False
+        return verify
+
+    return {
+        u"RS256": rsa_verifier(hashes.SHA256),
+        u"RS384": rsa_verifier(hashes.SHA384),
+        u"RS512": rsa_verifier(hashes.SHA512),
+        u"PS256": rsa_verifier(hashes.SHA256, pss=True),
+        u"PS384": rsa_verifier(hashes.SHA384, pss=True),
+        u"PS512": rsa_verifier(hashes.SHA512, pss=True),
+        u"ES256": ecdsa_verifier(hashes.SHA256),
+        u"ES384": ecdsa_verifier(hashes.SHA384),
+        u"ES512": ecdsa_verifier(hashes.SHA512),
+    }
+
+
+_CURVE_NAMES = {
+    u"P-256": u"SECP256R1",
+    u"P-384": u"SECP384R1",
+    u"P-521": u"SECP521R1",
+}
@@ -13,15 +13,24 @@
 # limitations under the License.
 
 """Provides a method for fetching Service Configuration from Google Service
-Management API."""
+Management API.
+
+Fetched configs may be cached on disk, so that processes can start without
+contacting the Service Management API; see :func:`fetch_service_config`.
+"""
 
 from __future__ import absolute_import
 
+import errno
 import logging
 import json
 import os
+import tempfile
+import threading
+import urllib
 import urllib3
 
+from apitools.base.protorpclite import messages as protorpc_messages
 from apitools.base.py import encoding
 from ..gen import servicemanagement_v1_messages as messages
 from oauth2client import client
@@ -37,15 +46,28 @@ _SERVICE_MGMT_URL_TEMPLATE = (u"https://servicemanagement.googleapis.com"
 
 _SERVICE_NAME_ENV_KEY = u"ENDPOINTS_SERVICE_NAME"
 _SERVICE_VERSION_ENV_KEY = u"ENDPOINTS_SERVICE_VERSION"
+_CACHE_DIR_ENV_KEY = u"ENDPOINTS_SERVICE_CONFIG_CACHE_DIR"
+
+# The cache file name used for the latest version of a service, when no
+# version is specified
+_LATEST_CACHE_KEY = u"_latest"
 
 
 class ServiceConfigException(Exception):
     pass
 
 
-def fetch_service_config(service_name=None, service_version=None):
+def fetch_service_config(service_name=None, service_version=None,
+                         cache_dir=None):
     """Fetches the service config from Google Service Management API.
 
+    If a cache directory is given, the config is loaded from there when
+    possible, and fetched configs are saved to it.  A cached config for a
+    specified version never changes, so it is used as is.  A cached config for
+    the latest version is used immediately, and then revalidated in the
+    background by comparing its id with that of the latest version; if they
+    differ, the cache is updated for use by later calls.
+
     Args:
       service_name: the service name. When this argument is unspecified, this
         method uses the value of the "SERVICE_NAME" environment variable as the
@@ -54,6 +76,10 @@ def fetch_service_config(service_name=None, service_version=None):
         this method uses the value of the "SERVICE_VERSION" environment variable
         as the service version, and raises ValueError if the environment variable
         is unset.
+      cache_dir: the directory in which service configs are cached. When this
+        argument is unspecified, this method uses the value of the
+        "ENDPOINTS_SERVICE_CONFIG_CACHE_DIR" environment variable, and does
+        not cache service configs if that is unset.
 
     Returns: the fetched service config JSON object.
 
@@ -66,15 +92,158 @@ def fetch_service_config(service_name=None, service_version=None):
     if not service_name:
         service_name = _get_env_var_or_raise(_SERVICE_NAME_ENV_KEY)
     if not service_version:
+        service_version = os.environ.get(_SERVICE_VERSION_ENV_KEY)
+    if not cache_dir:
+        cache_dir = os.environ.get(_CACHE_DIR_ENV_KEY)
+
+    if cache_dir:
+        service = _load_cached_service_config(cache_dir, service_name,
+                                              service_version)
+        if service is not None:
+            if not service_version:
+                _start_revalidation(cache_dir, service_name, service.id)
+            return service
+
+    pinned = bool(service_version)
+    if not pinned:
         service_version = _get_service_version(_SERVICE_VERSION_ENV_KEY,
                                                service_name)
+    service_json = _fetch_service_config_json(service_name, service_version)
+    service = encoding.JsonToMessage(messages.Service, service_json)
+    _validate_service_config(service, service_name, service_version)
+    if cache_dir:
+        _save_cached_service_config(cache_dir, service_name, service_version,
+                                    service_json)
+        if not pinned:
+            _save_cached_service_config(cache_dir, service_name,
+                                        _LATEST_CACHE_KEY, service_json)
+    return service
+
+
+def fetch_service_config_id(service_name=None, service_version=None):
+    """Fetches the id of the service config that fetch_service_config obtains.
+
+    Only the list of service configs is requested, and not the config itself,
+    so this is a cheaper way to find out whether the config has changed.
+
+    Args:
+      service_name: the service name, as for :func:`fetch_service_config`
+      service_version: the service version, as for
+        :func:`fetch_service_config`. If it is set, it is returned without
+        contacting the API.
+
+    Returns: the id of the service config.
+
+    Raises:
+      ValueError: when the service name is neither provided as an argument nor
+        set as an environment variable.
+      ServiceConfigException: when the Google Service Management API returns
+        a non-200 response or no service configs.
+    """
+    if not service_name:
+        service_name = _get_env_var_or_raise(_SERVICE_NAME_ENV_KEY)
+    if service_version:
+        return service_version
+    return _get_service_version(_SERVICE_VERSION_ENV_KEY, service_name)
+
 
+def _fetch_service_config_json(service_name, service_version):
     _logger.debug(u'Contacting Service Management API for service %s version %s',
                   service_name, service_version)
     response = _make_service_config_request(service_name, service_version)
     _logger.debug(u'obtained service json from the management api:\n%s', response.data)
-    service = encoding.JsonToMessage(messages.Service, response.data)
-    _validate_service_config(service, service_name, service_version)
+    return response.data
+
+
+def _cache_path(cache_dir, service_name, service_version):
+    return os.path.join(cache_dir,
+                        urllib.quote(service_name, safe=u''),
+                        urllib.quote(service_version, safe=u'') + u'.json')
+
+
+def _load_cached_service_config(cache_dir, service_name, service_version):
+    path = _cache_path(cache_dir, service_name,
+                       service_version or _LATEST_CACHE_KEY)
+    try:
+        with open(path) as f:
+            service = encoding.JsonToMessage(messages.Service, f.read())
+        _validate_service_config(service, service_name,
+                                 service_version or service.id)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            _logger.warn(u'could not read cached service config %s: %s',
+                         path, e)
+        return None
+    except (AttributeError, TypeError, ValueError,
+            protorpc_messages.ValidationError) as e:
+        _logger.warn(u'ignored bad cached service config %s: %s', path, e)
+        return None
+
+    _logger.debug(u'loaded service config %s from %s', service.id, path)
+    return service
+
+
+def _save_cached_service_config(cache_dir, service_name, service_version,
+                                service_json):
+    path = _cache_path(cache_dir, service_name, service_version)
+    dirname = os.path.dirname(path)
+    temp_path = None
+    try:
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        # write to a temporary file first, so that readers never see a
+        # partially written config
+        with tempfile.NamedTemporaryFile(dir=dirname, delete=False) as f:
+            temp_path = f.name
+            f.write(service_json)
+        os.rename(temp_path, path)
+    except (IOError, OSError) as e:
+        _logger.warn(u'could not cache service config in %s: %s', path, e)
+        if temp_path is not None:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+def _start_revalidation(cache_dir, service_name, cached_version):
+    thread = threading.Thread(target=_revalidate_cached_service_config,
+                              args=(cache_dir, service_name, cached_version))
+    thread.daemon = True
+    try:
+        thread.start()
+    except Exception:  # pylint: disable=broad-except
+        _logger.exception(u'Failed to start service config revalidation.')
+
+
+def _revalidate_cached_service_config(cache_dir, service_name,
+                                      cached_version):
+    """Updates the cached latest config if a newer version is available.
+
+    Returns:
+      the newer config, or None if there is none or it could not be fetched
+    """
+    try:
+        latest_version = _get_latest_service_version(service_name)
+        if latest_version == cached_version:
+            _logger.debug(u'cached service config %s is the latest',
+                          cached_version)
+            return None
+        service_json = _fetch_service_config_json(service_name, latest_version)
+        service = encoding.JsonToMessage(messages.Service, service_json)
+        _validate_service_config(service, service_name, latest_version)
+    except Exception:  # pylint: disable=broad-except
+        # this runs in the background, and the cached config remains usable
+        _logger.exception(u'Failed to revalidate cached service config %s',
+                          cached_version)
+        return None
+
+    _logger.info(u'service config %s replaces cached config %s',
+                 latest_version, cached_version)
+    _save_cached_service_config(cache_dir, service_name, latest_version,
+                                service_json)
+    _save_cached_service_config(cache_dir, service_name, _LATEST_CACHE_KEY,
+                                service_json)
     return service
 
 
@@ -131,6 +300,10 @@ def _get_service_version(env_variable_name, service_name):
     if service_version:
         return service_version
 
+    return _get_latest_service_version(service_name)
+
+
+def _get_latest_service_version(service_name):
     _logger.debug(u'Contacting Service Management API for service %s', service_name)
     response = _make_service_config_request(service_name)
     _logger.debug(u'obtained service config list from api: \n%s', response.data)
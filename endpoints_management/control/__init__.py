@@ -16,11 +16,25 @@
 
 from __future__ import absolute_import
 
-from ..gen import servicecontrol_v1_messages as sc_messages
-from ..gen import servicemanagement_v1_messages as sm_messages
-from ..gen import servicecontrol_v1_client as api_client
+from .. import _lazy
 
-# Alias the generated MetricKind and ValueType enums to simplify their usage
+
+def _metric_kind():
+    return _control.sm_messages.MetricDescriptor.MetricKindValueValuesEnum
+
+
+def _value_type():
+    return _control.sm_messages.MetricDescriptor.ValueTypeValueValuesEnum
+
+
+# The generated modules are imported when they are first used.
+#
+# MetricKind and ValueType alias the generated enums to simplify their usage
 # elsewhere
-MetricKind = sm_messages.MetricDescriptor.MetricKindValueValuesEnum
-ValueType = sm_messages.MetricDescriptor.ValueTypeValueValuesEnum
+_control = _lazy.make_lazy(
+    __name__,
+    sc_messages=_lazy.importer(u'endpoints_management.gen.servicecontrol_v1_messages'),
+    sm_messages=_lazy.importer(u'endpoints_management.gen.servicemanagement_v1_messages'),
+    api_client=_lazy.importer(u'endpoints_management.gen.servicecontrol_v1_client'),
+    MetricKind=_metric_kind,
+    ValueType=_value_type)
@@ -14,7 +14,8 @@
 
 """check_request supports aggregation of CheckRequests.
 
-:func:`sign` generated a signature from CheckRequests
+:func:`sign` generated a signature from CheckRequests, and
+:func:`Info.signature` generates the same signature without building them
 :class:`~endpoints_management.gen.servicecontrol_v1_message.Operation` represents
 information regarding an operation, and is a key constituent of
 :class:`~endpoints_management.gen.servicecontrol_v1_message.CheckRequest` and
@@ -168,12 +169,10 @@ def sign(check_request):
     if op is None or op.operationName is None or op.consumerId is None:
         logging.error(u'Bad %s: not initialized => not signed', check_request)
         raise ValueError(u'check request must be initialized with an operation')
-    md5 = hashlib.md5()
-    md5.update(op.operationName.encode('utf-8'))
-    md5.update(b'\x00')
-    md5.update(op.consumerId.encode('utf-8'))
+    md5 = hashlib.md5(op.operationName.encode('utf-8') + b'\x00' +
+                      op.consumerId.encode('utf-8'))
     if op.labels:
-        signing.add_dict_to_hash(md5, encoding.MessageToPyValue(op.labels))
+        signing.add_properties_to_hash(md5, op.labels)
     for value_set in op.metricValueSets:
         md5.update(b'\x00')
         md5.update(value_set.metricName.encode('utf-8'))
@@ -221,13 +220,49 @@ class Info(collections.namedtuple(u'Info',
             to create a valid ``ServicecontrolServicesCheckRequest``
 
         """
+        self._validate()
+        op = super(Info, self).as_operation(timer=timer)
+        op.labels = encoding.PyValueToMessage(
+            sc_messages.Operation.LabelsValue, self._labels())
+        check_request = sc_messages.CheckRequest(operation=op)
+        return sc_messages.ServicecontrolServicesCheckRequest(
+            serviceName=self.service_name,
+            checkRequest=check_request)
+
+    def signature(self):
+        """Obtains the signature of the `CheckRequest` made from this instance.
+
+        This is the same as calling :func:`sign` on the ``checkRequest`` of
+        the result of :func:`as_check_request`, but no messages are built.
+
+        Returns:
+          string: a secure hash generated from this instance
+
+        Raises:
+          ValueError: if the fields in this instance are insufficient to
+            to create a valid ``ServicecontrolServicesCheckRequest``, or to
+            sign it
+        """
+        self._validate()
+        consumer_id = self.consumer_id
+        if not consumer_id:
+            logging.error(u'Bad %s: no consumer => not signed', self)
+            raise ValueError(u'check request must be initialized with an operation')
+        return hashlib.md5(
+            self.operation_name.encode('utf-8') + b'\x00' +
+            consumer_id.encode('utf-8') +
+            signing.sorted_dict_signature_bytes(self._labels()) +
+            b'\x00\x00').digest()
+
+    def _validate(self):
         if not self.service_name:
             raise ValueError(u'the service name must be set')
         if not self.operation_id:
             raise ValueError(u'the operation id must be set')
         if not self.operation_name:
             raise ValueError(u'the operation name must be set')
-        op = super(Info, self).as_operation(timer=timer)
+
+    def _labels(self):
         labels = {}
         if self.android_cert_fingerprint:
             labels[_KNOWN_LABELS.SCC_ANDROID_CERT_FINGERPRINT.label_name] = self.android_cert_fingerprint
@@ -248,13 +283,7 @@ class Info(collections.namedtuple(u'Info',
         # config does not specify it as a label.
         labels[_KNOWN_LABELS.SCC_SERVICE_AGENT.label_name] = SERVICE_AGENT
         labels[_KNOWN_LABELS.SCC_USER_AGENT.label_name] = USER_AGENT
-
-        op.labels = encoding.PyValueToMessage(
-            sc_messages.Operation.LabelsValue, labels)
-        check_request = sc_messages.CheckRequest(operation=op)
-        return sc_messages.ServicecontrolServicesCheckRequest(
-            serviceName=self.service_name,
-            checkRequest=check_request)
+        return labels
 
 
 class Aggregator(object):
@@ -466,6 +495,45 @@ class Aggregator(object):
             else:
                 return self._handle_cached_response(req, item)
 
+    def check_info(self, info):
+        """Determine if the request made from ``info`` is in this instance's cache.
+
+        This behaves like :func:`check` on the result of
+        ``info.as_check_request()``, but the cache is searched using
+        :func:`Info.signature`, so no request is built unless there is a cache
+        hit that needs to be aggregated.
+
+        Args:
+          info (:class:`Info`): describes the check request
+
+        Raises:
+           ValueError: if the ``info`` service_name is not the same as
+             this instances
+
+        Returns:
+           ``CheckResponse``: if an applicable response is cached by this
+             instance is available for use or None, if there is no applicable
+             response
+
+        """
+        if self._cache is None:
+            return None  # no cache, send request now
+        if not isinstance(info, Info):
+            raise ValueError(u'Invalid info')
+        if info.service_name != self.service_name:
+            _logger.error(u'bad check_info(): service_name %s does not match ours %s',
+                          info.service_name, self.service_name)
+            raise ValueError(u'Service name mismatch')
+
+        signature = info.signature()
+        with self._cache as cache:
+            _logger.debug(u'checking the cache for %r\n%s', signature, cache)
+            item = cache.get(signature)
+            if item is None:
+                return None  # signal to caller to send req
+            else:
+                return self._handle_cached_response(info, item)
+
     def _handle_cached_response(self, req, item):
         with self._cache:  # defensive, this re-entrant lock should be held
             if len(item.response.checkErrors) > 0:
@@ -476,7 +544,7 @@ class Aggregator(object):
                 item.last_check_time = self._timer()
                 return None  # signal caller to send req
             else:
-                item.update_request(req, self._kinds)
+                item.update_request(req, self._kinds, self._timer)
                 if self._is_current(item):
                     return item.response
 
@@ -515,8 +583,27 @@ class CachedItem(object):
         self._service_name = service_name
         self._op_aggregator = None
 
-    def update_request(self, req, kinds):
+    def update_request(self, req, kinds, timer=datetime.utcnow):
+        """Aggregates the operation of ``req`` with those already pending.
+
+        Args:
+          req (``ServicecontrolServicesCheckRequest``|:class:`Info`): the
+            request, or the info it would be made from.  The operation of a
+            cached info has the same signature as the pending operation, so
+            only its time is aggregated, and its operation is only built if
+            none is pending.
+          kinds (dict[string,[endpoints_management.control.MetricKind]]):
+            specifies the kind of metric for each each metric name.
+          timer (function([[datetime]]): a function that returns the current
+            as a time as a datetime instance
+        """
         agg = self._op_aggregator
+        if isinstance(req, Info):
+            if agg is None:
+                req = req.as_check_request(timer=timer)
+            else:
+                agg.add_time(timer())
+                return
         if agg is None:
             self._op_aggregator = operation.Aggregator(
                 req.checkRequest.operation, kinds)
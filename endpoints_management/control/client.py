@@ -301,7 +301,34 @@ class Client(object):
             _logger.debug(u'using cached check response for %s: %s',
                           check_request, res)
             return res
+        return self._send_check(check_req)
 
+    def check_info(self, check_info):
+        """Process the check request described by `check_info`.
+
+        This is equivalent to calling :func:`check` with
+        ``check_info.as_check_request()``, but the request is only built if
+        there is no valid cached response.
+
+        Args:
+          check_info (:class:`endpoints_management.control.check_request.Info`):
+            describes the check request
+
+        Returns:
+           ``CheckResponse``: either the cached response if one is applicable
+            or a response from making a transport request, or None if
+            if the request to the transport fails
+
+        """
+        self.start()
+        res = self._check_aggregator.check_info(check_info)
+        if res:
+            _logger.debug(u'using cached check response for %s: %s',
+                          check_info, res)
+            return res
+        return self._send_check(check_info.as_check_request())
+
+    def _send_check(self, check_req):
         # Application code should not fail because check request's don't
         # complete, They should fail open, so here simply log the error and
         # return None to indicate that no response was obtained
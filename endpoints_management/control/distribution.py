@@ -20,15 +20,26 @@ of buckets a `Distribution` can have. They are factory functions that
 include assertions that make sure that the Distribution instances are
 in the correct state.
 
-:func:`add_sample` adds a sample to an existing distribution instance
+:func:`add_sample` adds a sample to an existing distribution instance, and
+:func:`add_samples` adds many samples at once
 
-:func:`merge` merges two distribution instances
+:func:`merge` merges two distribution instances, and :func:`merge_many`
+merges any number of them into a new instance
+
+:func:`add_samples` and :func:`merge_many` use numpy when it is installed, and
+fall back to pure python otherwise.  numpy is only imported when they are first
+called, as importing it is slow.
+
+:class:`Histogram` is a compact accumulator with the same statistics and
+buckets as a `Distribution`, that's cheaper to update and hold in memory; it is
+converted to a `Distribution` when needed.
 
 """
 
 from __future__ import absolute_import
 from __future__ import division
 
+import array
 import bisect
 import logging
 import math
@@ -37,6 +48,20 @@ from . import sc_messages
 
 _logger = logging.getLogger(__name__)
 
+_NOT_LOADED = object()
+numpy = _NOT_LOADED
+
+
+def _has_numpy():
+    global numpy  # pylint: disable=global-statement,invalid-name
+    if numpy is _NOT_LOADED:
+        try:
+            import numpy as loaded  # pylint: disable=redefined-outer-name
+        except ImportError:
+            loaded = None
+        numpy = loaded
+    return numpy is not None
+
 
 _BAD_NUM_FINITE_BUCKETS = u'number of finite buckets should be > 0'
 _BAD_FLOAT_ARG = u'%s should be > %f'
@@ -194,6 +219,153 @@ def merge(prior, latest):
         bucket_counts[i] = x + y
 
 
+def add_samples(values, dist):
+    """Adds each of `values` to `dist`, updating its existing buckets.
+
+    The result is the same as calling :func:`add_sample` with each value, but
+    the bucket options of `dist` are only inspected once, and the statistics
+    and bucket counts of the values are computed in bulk.
+
+    Args:
+      values (iterable[float]): the new values
+      dist (:class:`endpoints_management.gen.servicecontrol_v1_messages.Distribution`):
+        the Distribution being updated
+
+    Raises:
+      ValueError: if `dist` does not have known bucket options defined
+      ValueError: if there are not enough bucket count fields in `dist`
+    """
+    option_key = _bucket_option_key(dist)
+    histogram = Histogram(option_key)
+    if len(dist.bucketCounts) < len(histogram.bucket_counts):
+        raise ValueError(_BAD_LOW_BUCKET_COUNT)
+    if _has_numpy():
+        _numpy_add_samples(values, histogram)
+    else:
+        for value in values:
+            histogram.add_sample(value)
+    if not histogram.count:
+        return
+
+    old_count = dist.count or 0
+    if not old_count:
+        dist.count = histogram.count
+        dist.mean = histogram.mean
+        dist.maximum = histogram.maximum
+        dist.minimum = histogram.minimum
+        dist.sumOfSquaredDeviation = histogram.sum_of_squared_deviation
+    else:
+        old_mean = dist.mean
+        dist.count += histogram.count
+        dist.maximum = max(histogram.maximum, dist.maximum)
+        dist.minimum = min(histogram.minimum, dist.minimum)
+        dist.mean = ((old_count * old_mean +
+                      histogram.count * histogram.mean) / dist.count)
+        dist.sumOfSquaredDeviation = (
+            dist.sumOfSquaredDeviation + histogram.sum_of_squared_deviation +
+            old_count * (dist.mean - old_mean) ** 2 +
+            histogram.count * (dist.mean - histogram.mean) ** 2)
+    bucket_counts = dist.bucketCounts
+    for i, x in enumerate(histogram.bucket_counts):
+        if x:
+            bucket_counts[i] += x
+
+
+def merge_many(dists):
+    """Merges all of `dists` into a new `Distribution`.
+
+    The result is the same as repeatedly calling :func:`merge` on a copy of
+    the first instance, but the statistics and bucket counts are combined in a
+    single pass.  None of `dists` is modified.
+
+    Args:
+      dists (iterable[:class:`endpoints_management.gen.servicecontrol_v1_messages.Distribution`]):
+        the instances to merge
+
+    Returns:
+      :class:`endpoints_management.gen.servicecontrol_v1_messages.Distribution`
+
+    Raises:
+      ValueError: if `dists` is empty
+      ValueError: if the bucket options of `dists` do not match
+      ValueError: if the bucket counts of `dists` do not match
+    """
+    dists = list(dists)
+    if not dists:
+        raise ValueError(u'there are no distributions to merge')
+    histogram = Histogram(_bucket_option_key(dists[0]))
+    for d in dists:
+        if not _bucket_option_keys_nearly_equal(histogram.bucket_option,
+                                                _bucket_option_key(d)):
+            _logger.error(u'Bucket options do not match. From %s To: %s',
+                          d, dists[0])
+            raise ValueError(u'Bucket options do not match')
+        if len(d.bucketCounts) != len(histogram.bucket_counts):
+            _logger.error(u'Bucket count sizes do not match. From %s To: %s',
+                          d, dists[0])
+            raise ValueError(u'Bucket count sizes do not match')
+
+    populated = [d for d in dists if d.count > 0]
+    if populated and _has_numpy():
+        _numpy_merge_many(populated, histogram)
+    else:
+        for d in populated:
+            histogram.add_distribution(d)
+    return histogram.as_distribution()
+
+
+def _numpy_add_samples(values, histogram):
+    samples = numpy.fromiter(values, dtype=numpy.float64)
+    if not samples.size:
+        return
+    dist_type, params = histogram.bucket_option
+    if dist_type == u'exponentialBuckets':
+        num_finite_buckets, growth_factor, scale = params
+        indices = numpy.zeros(samples.size, dtype=numpy.int64)
+        above = samples > scale
+        indices[above] = numpy.minimum(
+            1 + (numpy.log(samples[above] / scale) /
+                 math.log(growth_factor)).astype(numpy.int64),
+            num_finite_buckets + 1)
+    elif dist_type == u'linearBuckets':
+        num_finite_buckets, width, offset = params
+        upper = offset + (num_finite_buckets * width)
+        indices = numpy.where(
+            samples >= upper,
+            num_finite_buckets + 1,
+            numpy.clip(1 + numpy.floor((samples - offset) / width),
+                       0, num_finite_buckets).astype(numpy.int64))
+        indices[samples < offset] = 0
+    else:
+        indices = numpy.searchsorted(params[0], samples, side=u'right')
+    counts = numpy.bincount(indices, minlength=len(histogram.bucket_counts))
+    mean = samples.sum() / samples.size
+    histogram.count = int(samples.size)
+    histogram.mean = float(mean)
+    histogram.minimum = float(samples.min())
+    histogram.maximum = float(samples.max())
+    histogram.sum_of_squared_deviation = float(((samples - mean) ** 2).sum())
+    histogram.bucket_counts = array.array('l', (int(x) for x in counts))
+
+
+def _numpy_merge_many(dists, histogram):
+    counts = numpy.array([d.count for d in dists], dtype=numpy.float64)
+    means = numpy.array([d.mean for d in dists], dtype=numpy.float64)
+    sums_of_squared_deviation = numpy.array(
+        [d.sumOfSquaredDeviation or 0 for d in dists], dtype=numpy.float64)
+    total = counts.sum()
+    mean = (counts * means).sum() / total
+    bucket_counts = numpy.array([d.bucketCounts for d in dists],
+                                dtype=numpy.int64).sum(axis=0)
+    histogram.count = int(total)
+    histogram.mean = float(mean)
+    histogram.minimum = min(d.minimum for d in dists)
+    histogram.maximum = max(d.maximum for d in dists)
+    histogram.sum_of_squared_deviation = float(
+        (sums_of_squared_deviation + counts * (means - mean) ** 2).sum())
+    histogram.bucket_counts = array.array('l', (int(x) for x in bucket_counts))
+
+
 _EPSILON = 1e-5
 
 
@@ -317,16 +489,19 @@ def _update_exponential_bucket_count(a_float, dist):
         raise ValueError(_BAD_LOW_BUCKET_COUNT)
     scale = buckets.scale
     factor = buckets.growthFactor
-    if (a_float <= scale):
-        index = 0
-    else:
-        index = 1 + int((math.log(a_float / scale) / math.log(factor)))
-        index = min(index, num_finite_buckets + 1)
+    index = _exponential_index(a_float, num_finite_buckets, factor, scale)
     bucket_counts[index] += 1
     _logger.debug(u'scale:%f, factor:%f, sample:%f, index:%d',
                   scale, factor, a_float, index)
 
 
+def _exponential_index(a_float, num_finite_buckets, growth_factor, scale):
+    if a_float <= scale:
+        return 0
+    index = 1 + int((math.log(a_float / scale) / math.log(growth_factor)))
+    return min(index, num_finite_buckets + 1)
+
+
 def _update_linear_bucket_count(a_float, dist):
     """Adds `a_float` to `dist`, updating the its linear buckets.
 
@@ -348,16 +523,20 @@ def _update_linear_bucket_count(a_float, dist):
         raise ValueError(_BAD_LOW_BUCKET_COUNT)
     width = buckets.width
     lower = buckets.offset
-    upper = lower + (num_finite_buckets * width)
-    if a_float < lower:
-        index = 0
+    index = _linear_index(a_float, num_finite_buckets, width, lower)
+    bucket_counts[index] += 1
+    _logger.debug(u'lower:%f, width:%f, sample:%f, index:%d',
+                  lower, width, a_float, index)
+
+
+def _linear_index(a_float, num_finite_buckets, width, offset):
+    upper = offset + (num_finite_buckets * width)
+    if a_float < offset:
+        return 0
     elif a_float >= upper:
-        index = num_finite_buckets + 1
+        return num_finite_buckets + 1
     else:
-        index = 1 + int(((a_float - lower) / width))
-    bucket_counts[index] += 1
-    _logger.debug(u'upper:%f, lower:%f, width:%f, sample:%f, index:%d',
-                  upper, lower, width, a_float, index)
+        return 1 + int(((a_float - offset) / width))
 
 
 def _update_explicit_bucket_count(a_float, dist):
@@ -380,3 +559,272 @@ def _update_explicit_bucket_count(a_float, dist):
     if len(bucket_counts) < len(bounds) + 1:
         raise ValueError(_BAD_LOW_BUCKET_COUNT)
     bucket_counts[bisect.bisect(bounds, a_float)] += 1
+
+
+def _bucket_option_key(dist):
+    """Obtains a tuple that describes the bucket option of ``dist``."""
+    dist_type, buckets = _detect_bucket_option(dist)
+    if dist_type == u'exponentialBuckets':
+        return dist_type, (buckets.numFiniteBuckets,
+                           buckets.growthFactor,
+                           buckets.scale)
+    elif dist_type == u'linearBuckets':
+        return dist_type, (buckets.numFiniteBuckets,
+                           buckets.width,
+                           buckets.offset)
+    elif dist_type == u'explicitBuckets':
+        return dist_type, (tuple(buckets.bounds),)
+    _logger.error(u'Could not determine bucket option type for %s', dist)
+    raise ValueError(u'Unknown bucket option type')
+
+
+def _bucket_option_keys_nearly_equal(a, b):
+    a_type, a_params = a
+    b_type, b_params = b
+    if a_type != b_type:
+        return False
+    if a_type == u'explicitBuckets':
+        a_bounds, b_bounds = a_params[0], b_params[0]
+        return (len(a_bounds) == len(b_bounds) and
+                all(_is_close_enough(x, y) for x, y in zip(a_bounds, b_bounds)))
+    return (a_params[0] == b_params[0] and
+            _is_close_enough(a_params[1], b_params[1]) and
+            _is_close_enough(a_params[2], b_params[2]))
+
+
+class Histogram(object):
+    """A compact accumulator of samples that is bucketed like a `Distribution`.
+
+    It holds the statistics and bucket counts of a `Distribution` in plain
+    attributes and an :class:`array.array`, so it's much cheaper to update and
+    to keep in memory than the equivalent message.  :func:`as_distribution`
+    converts it to a `Distribution` when one is needed.
+
+    Thread compatible.
+    """
+    # pylint: disable=too-few-public-methods
+    __slots__ = (u'bucket_option', u'bucket_counts', u'count', u'mean',
+                 u'minimum', u'maximum', u'sum_of_squared_deviation')
+
+    def __init__(self, bucket_option):
+        """Constructor.
+
+        Args:
+          bucket_option (tuple): the name of the bucket option field of a
+            `Distribution`, and a tuple of the values of its fields
+        """
+        dist_type, params = bucket_option
+        if dist_type == u'explicitBuckets':
+            num_buckets = len(params[0]) + 1
+        else:
+            num_buckets = params[0] + 2
+        self.bucket_option = bucket_option
+        self.bucket_counts = array.array('l', [0] * num_buckets)
+        self.count = 0
+        self.mean = 0.0
+        self.minimum = 0.0
+        self.maximum = 0.0
+        self.sum_of_squared_deviation = 0.0
+
+    @classmethod
+    def from_distribution(cls, dist):
+        """Creates an instance holding the same values as ``dist``.
+
+        Args:
+          dist (:class:`endpoints_management.gen.servicecontrol_v1_messages.Distribution`):
+            the distribution to copy
+
+        Raises:
+          ValueError: if `dist` does not have known bucket options defined
+        """
+        histogram = cls(_bucket_option_key(dist))
+        histogram.add_distribution(dist)
+        return histogram
+
+    def add_sample(self, a_float):
+        """Adds `a_float` to this instance, updating its buckets.
+
+        Args:
+          a_float (float): a new value
+        """
+        if not self.count:
+            self.count = 1
+            self.mean = self.minimum = self.maximum = a_float
+            self.sum_of_squared_deviation = 0.0
+        else:
+            old_count = self.count
+            old_mean = self.mean
+            new_mean = ((old_count * old_mean) + a_float) / (old_count + 1)
+            self.count += 1
+            self.mean = new_mean
+            self.sum_of_squared_deviation += (
+                (a_float - old_mean) * (a_float - new_mean))
+            if a_float > self.maximum:
+                self.maximum = a_float
+            if a_float < self.minimum:
+                self.minimum = a_float
+        self.bucket_counts[self._index(a_float)] += 1
+
+    def add_distribution(self, dist):
+        """Merges ``dist`` into this instance.
+
+        Args:
+          dist (:class:`endpoints_management.gen.servicecontrol_v1_messages.Distribution`):
+            the distribution to merge
+
+        Raises:
+          ValueError: if the bucket options of `dist` do not match
+          ValueError: if the bucket counts of `dist` do not match
+        """
+        if not _bucket_option_keys_nearly_equal(self.bucket_option,
+                                                _bucket_option_key(dist)):
+            _logger.error(u'Bucket options do not match. From %s To: %s',
+                          dist, self.bucket_option)
+            raise ValueError(u'Bucket options do not match')
+        if len(dist.bucketCounts) != len(self.bucket_counts):
+            _logger.error(u'Bucket count sizes do not match. From %s To: %s',
+                          dist, self.bucket_option)
+            raise ValueError(u'Bucket count sizes do not match')
+        if not dist.count or dist.count <= 0:
+            return
+        self._merge_statistics(dist.count, dist.mean, dist.minimum,
+                               dist.maximum, dist.sumOfSquaredDeviation or 0)
+        bucket_counts = self.bucket_counts
+        for i, x in enumerate(dist.bucketCounts):
+            bucket_counts[i] += x
+
+    def add_histogram(self, other):
+        """Merges ``other`` into this instance.
+
+        Args:
+          other (:class:`Histogram`): the histogram to merge
+
+        Raises:
+          ValueError: if the bucket options of `other` do not match
+        """
+        if (len(other.bucket_counts) != len(self.bucket_counts) or
+                not _bucket_option_keys_nearly_equal(self.bucket_option,
+                                                     other.bucket_option)):
+            _logger.error(u'Bucket options do not match. From %s To: %s',
+                          other.bucket_option, self.bucket_option)
+            raise ValueError(u'Bucket options do not match')
+        if not other.count:
+            return
+        self._merge_statistics(other.count, other.mean, other.minimum,
+                               other.maximum, other.sum_of_squared_deviation)
+        bucket_counts = self.bucket_counts
+        for i, x in enumerate(other.bucket_counts):
+            bucket_counts[i] += x
+
+    def as_distribution(self):
+        """Obtains a `Distribution` holding the values of this instance.
+
+        Returns:
+          :class:`endpoints_management.gen.servicecontrol_v1_messages.Distribution`
+        """
+        dist_type, params = self.bucket_option
+        if dist_type == u'exponentialBuckets':
+            buckets = sc_messages.ExponentialBuckets(
+                numFiniteBuckets=params[0],
+                growthFactor=params[1],
+                scale=params[2])
+        elif dist_type == u'linearBuckets':
+            buckets = sc_messages.LinearBuckets(
+                numFiniteBuckets=params[0],
+                width=params[1],
+                offset=params[2])
+        else:
+            buckets = sc_messages.ExplicitBuckets(bounds=list(params[0]))
+        dist = sc_messages.Distribution(bucketCounts=list(self.bucket_counts))
+        setattr(dist, dist_type, buckets)
+        if self.count:
+            dist.count = self.count
+            dist.mean = self.mean
+            dist.minimum = self.minimum
+            dist.maximum = self.maximum
+            dist.sumOfSquaredDeviation = self.sum_of_squared_deviation
+        return dist
+
+    def percentile(self, fraction):
+        """Estimates the value below which `fraction` of the samples fall.
+
+        The bucket holding the requested rank is found from the bucket counts,
+        and the estimate is interpolated linearly between the bounds of that
+        bucket, after clamping them to the minimum and maximum samples.
+
+        Args:
+          fraction (float): the fraction of samples, between 0 and 1, e.g,
+            0.95 for the 95th percentile
+
+        Returns:
+          float: the estimate, or None if no samples have been added
+
+        Raises:
+          ValueError: if `fraction` is not between 0 and 1
+        """
+        if not 0 <= fraction <= 1:
+            raise ValueError(u'percentile fraction must be between 0 and 1')
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        cumulative = 0
+        for i, x in enumerate(self.bucket_counts):
+            if not x:
+                continue
+            if cumulative + x >= rank:
+                lower, upper = self._bounds(i)
+                lower = max(lower, self.minimum)
+                upper = min(upper, self.maximum)
+                if upper <= lower:
+                    return lower
+                return lower + (upper - lower) * (rank - cumulative) / x
+            cumulative += x
+        return self.maximum
+
+    def _merge_statistics(self, count, mean, minimum, maximum,
+                          sum_of_squared_deviation):
+        # pylint: disable=too-many-arguments
+        if not self.count:
+            self.count = count
+            self.mean = mean
+            self.minimum = minimum
+            self.maximum = maximum
+            self.sum_of_squared_deviation = sum_of_squared_deviation
+            return
+        old_count = self.count
+        old_mean = self.mean
+        self.count += count
+        self.mean = (old_count * old_mean + count * mean) / self.count
+        self.sum_of_squared_deviation += (
+            sum_of_squared_deviation +
+            old_count * (self.mean - old_mean) ** 2 +
+            count * (self.mean - mean) ** 2)
+        self.maximum = max(self.maximum, maximum)
+        self.minimum = min(self.minimum, minimum)
+
+    def _index(self, a_float):
+        dist_type, params = self.bucket_option
+        if dist_type == u'exponentialBuckets':
+            return _exponential_index(a_float, *params)
+        elif dist_type == u'linearBuckets':
+            return _linear_index(a_float, *params)
+        return bisect.bisect(params[0], a_float)
+
+    def _bounds(self, index):
+        dist_type, params = self.bucket_option
+        if dist_type == u'exponentialBuckets':
+            num_finite_buckets, growth_factor, scale = params
+            bounds = [scale * growth_factor ** i
+                      for i in (index - 1, index)]
+        elif dist_type == u'linearBuckets':
+            num_finite_buckets, width, offset = params
+            bounds = [offset + width * i for i in (index - 1, index)]
+        else:
+            num_finite_buckets = len(params[0]) - 1
+            bounds = [params[0][i] if 0 <= i < len(params[0]) else None
+                      for i in (index - 1, index)]
+        if index == 0:
+            bounds[0] = float(u'-inf')
+        if index > num_finite_buckets:
+            bounds[1] = float(u'inf')
+        return bounds
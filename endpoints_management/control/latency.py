@@ -0,0 +1,196 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""latency provides local estimates of the latency of controlled requests.
+
+:class:`LatencyTracker` accumulates the request, backend and overhead times of
+reported requests in histograms with the same bucket layout as the latency
+distributions sent to service control, and answers percentile queries over a
+sliding window per method and per consumer.
+
+Example:
+
+  >>> from endpoints_management.control import latency, wsgi
+  >>> tracker = latency.LatencyTracker()
+  >>> wrapped_app = wsgi.Middleware(app, project_id, control_client,
+  ...                               latency_tracker=tracker)
+  >>>
+  >>> # later, e.g, from an autoscaling or alerting hook
+  >>> tracker.percentiles(method=u'my.api.Method')
+  {0.5: 0.0123, 0.95: 0.0871, 0.99: 0.1544}
+
+"""
+
+from __future__ import absolute_import
+
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from enum import Enum
+
+from . import distribution, metric_descriptor
+
+_logger = logging.getLogger(__name__)
+
+
+class LatencyKind(Enum):
+    """Enumerates the latencies of a request that are tracked."""
+    REQUEST = u'request_time'
+    BACKEND = u'backend_time'
+    OVERHEAD = u'overhead_time'
+
+
+DEFAULT_WINDOW = timedelta(minutes=1)
+DEFAULT_NUM_SLOTS = 6
+DEFAULT_FRACTIONS = (0.5, 0.95, 0.99)
+
+_EPOCH = datetime(1970, 1, 1)
+_TIME_BUCKET_OPTION = (
+    u'exponentialBuckets', metric_descriptor.TIME_DISTRIBUTION_ARGS)
+
+
+class LatencyTracker(object):
+    """Tracks request latencies over a sliding window.
+
+    The window is divided into `num_slots` slots of equal width. Each slot
+    holds a :class:`endpoints_management.control.distribution.Histogram` per
+    latency kind, method and consumer, and is discarded once it falls out of
+    the window, so queries reflect between `window` and `window` plus one slot
+    of recent traffic.
+
+    Thread safe.
+    """
+
+    def __init__(self,
+                 window=DEFAULT_WINDOW,
+                 num_slots=DEFAULT_NUM_SLOTS,
+                 timer=datetime.utcnow):
+        """Constructor.
+
+        Args:
+          window (:class:`datetime.timedelta`): the period over which
+            latencies are tracked
+          num_slots (int): the number of slots the window is divided into
+          timer (func[[datetime.datetime]]): a func that obtains the current
+            time
+
+        Raises:
+          ValueError: if `window` or `num_slots` is not positive
+        """
+        if window <= timedelta(0):
+            _logger.error(u'bad latency window %s', window)
+            raise ValueError(u'window must be positive')
+        if num_slots <= 0:
+            _logger.error(u'bad number of latency slots %d', num_slots)
+            raise ValueError(u'num_slots must be positive')
+        self._slot_width = window.total_seconds() / num_slots
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._slots = [(None, {}) for _ in range(num_slots + 1)]
+
+    def record(self, info):
+        """Records the latencies of a reported request.
+
+        Args:
+          info (:class:`endpoints_management.control.report_request.Info`):
+            the info used to report the request
+        """
+        method = info.operation_name
+        consumer = info.consumer_id
+        for kind in LatencyKind:
+            latency = getattr(info, kind.value)
+            if latency:
+                self.add_sample(kind, latency.total_seconds(),
+                                method=method, consumer=consumer)
+
+    def add_sample(self, kind, seconds, method=u'', consumer=u''):
+        """Adds a single latency sample.
+
+        Args:
+          kind (:class:`LatencyKind`): the kind of latency
+          seconds (float): the latency in seconds
+          method (string): the fully-qualified name of the called method
+          consumer (string): the consumer id of the caller
+        """
+        key = (kind, method, consumer)
+        with self._lock:
+            histograms = self._current_slot()
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = distribution.Histogram(_TIME_BUCKET_OPTION)
+                histograms[key] = histogram
+            histogram.add_sample(seconds)
+
+    def histogram(self, kind=LatencyKind.REQUEST, method=None, consumer=None):
+        """Obtains the latencies tracked in the current window.
+
+        Args:
+          kind (:class:`LatencyKind`): the kind of latency
+          method (string): only include calls to this method; None for all
+          consumer (string): only include calls by this consumer; None for all
+
+        Returns:
+          :class:`endpoints_management.control.distribution.Histogram`: a new
+            instance that merges all the matching latencies
+        """
+        merged = distribution.Histogram(_TIME_BUCKET_OPTION)
+        with self._lock:
+            oldest = self._slot_number() - len(self._slots) + 1
+            for number, histograms in self._slots:
+                if number is None or number < oldest:
+                    continue
+                for (a_kind, a_method, a_consumer), h in histograms.items():
+                    if a_kind != kind:
+                        continue
+                    if method is not None and a_method != method:
+                        continue
+                    if consumer is not None and a_consumer != consumer:
+                        continue
+                    merged.add_histogram(h)
+        return merged
+
+    def percentiles(self, kind=LatencyKind.REQUEST, method=None,
+                    consumer=None, fractions=DEFAULT_FRACTIONS):
+        """Estimates percentiles of the latencies in the current window.
+
+        Args:
+          kind (:class:`LatencyKind`): the kind of latency
+          method (string): only include calls to this method; None for all
+          consumer (string): only include calls by this consumer; None for all
+          fractions (iterable[float]): the percentiles to estimate, as
+            fractions between 0 and 1
+
+        Returns:
+          dict: maps each of `fractions` to its estimate in seconds, or to
+            None if there were no matching calls
+
+        Raises:
+          ValueError: if any of `fractions` is not between 0 and 1
+        """
+        merged = self.histogram(kind=kind, method=method, consumer=consumer)
+        return dict((f, merged.percentile(f)) for f in fractions)
+
+    def _slot_number(self):
+        now = self._timer()
+        return int((now - _EPOCH).total_seconds() // self._slot_width)
+
+    def _current_slot(self):
+        number = self._slot_number()
+        index = number % len(self._slots)
+        slot_number, histograms = self._slots[index]
+        if slot_number != number:
+            histograms = {}
+            self._slots[index] = (number, histograms)
+        return histograms
@@ -73,25 +73,27 @@ def _set_distribution_metric_to_response_size(name, info, an_op):
                                        _SIZE_DISTRIBUTION_ARGS)
 
 
-_TIME_DISTRIBUTION_ARGS = (8, 10.0, 1e-6)
+# The args of the exponential buckets of the reported latency distributions,
+# i.e, (num_finite_buckets, growth_factor, scale)
+TIME_DISTRIBUTION_ARGS = (8, 10.0, 1e-6)
 
 
 def _set_distribution_metric_to_request_time(name, info, an_op):
     if info.request_time:
         _add_distribution_metric_value(name, info.request_time.total_seconds(),
-                                       an_op, _TIME_DISTRIBUTION_ARGS)
+                                       an_op, TIME_DISTRIBUTION_ARGS)
 
 
 def _set_distribution_metric_to_backend_time(name, info, an_op):
     if info.backend_time:
         _add_distribution_metric_value(name, info.backend_time.total_seconds(),
-                                       an_op, _TIME_DISTRIBUTION_ARGS)
+                                       an_op, TIME_DISTRIBUTION_ARGS)
 
 
 def _set_distribution_metric_to_overhead_time(name, info, an_op):
     if info.overhead_time:
         _add_distribution_metric_value(name, info.overhead_time.total_seconds(),
-                                       an_op, _TIME_DISTRIBUTION_ARGS)
+                                       an_op, TIME_DISTRIBUTION_ARGS)
 
 
 class Mark(Enum):
@@ -15,6 +15,7 @@
 """metric values provides funcs using to aggregate `MetricValue`.
 
 :func:`merge` merges two `MetricValue` instances.
+:func:`merge_values` merges the values of two `MetricValue` instances
 :func:`update_hash` adds a `MetricValue` to a secure hash
 :func:`sign` generates a signature for a `MetricValue` using a secure hash
 
@@ -65,23 +66,36 @@ def merge(metric_kind, prior, latest):
        prior (:class:`MetricValue`): an prior instance of the metric
        latest (:class:`MetricValue`: the latest instance of the metric
     """
-    prior_type, _ = _detect_value(prior)
-    latest_type, _ = _detect_value(latest)
-    if prior_type != latest_type:
-        _logger.warn(u'Metric values are not compatible: %s, %s',
-                     prior, latest)
-        raise ValueError(u'Incompatible delta metric values')
-    if prior_type is None:
-        _logger.warn(u'Bad metric values, types not known for : %s, %s',
-                     prior, latest)
-        raise ValueError(u'Unsupported delta metric types')
-
+    _check_compatible(prior, latest)
     if metric_kind == MetricKind.DELTA:
         return _merge_delta_metric(prior, latest)
     else:
         return _merge_cumulative_or_gauge_metrics(prior, latest)
 
 
+def merge_values(metric_kind, prior, latest):
+    """Merges the value of `prior` into `latest`, ignoring their timestamps.
+
+    This is for use by callers that track the start and end times of the
+    merged values themselves, e.g, as numbers, to avoid repeatedly parsing
+    their rfc3339 representation.
+
+    Args:
+       metric_kind (:class:`MetricKind`): indicates the kind of metrics
+         being merged
+       prior (:class:`MetricValue`): an prior instance of the metric
+       latest (:class:`MetricValue`: the latest instance of the metric
+    """
+    value_type = _check_compatible(prior, latest)
+    if metric_kind == MetricKind.DELTA:
+        prior_value = prior.get_assigned_value(value_type)
+        latest_value = latest.get_assigned_value(value_type)
+        updated_value = _combine_delta_values(value_type, prior_value,
+                                              latest_value)
+        setattr(latest, value_type, updated_value)
+    return latest
+
+
 def update_hash(a_hash, mv):
     """Adds ``mv`` to ``a_hash``
 
@@ -91,7 +105,7 @@ def update_hash(a_hash, mv):
 
     """
     if mv.labels:
-        signing.add_dict_to_hash(a_hash, encoding.MessageToPyValue(mv.labels))
+        signing.add_properties_to_hash(a_hash, mv.labels)
     money_value = mv.get_assigned_value(u'moneyValue')
     if money_value is not None:
         a_hash.update(b'\x00')
@@ -120,6 +134,20 @@ def _merge_cumulative_or_gauge_metrics(prior, latest):
         return prior
 
 
+def _check_compatible(prior, latest):
+    prior_type, _ = _detect_value(prior)
+    latest_type, _ = _detect_value(latest)
+    if prior_type != latest_type:
+        _logger.warn(u'Metric values are not compatible: %s, %s',
+                     prior, latest)
+        raise ValueError(u'Incompatible delta metric values')
+    if prior_type is None:
+        _logger.warn(u'Bad metric values, types not known for : %s, %s',
+                     prior, latest)
+        raise ValueError(u'Unsupported delta metric types')
+    return prior_type
+
+
 def _merge_delta_metric(prior, latest):
     prior_type, prior_value = _detect_value(prior)
     latest_type, latest_value = _detect_value(latest)
@@ -31,7 +31,7 @@ from datetime import datetime
 
 from apitools.base.py import encoding
 
-from . import metric_value, sc_messages, timestamp, MetricKind
+from . import distribution, metric_value, sc_messages, timestamp, MetricKind
 
 _logger = logging.getLogger(__name__)
 
@@ -120,16 +120,32 @@ class Info(
             op.operationId = self.operation_id
         if self.operation_name:
             op.operationName = self.operation_name
+        consumer_id = self.consumer_id
+        if consumer_id:
+            op.consumerId = consumer_id
+        return op
+
+    @property
+    def consumer_id(self):
+        """The consumer id of operations made from this instance.
+
+        Returns:
+          string: the consumer id, or the empty string if none is available
+        """
         if self.api_key and self.api_key_valid:
-            op.consumerId = u'api_key:' + self.api_key
+            return u'api_key:' + self.api_key
         elif self.consumer_project_id:
-            op.consumerId = u'project:' + self.consumer_project_id
-        return op
+            return u'project:' + self.consumer_project_id
+        return u''
 
 
 class Aggregator(object):
     """Container that implements operation aggregation.
 
+    The start and end times of the aggregated operation and its metric values
+    are tracked as seconds since the epoch, and only converted back to rfc3339
+    strings by :func:`as_operation`.
+
     Thread compatible.
     """
     DEFAULT_KIND = MetricKind.DELTA
@@ -158,6 +174,7 @@ class Aggregator(object):
         self._merge_metric_values(our_op)
         our_op.metricValueSets = []
         self._op = our_op
+        self._interval = _Interval.of(our_op)
 
     def as_operation(self):
         """Obtains a single `Operation` representing this instances contents.
@@ -166,12 +183,14 @@ class Aggregator(object):
            :class:`endpoints_management.gen.servicecontrol_v1_messages.Operation`
         """
         result = encoding.CopyProtoMessage(self._op)
+        self._interval.update(result)
         names = sorted(self._metric_values_by_name_then_sign.keys())
         for name in names:
-            mvs = self._metric_values_by_name_then_sign[name]
+            entries = self._metric_values_by_name_then_sign[name]
             result.metricValueSets.append(
                 sc_messages.MetricValueSet(
-                    metricName=name, metricValues=mvs.values()))
+                    metricName=name,
+                    metricValues=[e.as_metric_value() for e in entries.values()]))
         return result
 
     def add(self, other_op):
@@ -188,9 +207,21 @@ class Aggregator(object):
 
         """
         self._op.logEntries.extend(other_op.logEntries)
-        self._merge_timestamps(other_op)
+        self._interval.extend(_Interval.of(other_op))
         self._merge_metric_values(other_op)
 
+    def add_time(self, when):
+        """Extends the times of the aggregated operation to include ``when``.
+
+        This is equivalent to adding an operation that starts and ends at
+        ``when`` and is otherwise identical to the aggregated one.
+
+        Args:
+          when (:class:`datetime.datetime`): the time to include
+        """
+        seconds = timestamp.to_epoch_seconds(timestamp.to_rfc3339(when))
+        self._interval.extend(_Interval(seconds, seconds))
+
     def _merge_metric_values(self, other_op):
         for value_set in other_op.metricValueSets:
             name = value_set.metricName
@@ -199,18 +230,95 @@ class Aggregator(object):
             for mv in value_set.metricValues:
                 signature = metric_value.sign(mv)
                 prior = by_signature.get(signature)
-                if prior is not None:
-                    metric_value.merge(kind, prior, mv)
-                by_signature[signature] = mv
-
-    def _merge_timestamps(self, other_op):
-        # Update the start time and end time in self._op  as needed
-        if (other_op.startTime and
-            (self._op.startTime is None or
-             timestamp.compare(other_op.startTime, self._op.startTime) == -1)):
-            self._op.startTime = other_op.startTime
-
-        if (other_op.endTime and
-            (self._op.endTime is None or timestamp.compare(
-                self._op.endTime, other_op.endTime) == -1)):
-            self._op.endTime = other_op.endTime
+                if prior is None:
+                    by_signature[signature] = _MetricValueEntry(kind, mv)
+                else:
+                    prior.merge(mv)
+
+
+class _MetricValueEntry(object):
+    """Holds the aggregate of the metric values that have the same signature.
+
+    The values of DELTA distributions are accumulated in a
+    :class:`distribution.Histogram`, and only converted back to a
+    `Distribution` by :func:`as_metric_value`.
+    """
+    __slots__ = (u'kind', u'value', u'interval', u'histogram')
+
+    def __init__(self, kind, mv):
+        self.kind = kind
+        self.value = mv
+        self.interval = _Interval.of(mv)
+        self.histogram = None
+        if kind == MetricKind.DELTA and mv.distributionValue is not None:
+            try:
+                self.histogram = distribution.Histogram.from_distribution(
+                    mv.distributionValue)
+                mv.distributionValue = None
+            except ValueError:
+                pass  # unknown buckets; merging the message will fail instead
+
+    def merge(self, mv):
+        """Merges ``mv`` into this entry.
+
+        Raises:
+          ValueError: if ``mv`` cannot be merged with the aggregated values
+        """
+        interval = _Interval.of(mv)
+        if self.histogram is not None and mv.distributionValue is not None:
+            self.histogram.add_distribution(mv.distributionValue)
+        else:
+            metric_value.merge_values(self.kind, self.value, mv)
+            self.value = mv
+        if self.kind == MetricKind.DELTA:
+            interval.extend(self.interval)
+        self.interval = interval
+
+    def as_metric_value(self):
+        """Obtains the `MetricValue` representing this entry."""
+        mv = self.value
+        self.interval.update(mv)
+        if self.histogram is not None:
+            mv.distributionValue = self.histogram.as_distribution()
+        return mv
+
+
+class _Interval(object):
+    """Tracks a start and end time as seconds since the epoch.
+
+    Either time may be ``None``, indicating that it is not set.
+    """
+    # pylint: disable=too-few-public-methods
+    __slots__ = (u'start', u'end')
+
+    def __init__(self, start=None, end=None):
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def of(cls, msg):
+        """Creates an instance from the rfc3339 times in ``msg``.
+
+        Args:
+          msg (:class:`Operation`|:class:`MetricValue`): the message whose
+            ``startTime`` and ``endTime`` are parsed
+        """
+        return cls(
+            timestamp.to_epoch_seconds(msg.startTime) if msg.startTime else None,
+            timestamp.to_epoch_seconds(msg.endTime) if msg.endTime else None)
+
+    def extend(self, other):
+        """Updates this instance to the earliest start and latest end time."""
+        if other.start is not None and (self.start is None or
+                                        other.start < self.start):
+            self.start = other.start
+        if other.end is not None and (self.end is None or
+                                      self.end < other.end):
+            self.end = other.end
+
+    def update(self, msg):
+        """Sets the rfc3339 ``startTime`` and ``endTime`` of ``msg``."""
+        if self.start is not None:
+            msg.startTime = timestamp.to_rfc3339(self.start)
+        if self.end is not None:
+            msg.endTime = timestamp.to_rfc3339(self.end)
@@ -562,10 +562,8 @@ def _sign_operation(op):
     Returns:
        string: a unique signature for that operation
     """
-    md5 = hashlib.md5()
-    md5.update(op.consumerId.encode('utf-8'))
-    md5.update(b'\x00')
-    md5.update(op.operationName.encode('utf-8'))
+    signature = (op.consumerId.encode('utf-8') + b'\x00' +
+                 op.operationName.encode('utf-8'))
     if op.labels:
-        signing.add_dict_to_hash(md5, encoding.MessageToPyValue(op.labels))
-    return md5.digest()
+        signature += signing.properties_signature_bytes(op.labels)
+    return hashlib.md5(signature).digest()
@@ -31,6 +31,7 @@ from __future__ import absolute_import
 import collections
 import logging
 import os
+import re
 import urllib
 
 
@@ -92,30 +93,49 @@ _SIMPLE_CONFIG = """
     }
 }
 """
-_SIMPLE_CORE = encoding.JsonToMessage(sm_messages.Service, _SIMPLE_CONFIG)
+_SIMPLE_CORE = None
 
 
 def _load_simple():
+    global _SIMPLE_CORE  # pylint: disable=global-statement
+    if _SIMPLE_CORE is None:
+        _SIMPLE_CORE = encoding.JsonToMessage(sm_messages.Service,
+                                              _SIMPLE_CONFIG)
     return encoding.CopyProtoMessage(_SIMPLE_CORE)
 
 
 class Loaders(Enum):
     """Enumerates the functions used to load service configs."""
     # pylint: disable=too-few-public-methods
-    ENVIRONMENT = (_load_from_well_known_env,)
-    SIMPLE = (_load_simple,)
-    FROM_SERVICE_MANAGEMENT = (service_config.fetch_service_config,)
+    ENVIRONMENT = (_load_from_well_known_env, None)
+    SIMPLE = (_load_simple, None)
+    FROM_SERVICE_MANAGEMENT = (service_config.fetch_service_config,
+                               service_config.fetch_service_config_id)
 
-    def __init__(self, load_func):
+    def __init__(self, load_func, id_func):
         """Constructor.
 
-        load_func is used to load a service config
+        load_func is used to load a service config, and id_func, if set, to
+        obtain the id of the config that load_func would load without
+        loading it
         """
         self._load_func = load_func
+        self._id_func = id_func
 
     def load(self, **kw):
         return self._load_func(**kw)
 
+    def latest_id(self, **kw):
+        """Obtains the id of the service config that :meth:`load` would load.
+
+        Returns:
+          string: the id, or None if it can only be found by loading the
+            service config
+        """
+        if self._id_func is None:
+            return None
+        return self._id_func(**kw)
+
 
 class MethodRegistry(object):
     """Provides a registry of the api methods defined by a ``Service``.
@@ -149,6 +169,57 @@ class MethodRegistry(object):
         self._templates_method_infos = collections.defaultdict(list)
         self._extract_methods()
 
+    def to_dict(self):
+        """Obtains a JSON-compatible dict from which this registry can be restored.
+
+        Returns:
+          dict: the extracted methods and the url templates that match them
+        """
+        templates = {}
+        for http_method, tmi in self._templates_method_infos.items():
+            templates[http_method] = [[template.pattern, method_info.selector]
+                                      for template, method_info in tmi]
+        methods = [info.to_dict() for info in self._extracted_methods.values()]
+        return {
+            u'methods': methods,
+            u'templates': templates,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Restores a registry from the output of :meth:`to_dict`.
+
+        The url templates are not re-parsed; only their regexes are compiled.
+
+        Args:
+          data (dict): the output of :meth:`to_dict`
+
+        Returns:
+          :class:`MethodRegistry`: the restored registry
+
+        Raises:
+          ValueError: if `data` is not valid
+        """
+        registry = cls.__new__(cls)
+        registry._service = None
+        registry._auth_infos = {}
+        registry._quota_infos = {}
+        registry._extracted_methods = {}
+        registry._templates_method_infos = collections.defaultdict(list)
+        try:
+            for method_data in data[u'methods']:
+                info = MethodInfo.from_dict(method_data)
+                registry._extracted_methods[info.selector] = info
+            for http_method, templates in data[u'templates'].items():
+                tmi = registry._templates_method_infos[http_method]
+                for pattern, selector in templates:
+                    tmi.append((re.compile(pattern),
+                                registry._extracted_methods[selector]))
+        except (KeyError, TypeError, re.error) as e:
+            _logger.error(u'bad method registry data: %s', e)
+            raise ValueError(u'Bad method registry data')
+        return registry
+
     def lookup(self, http_method, path):
         http_method = http_method.lower()
         if path.startswith(u'/'):
@@ -322,8 +393,15 @@ class MethodRegistry(object):
                     method.add_url_query_param(name, parameter.urlQueryParameter)
 
 
+_NO_AUDIENCES = frozenset()
+
+
 class AuthInfo(object):
-    """Consolidates auth information about methods defined in a ``Service``."""
+    """Consolidates auth information about methods defined in a ``Service``.
+
+    The allowed audiences of each provider are held as frozensets, so that
+    checking them does not allocate.
+    """
 
     def __init__(self, provider_ids_to_audiences):
         """Construct an AuthInfo instance.
@@ -333,12 +411,19 @@ class AuthInfo(object):
             to allowed audiences.
         """
         self._provider_ids_to_audiences = provider_ids_to_audiences
+        self._audience_sets = dict(
+            (provider_id, frozenset(audiences))
+            for provider_id, audiences in provider_ids_to_audiences.items())
 
     def is_provider_allowed(self, provider_id):
-        return provider_id in self._provider_ids_to_audiences
+        return provider_id in self._audience_sets
 
     def get_allowed_audiences(self, provider_id):
-        return self._provider_ids_to_audiences.get(provider_id, [])
+        """Obtains the frozenset of audiences allowed for a provider."""
+        return self._audience_sets.get(provider_id, _NO_AUDIENCES)
+
+    def to_dict(self):
+        return dict(self._provider_ids_to_audiences)
 
 
 class MethodInfo(object):
@@ -368,6 +453,33 @@ class MethodInfo(object):
     def header_param(self, name):
         return tuple(self._header_parameters[name])
 
+    def to_dict(self):
+        """Obtains a JSON-compatible dict from which this can be restored."""
+        auth_info = self.auth_info
+        return {
+            u'selector': self.selector,
+            u'authInfo': auth_info.to_dict() if auth_info else None,
+            u'quotaInfo': self.quota_info,
+            u'allowUnregisteredCalls': self.allow_unregistered_calls,
+            u'backendAddress': self.backend_address,
+            u'bodyFieldPath': self.body_field_path,
+            u'urlQueryParameters': dict(self._url_query_parameters),
+            u'headerParameters': dict(self._header_parameters),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Restores a MethodInfo from the output of :meth:`to_dict`."""
+        auth_data = data[u'authInfo']
+        auth_info = AuthInfo(auth_data) if auth_data is not None else None
+        info = cls(data[u'selector'], auth_info, data[u'quotaInfo'])
+        info.allow_unregistered_calls = data[u'allowUnregisteredCalls']
+        info.backend_address = data[u'backendAddress']
+        info.body_field_path = data[u'bodyFieldPath']
+        info._url_query_parameters.update(data[u'urlQueryParameters'])
+        info._header_parameters.update(data[u'headerParameters'])
+        return info
+
     @property
     def api_key_http_header(self):
         return self.header_param(self.API_KEY_NAME)
@@ -400,25 +512,26 @@ def extract_report_spec(
          labels (list[string]) # the labels to add
        )
     """
-    resource_descs = service.monitoredResources
+    resource_descs = _index_descriptors(service.monitoredResources, u'type')
     labels_dict = {}
     logs = set()
     if service.logging:
         logs = _add_logging_destinations(
             service.logging.producerDestinations,
             resource_descs,
-            service.logs,
+            _index_descriptors(service.logs, u'name'),
             labels_dict,
             label_is_supported
         )
     metrics_dict = {}
     monitoring = service.monitoring
     if monitoring:
+        metric_descs = _index_descriptors(service.metrics, u'name')
         for destinations in (monitoring.consumerDestinations,
                              monitoring.producerDestinations):
             _add_monitoring_destinations(destinations,
                                          resource_descs,
-                                         service.metrics,
+                                         metric_descs,
                                          metrics_dict,
                                          metric_is_supported,
                                          labels_dict,
@@ -426,6 +539,14 @@ def extract_report_spec(
     return logs, metrics_dict.keys(), labels_dict.keys()
 
 
+def _index_descriptors(descs, key_field):
+    """Indexes descriptors by a key field, keeping the first of any duplicates."""
+    index = {}
+    for d in descs:
+        index.setdefault(getattr(d, key_field), d)
+    return index
+
+
 def _add_logging_destinations(destinations,
                               resource_descs,
                               log_descs,
@@ -484,35 +605,31 @@ def _add_labels_from_descriptors(descs, labels_dict, is_supported):
 
 
 def _add_labels_for_a_log(logging_descs, log_name, labels_dict, is_supported):
-    for d in logging_descs:
-        if d.name == log_name:
-            _add_labels_from_descriptors(d.labels, labels_dict, is_supported)
-            return True
-    _logger.warn(u'bad log label scan: log not found %s', log_name)
-    return False
+    d = logging_descs.get(log_name)
+    if d is None:
+        _logger.warn(u'bad log label scan: log not found %s', log_name)
+        return False
+    _add_labels_from_descriptors(d.labels, labels_dict, is_supported)
+    return True
 
 
 def _add_labels_for_a_monitored_resource(resource_descs,
                                          resource_name,
                                          labels_dict,
                                          is_supported):
-    for d in resource_descs:
-        if d.type == resource_name:
-            _add_labels_from_descriptors(d.labels, labels_dict, is_supported)
-            return True
-    _logger.warn(u'bad monitored resource label scan: resource not found %s',
-                resource_name)
-    return False
+    d = resource_descs.get(resource_name)
+    if d is None:
+        _logger.warn(u'bad monitored resource label scan: resource not found %s',
+                    resource_name)
+        return False
+    _add_labels_from_descriptors(d.labels, labels_dict, is_supported)
+    return True
 
 
 def _find_metric_descriptor(metric_descs, name, metric_is_supported):
-    for d in metric_descs:
-        if name != d.name:
-            continue
-        if metric_is_supported(d):
-            return d
-        else:
-            return None
+    d = metric_descs.get(name)
+    if d is not None and metric_is_supported(d):
+        return d
     return None
 
 
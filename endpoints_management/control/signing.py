@@ -16,6 +16,8 @@
 
 from __future__ import absolute_import
 
+import operator
+
 
 def add_dict_to_hash(a_hash, a_dict):
     """Adds `a_dict` to `a_hash`
@@ -27,5 +29,71 @@ def add_dict_to_hash(a_hash, a_dict):
     """
     if a_dict is None:
         return
-    for k, v in a_dict.items():
-        a_hash.update(b'\x00' + k.encode('utf-8') + b'\x00' + v.encode('utf-8'))
+    a_hash.update(dict_signature_bytes(a_dict))
+
+
+def add_properties_to_hash(a_hash, a_message):
+    """Adds the additional properties of `a_message` to `a_hash`
+
+    This gives the same result as adding the dict obtained by converting
+    `a_message` to a python value with :func:`add_dict_to_hash`, without the
+    intermediate conversion to JSON.
+
+    Args:
+       a_hash (`Hash`): the secure hash, e.g created by hashlib.md5
+       a_message (:class:`apitools.base.protorpclite.messages.Message`): a
+         message with string `additionalProperties`, e.g, `Operation.LabelsValue`
+
+    """
+    if a_message is None:
+        return
+    a_hash.update(properties_signature_bytes(a_message))
+
+
+def dict_signature_bytes(a_dict):
+    """Obtains the bytes that :func:`add_dict_to_hash` adds for `a_dict`.
+
+    Args:
+       a_dict (dict[string, [string]]): the dictionary to add to a hash
+
+    Returns:
+       bytes: the bytes to add to a hash
+    """
+    return b''.join(
+        b'\x00' + k.encode('utf-8') + b'\x00' + v.encode('utf-8')
+        for k, v in a_dict.items())
+
+
+def properties_signature_bytes(a_message):
+    """Obtains the bytes that :func:`add_properties_to_hash` adds for `a_message`.
+
+    The properties are collected in a dict in sorted key order, just as
+    `encoding.MessageToPyValue` collects them from the JSON it produces, so the
+    dicts iterate in the same order and the result is the same.
+
+    Args:
+       a_message (:class:`apitools.base.protorpclite.messages.Message`): a
+         message with string `additionalProperties`
+
+    Returns:
+       bytes: the bytes to add to a hash
+    """
+    return sorted_dict_signature_bytes(
+        (p.key, p.value) for p in a_message.additionalProperties)
+
+
+def sorted_dict_signature_bytes(items):
+    """Obtains the bytes that :func:`add_properties_to_hash` adds for `items`.
+
+    This allows the bytes for a message to be obtained before it's built.
+
+    Args:
+       items (dict|iterable[tuple]): the properties of the message
+
+    Returns:
+       bytes: the bytes to add to a hash
+    """
+    if isinstance(items, dict):
+        items = items.items()
+    return dict_signature_bytes(
+        dict(sorted(items, key=operator.itemgetter(0))))
@@ -0,0 +1,164 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""snapshot saves the configuration derived from a service for fast startup.
+
+Building a :class:`endpoints_management.control.service.MethodRegistry` and
+extracting the report spec of a ``Service`` parses every url template and
+scans all of its rules.  :func:`create` does this once and captures the result
+in a JSON-compatible snapshot, keyed by the service name and config id, from
+which :func:`restore` obtains the same configuration without doing so again.
+
+Snapshots can be created ahead of time, e.g during deployment, by running this
+module::
+
+  python -m endpoints_management.control.snapshot service.json snapshot.json
+
+:class:`endpoints_management.control.wsgi.EnvironmentMiddleware` uses the
+snapshot file named by the environment variable :data:`SNAPSHOT_VAR`, if it
+matches the service being configured.
+
+"""
+
+from __future__ import absolute_import
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+from apitools.base.py import encoding
+
+from . import report_request, service, sm_messages
+
+_logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+SNAPSHOT_VAR = u'ENDPOINTS_CONFIG_SNAPSHOT_FILE'
+
+
+def create(a_service):
+    """Creates a snapshot of the configuration derived from a service.
+
+    Args:
+      a_service (:class:`endpoints_management.gen.servicemanagement_v1_messages.Service`):
+        a service instance
+
+    Returns:
+      dict: a JSON-compatible snapshot
+    """
+    registry = service.MethodRegistry(a_service)
+    logs, metric_names, label_names = service.extract_report_spec(a_service)
+    return {
+        u'formatVersion': FORMAT_VERSION,
+        u'serviceName': a_service.name,
+        u'serviceConfigId': a_service.id,
+        u'methodRegistry': registry.to_dict(),
+        u'reportSpec': {
+            u'logs': sorted(logs),
+            u'metricNames': sorted(metric_names),
+            u'labelNames': sorted(label_names),
+        },
+    }
+
+
+def restore(snapshot, a_service=None):
+    """Restores the configuration captured by a snapshot.
+
+    Args:
+      snapshot (dict): the output of :func:`create`
+      a_service (:class:`endpoints_management.gen.servicemanagement_v1_messages.Service`):
+        if set, the snapshot must have been created from a service with the
+        same name and config id
+
+    Returns:
+      tuple: (
+        :class:`endpoints_management.control.service.MethodRegistry`,
+        :class:`endpoints_management.control.report_request.ReportingRules`
+      )
+
+    Raises:
+      ValueError: if the snapshot is invalid, in an unsupported format, or
+        was created from a different service config
+    """
+    if not isinstance(snapshot, dict):
+        raise ValueError(u'snapshot should be a dict')
+    version = snapshot.get(u'formatVersion')
+    if version != FORMAT_VERSION:
+        _logger.error(u'unsupported snapshot format %s', version)
+        raise ValueError(u'Unsupported snapshot format')
+    if a_service is not None:
+        key = (snapshot.get(u'serviceName'), snapshot.get(u'serviceConfigId'))
+        if key != (a_service.name, a_service.id):
+            _logger.error(u'snapshot of %s does not match service %s',
+                          key, (a_service.name, a_service.id))
+            raise ValueError(u'Snapshot does not match the service')
+    try:
+        registry = service.MethodRegistry.from_dict(snapshot[u'methodRegistry'])
+        spec = snapshot[u'reportSpec']
+        reporting_rules = report_request.ReportingRules.from_known_inputs(
+            logs=spec[u'logs'],
+            metric_names=spec[u'metricNames'],
+            label_names=spec[u'labelNames'])
+    except (KeyError, TypeError) as e:
+        _logger.error(u'bad snapshot: %s', e)
+        raise ValueError(u'Bad snapshot')
+    return registry, reporting_rules
+
+
+def restore_from_environment(a_service):
+    """Restores the configuration for a service from the snapshot file in
+    the environment, if there is one.
+
+    Args:
+      a_service (:class:`endpoints_management.gen.servicemanagement_v1_messages.Service`):
+        the service being configured
+
+    Returns:
+      tuple: the output of :func:`restore`, or None if no snapshot file is
+        set or it could not be used
+    """
+    snapshot_file = os.environ.get(SNAPSHOT_VAR)
+    if not snapshot_file:
+        return None
+    try:
+        with open(snapshot_file) as f:
+            return restore(json.load(f), a_service)
+    except (IOError, ValueError) as e:
+        _logger.warn(u'did not use config snapshot %s: %s', snapshot_file, e)
+        return None
+
+
+def main(argv=None):
+    """Writes the snapshot of a service config file."""
+    parser = argparse.ArgumentParser(
+        description=u'Snapshots the configuration derived from a service config')
+    parser.add_argument(u'service_config',
+                        help=u'a JSON service config file')
+    parser.add_argument(u'output',
+                        help=u'the snapshot file to write')
+    args = parser.parse_args(argv)
+
+    with open(args.service_config) as f:
+        a_service = encoding.JsonToMessage(sm_messages.Service, f.read())
+    a_snapshot = create(a_service)
+    with open(args.output, u'w') as f:
+        json.dump(a_snapshot, f, sort_keys=True)
+    return 0
+
+
+if __name__ == u'__main__':
+    sys.exit(main())
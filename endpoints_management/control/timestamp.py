@@ -17,22 +17,46 @@
 :func:`to_rfc3339` and :func:`from_rfc3339` convert between standard python
 datetime types and the rfc3339 representation used in json messsages.
 
+:func:`to_epoch_seconds` parses the rfc3339 representation into a float number
+of seconds since the unix epoch; it's used when timestamps need to be compared
+many times, e.g, during aggregation.
+
 :func:`compare` allows comparison of any timestamp representation, either the
 standard python datetime types, or an rfc3339 string representation
 
+Conversions to and from rfc3339 are on the hot path of every check and report,
+so they avoid the generic date handling of the standard library where they
+can.  In particular, the date and time of the last whole second converted in
+each direction is remembered, and only the fractional part and offset of
+timestamps within that second are re-computed.
+
 """
 
 from __future__ import absolute_import
 
+import calendar
 import datetime
 import logging
-
-import strict_rfc3339
+import re
+import time
 
 _logger = logging.getLogger(__name__)
 
 
 _EPOCH_START = datetime.datetime(1970, 1, 1)
+_NUMBER_TYPES = (int, long, float)
+_SECONDS_PER_DAY = 24 * 60 * 60
+_PREFIX_LENGTH = len(u'YYYY-MM-DDTHH:MM:SS')
+_PREFIX_REGEX = re.compile(
+    r'^(\d\d\d\d)-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)$')
+_SUFFIX_REGEX = re.compile(r'(\.\d+)?(?:Z|([+\-])(\d\d):(\d\d))$')
+
+# (seconds, prefix) of the last whole second formatted by to_rfc3339, and
+# (prefix, seconds) of the last one parsed by to_epoch_seconds.  Each is
+# replaced as a single tuple, so concurrent readers always see a consistent
+# pair.
+_last_formatted = (None, None)
+_last_parsed = (None, None)
 
 
 def compare(a, b):
@@ -62,8 +86,8 @@ def compare(a, b):
         raise ValueError(u'cannot compare inputs of differing types')
 
     if a_is_text:
-        a = from_rfc3339(a, with_nanos=True)
-        b = from_rfc3339(b, with_nanos=True)
+        a = to_epoch_seconds(a)
+        b = to_epoch_seconds(b)
 
     if a < b:
         return -1
@@ -76,30 +100,106 @@ def compare(a, b):
 def to_rfc3339(timestamp):
     """Converts ``timestamp`` to an RFC 3339 date string format.
 
-    ``timestamp`` can be either a ``datetime.datetime`` or a
-    ``datetime.timedelta``.  Instances of the later are assumed to be a delta
-    with the beginining of the unix epoch, 1st of January, 1970
+    ``timestamp`` can be either a ``datetime.datetime``, a
+    ``datetime.timedelta`` or a number.  Instances of the later two are assumed
+    to be a delta with the beginining of the unix epoch, 1st of January, 1970;
+    numbers are treated as a count of seconds
 
     The returned string is always Z-normalized.  Examples of the return format:
     '1972-01-01T10:00:20.021Z'
 
     Args:
-      timestamp (datetime|timedelta): represents the timestamp to convert
+      timestamp (datetime|timedelta|float): represents the timestamp to convert
 
     Returns:
       string: timestamp converted to a rfc3339 compliant string as above
 
     Raises:
-      ValueError: if timestamp is not a datetime.datetime or datetime.timedelta
+      ValueError: if timestamp is not a datetime.datetime, datetime.timedelta
+        or a number
 
     """
+    # pylint: disable=global-statement
+    global _last_formatted
     if isinstance(timestamp, datetime.datetime):
         timestamp = timestamp - _EPOCH_START
-    if not isinstance(timestamp, datetime.timedelta):
+    if isinstance(timestamp, datetime.timedelta):
+        seconds = timestamp.days * _SECONDS_PER_DAY + timestamp.seconds
+        micros = timestamp.microseconds
+    elif isinstance(timestamp, float):
+        seconds, micros = divmod(int(round(timestamp * 1e6)), 1000000)
+    elif isinstance(timestamp, _NUMBER_TYPES):
+        seconds, micros = timestamp, 0
+    else:
         _logger.error(u'Could not convert %s to a rfc3339 time,', timestamp)
         raise ValueError(u'Invalid timestamp type')
-    return strict_rfc3339.timestamp_to_rfc3339_utcoffset(
-        timestamp.total_seconds())
+
+    last_seconds, prefix = _last_formatted
+    if seconds != last_seconds:
+        prefix = u'%04d-%02d-%02dT%02d:%02d:%02d' % time.gmtime(seconds)[:6]
+        _last_formatted = (seconds, prefix)
+    if micros:
+        return u'%s.%sZ' % (prefix, (u'%06d' % micros).rstrip(u'0'))
+    return prefix + u'Z'
+
+
+def to_epoch_seconds(rfc3339_text):
+    """Parse a RFC 3339 date string to the seconds since the unix epoch.
+
+    Example of accepted format: '1972-01-01T10:00:20.021-05:00'
+
+    Args:
+      rfc3339_text (string): An rfc3339 formatted date string
+
+    Raises:
+      ValueError: if ``rfc3339_text`` is invalid
+
+    Returns:
+      float: the number of seconds since the unix epoch
+
+    """
+    # pylint: disable=global-statement
+    global _last_parsed
+    prefix = rfc3339_text[:_PREFIX_LENGTH]
+    last_prefix, seconds = _last_parsed
+    if prefix != last_prefix:
+        seconds = _parse_prefix(rfc3339_text, prefix)
+        _last_parsed = (prefix, seconds)
+
+    match = _SUFFIX_REGEX.match(rfc3339_text, _PREFIX_LENGTH)
+    if match is None:
+        _logger.error(u'Invalid rfc3339 time %s', rfc3339_text)
+        raise ValueError(u'Invalid rfc3339 time')
+    fraction, offset_sign, offset_hours, offset_mins = match.groups()
+    if offset_sign is not None:
+        offset_hours = int(offset_hours)
+        offset_mins = int(offset_mins)
+        if offset_hours > 23 or offset_mins > 59:
+            _logger.error(u'Invalid rfc3339 time offset %s', rfc3339_text)
+            raise ValueError(u'Invalid rfc3339 time')
+        offset_seconds = offset_hours * 3600 + offset_mins * 60
+        if offset_sign == u'-':
+            seconds += offset_seconds
+        else:
+            seconds -= offset_seconds
+    if fraction is not None:
+        return seconds + float(u'0' + fraction)
+    return seconds
+
+
+def _parse_prefix(rfc3339_text, prefix):
+    match = _PREFIX_REGEX.match(prefix)
+    if match is None:
+        _logger.error(u'Invalid rfc3339 time %s', rfc3339_text)
+        raise ValueError(u'Invalid rfc3339 time')
+    year, month, day, hour, minute, second = [int(x) for x in match.groups()]
+    if (not 1 <= year <= 9999 or
+            not 1 <= month <= 12 or
+            not 1 <= day <= calendar.monthrange(year, month)[1] or
+            hour > 23 or minute > 59 or second > 59):
+        _logger.error(u'Invalid rfc3339 time %s', rfc3339_text)
+        raise ValueError(u'Invalid rfc3339 time')
+    return calendar.timegm((year, month, day, hour, minute, second))
 
 
 def from_rfc3339(rfc3339_text, with_nanos=False):
@@ -125,7 +225,7 @@ def from_rfc3339(rfc3339_text, with_nanos=False):
       tuple(:class:`datetime.datetime`, int): when with_nanos is True
 
     """
-    timestamp = strict_rfc3339.rfc3339_to_timestamp(rfc3339_text)
+    timestamp = to_epoch_seconds(rfc3339_text)
     result = datetime.datetime.utcfromtimestamp(timestamp)
     if with_nanos:
         return (result, int((timestamp - int(timestamp)) * 1e9))
@@ -19,6 +19,9 @@ It provides the :class:`Middleware`, which is a WSGI middleware implementation
 that wraps another WSGI application to uses a provided
 :class:`endpoints_management.control.client.Client` to provide service control.
 
+The middleware share a :class:`RequestContext` stored in the WSGI environment,
+so that each request is only parsed once.
+
 """
 # pylint: disable=too-many-arguments
 
@@ -26,9 +29,11 @@ from __future__ import absolute_import
 
 from datetime import datetime
 import httplib
+import itertools
 import logging
 import os
 import socket
+import threading
 import uuid
 import urllib2
 import urlparse
@@ -39,7 +44,8 @@ from webob.exc import HTTPServiceUnavailable, status_map as exc_status_map
 
 from ..auth import suppliers, tokens
 from ..config.service_config import ServiceConfigException
-from . import check_request, client, quota_request, report_request, service, sm_messages
+from . import (check_request, client, quota_request, report_request, service,
+               sm_messages, snapshot)
 
 
 _logger = logging.getLogger(__name__)
@@ -49,6 +55,11 @@ _CONTENT_LENGTH = u'content-length'
 _DEFAULT_LOCATION = u'global'
 
 _METADATA_SERVER_URL = u'http://metadata.google.internal'
+_METADATA_TIMEOUT_SECS = 1.0
+
+PLATFORM_VAR = u'ENDPOINTS_MANAGEMENT_PLATFORM'
+"""Names a :class:`endpoints_management.control.report_request.ReportedPlatforms`
+value, e.g 'GCE', to report instead of detecting the platform"""
 
 
 def _running_on_gce():
@@ -56,7 +67,7 @@ def _running_on_gce():
 
     try:
         request = urllib2.Request(_METADATA_SERVER_URL, headers=headers)
-        response = urllib2.urlopen(request)
+        response = urllib2.urlopen(request, timeout=_METADATA_TIMEOUT_SECS)
         if response.info().getheader(u'Metadata-Flavor') == u'Google':
             return True
     except (urllib2.URLError, socket.error):
@@ -65,14 +76,28 @@ def _running_on_gce():
     return False
 
 
-def _get_platform():
+def _not_running_on_gce():
+    return False
+
+
+def _get_platform(running_on_gce=None):
+    if running_on_gce is None:
+        running_on_gce = _running_on_gce
     server_software = os.environ.get(u'SERVER_SOFTWARE', u'')
 
+    override = os.environ.get(PLATFORM_VAR)
+    if override:
+        try:
+            return report_request.ReportedPlatforms[override.upper()]
+        except KeyError:
+            _logger.warn(u'ignored unknown platform %s in %s',
+                         override, PLATFORM_VAR)
+
     if server_software.startswith(u'Development'):
         return report_request.ReportedPlatforms.DEVELOPMENT
     elif os.environ.get(u'KUBERNETES_SERVICE_HOST'):
         return report_request.ReportedPlatforms.GKE
-    elif _running_on_gce():
+    elif running_on_gce():
         # We're either in GAE Flex or GCE
         if os.environ.get(u'GAE_MODULE_NAME'):
             return report_request.ReportedPlatforms.GAE_FLEX
@@ -84,15 +109,105 @@ def _get_platform():
     return report_request.ReportedPlatforms.UNKNOWN
 
 
-platform = _get_platform()
+class _PlatformDetector(object):
+    """Detects the platform in a background thread.
+
+    Detection may need to probe the metadata server, so it's only started when
+    the platform is first needed.  Until it completes, the platform is
+    determined as if the probe had failed.  Detection is restarted in a forked
+    process if it had not completed before the fork, as the thread doing it is
+    not copied.
+
+    Thread safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._platform = None
+        self._started = False
+        self._pid = None
+
+    def get(self):
+        """Obtains the platform, starting detection if necessary."""
+        a_platform = self._platform
+        if a_platform is not None:
+            return a_platform
+        self.start()
+        a_platform = self._platform
+        if a_platform is not None:
+            return a_platform
+        return _get_platform(running_on_gce=_not_running_on_gce)
+
+    def set(self, a_platform):
+        """Sets the platform, overriding any that was or will be detected."""
+        with self._lock:
+            self._started = True
+            self._platform = a_platform
+
+    def start(self):
+        """Starts detecting the platform in the background if necessary."""
+        with self._lock:
+            pid = os.getpid()
+            if self._platform is not None or (self._started and
+                                              self._pid == pid):
+                return
+            self._started = True
+            self._pid = pid
+        thread = threading.Thread(target=self._detect,
+                                  name=u'endpoints-platform-detection')
+        thread.daemon = True
+        try:
+            thread.start()
+        except Exception:  # pylint: disable=broad-except
+            _logger.exception(u'Failed to start platform detection thread.')
+            self._set_detected(
+                _get_platform(running_on_gce=_not_running_on_gce))
+
+    def _detect(self):
+        self._set_detected(_get_platform())
+
+    def _set_detected(self, a_platform):
+        with self._lock:
+            if self._platform is None:
+                self._platform = a_platform
+
+
+_platform_detector = _PlatformDetector()
+
+
+def get_platform():
+    """Obtains the platform to report.
+
+    The platform is detected in the background the first time this is
+    called, unless it is set by :func:`set_platform` or the environment
+    variable named by :data:`PLATFORM_VAR`; until detection completes, it's
+    determined without contacting the metadata server.
+
+    Returns:
+      :class:`endpoints_management.control.report_request.ReportedPlatforms`
+    """
+    return _platform_detector.get()
+
+
+def set_platform(a_platform):
+    """Sets the platform to report, instead of detecting it.
+
+    Args:
+      a_platform (:class:`endpoints_management.control.report_request.ReportedPlatforms`):
+        the platform
+    """
+    _platform_detector.set(a_platform)
 
 
 def running_on_devserver():
-    return platform == report_request.ReportedPlatforms.DEVELOPMENT
+    return get_platform() == report_request.ReportedPlatforms.DEVELOPMENT
 
 
 def add_all(application, project_id, control_client,
-            loader=service.Loaders.FROM_SERVICE_MANAGEMENT):
+            loader=service.Loaders.FROM_SERVICE_MANAGEMENT,
+            reload_interval=None,
+            latency_tracker=None,
+            share_operation_id=False):
     """Adds all endpoints middleware to a wsgi application.
 
     Sets up application to use all default endpoints middleware.
@@ -121,8 +236,17 @@ def add_all(application, project_id, control_client,
        control_client: the service control client instance
        loader (:class:`endpoints_management.control.service.Loader`): loads the service
           instance that configures this instance's behaviour
+       reload_interval (:class:`datetime.timedelta`): if set, how often to
+          check for a new service config, see :class:`ConfigFetchWrapper`
+       latency_tracker (:class:`endpoints_management.control.latency.LatencyTracker`):
+          if set, records the latency of each reported request
+       share_operation_id (bool): if True, the quota operation of a request
+          uses the id of its check operation, rather than a new one
     """
-    return ConfigFetchWrapper(application, project_id, control_client, loader)
+    return ConfigFetchWrapper(application, project_id, control_client, loader,
+                              reload_interval=reload_interval,
+                              latency_tracker=latency_tracker,
+                              share_operation_id=share_operation_id)
 
 
 class ConfigFetchWrapper(object):
@@ -132,19 +256,33 @@ class ConfigFetchWrapper(object):
     exponential backoff. However, if background threads are disabled, it will
     instead try loading the service config before every request.
 
+    If a reload interval is given, a background thread also polls the loader
+    for a service config with a new id once the service config has loaded.
+    Loaders that can obtain the id of the latest config without loading it
+    are asked for that first, so an unchanged config is not loaded again, and
+    a new one is loaded by its id.
+    The middleware for a new config is built in that thread and then replaces
+    the current middleware; the control client, and so its check, quota and
+    report caches, is reused.
+
     Since it might run in a situation where threading doesn't work, it does not
     use locks to coordinate access. Instead, the background thread may access
-    only the self.loader and self.service_config variables; specifically,
-    retrieving the former and retrieving and setting the latter. The Python GIL
-    ensures that thread contexts can only switch between individual Python
-    bytecodes.
+    only the self.loader, self.service_config and self.wsgi_backend variables;
+    specifically, retrieving the former and retrieving and setting the latter
+    two. The Python GIL ensures that thread contexts can only switch between
+    individual Python bytecodes.
     """
     def __init__(self, application, project_id, control_client,
                  loader=service.Loaders.FROM_SERVICE_MANAGEMENT,
-                 disable_threading=False):
+                 disable_threading=False,
+                 reload_interval=None,
+                 latency_tracker=None,
+                 share_operation_id=False):
         self.service_config = None
         self.background_thread = None
         self.threading_failed = disable_threading
+        self.reload_interval = reload_interval
+        self._stop_reloading = threading.Event()
         # This will answer all requests with HTTP 503 Service Unavailable
         self.wsgi_backend = HTTPServiceUnavailable()
 
@@ -152,11 +290,15 @@ class ConfigFetchWrapper(object):
         self.project_id = project_id
         self.control_client = control_client
         self.loader = loader
+        self.latency_tracker = latency_tracker
+        self.share_operation_id = share_operation_id
 
         self.try_loading()
         self.wrap_app()
         if self.service_config is None:
             self.launch_loading_thread()
+        elif self.reload_interval:
+            self.launch_loading_thread(target=self.reload_periodically)
 
     def __call__(self, environ, start_response):
         if self.threading_failed and self.service_config is None:
@@ -166,14 +308,21 @@ class ConfigFetchWrapper(object):
         return self.wsgi_backend(environ, start_response)
 
     def wrap_app(self):
-        if self.service_config is None:
+        a_service = self.service_config
+        if a_service is None:
             return
-        authenticator = _create_authenticator(self.service_config)
+        self.wsgi_backend = self._create_backend(a_service)
+
+    def _create_backend(self, a_service):
+        authenticator = _create_authenticator(a_service)
 
-        wrapped_app = Middleware(self.application, self.project_id, self.control_client)
+        wrapped_app = Middleware(self.application, self.project_id,
+                                 self.control_client,
+                                 latency_tracker=self.latency_tracker,
+                                 share_operation_id=self.share_operation_id)
         if authenticator:
             wrapped_app = AuthenticationMiddleware(wrapped_app, authenticator)
-        self.wsgi_backend = EnvironmentMiddleware(wrapped_app, self.service_config)
+        return EnvironmentMiddleware(wrapped_app, a_service)
 
     def try_loading(self):
         try:
@@ -186,6 +335,53 @@ class ConfigFetchWrapper(object):
             _logger.debug('Loaded service config.')
             self.service_config = a_service
 
+    def try_reloading(self):
+        """Replaces the middleware if the loader obtains a new service config.
+
+        Returns:
+          bool: True if the middleware was replaced
+        """
+        current = self.service_config
+        try:
+            config_id = None
+            latest_id = getattr(self.loader, u'latest_id', None)
+            if current is not None and latest_id is not None:
+                config_id = latest_id()
+                if config_id == current.id:
+                    return False
+            if config_id is not None:
+                # rather than a cached copy of the config that was the latest
+                a_service = self.loader.load(service_version=config_id)
+            else:
+                a_service = self.loader.load()
+            if not a_service:
+                raise ValueError(u'Service config loader returned bad value.')
+            if current is not None and a_service.id == current.id:
+                return False
+            backend = self._create_backend(a_service)
+        except (ServiceConfigException, ValueError):
+            _logger.exception(u'Failed to reload service config.')
+            return False
+
+        _logger.info(u'Reloaded service config %s, replacing %s',
+                     a_service.id, current.id if current else None)
+        self.service_config = a_service
+        self.wsgi_backend = backend
+        return True
+
+    def reload_periodically(self):
+        interval_secs = self.reload_interval.total_seconds()
+        while not self._stop_reloading.wait(interval_secs):
+            try:
+                self.try_reloading()
+            except Exception:  # pylint: disable=broad-except
+                # e.g, a transient network error; the current config remains usable
+                _logger.exception(u'Unexpected failure reloading service config.')
+
+    def stop_reloading(self):
+        """Stops the background thread from polling for new service configs."""
+        self._stop_reloading.set()
+
     def try_loading_in_thread(self):
         class LoadFailedException(Exception):
             pass
@@ -197,12 +393,19 @@ class ConfigFetchWrapper(object):
                 raise LoadFailedException
 
         _load_or_raise()
+        if self.reload_interval:
+            self.reload_periodically()
 
-    def launch_loading_thread(self):
+    def launch_loading_thread(self, target=None):
         if self.threading_failed:
             return
-        self.background_thread = client.create_thread(target=self.try_loading_in_thread)
+        if target is None:
+            target = self.try_loading_in_thread
+        self.background_thread = client.create_thread(target=target)
         try:
+            if self.reload_interval:
+                # it polls until the process exits
+                self.background_thread.daemon = True
             self.background_thread.start()
         except Exception:  # pylint: disable=broad-except
             _logger.exception(u'Failed to start service config loading background thread.')
@@ -213,10 +416,145 @@ def _next_operation_uuid():
     return uuid.uuid4().hex
 
 
+class OperationIdGenerator(object):
+    """Generates unique operation ids without reading ``os.urandom`` each time.
+
+    Each id is a random 64-bit prefix, drawn from :func:`uuid.uuid4` once per
+    process, followed by a 64-bit counter, so ids have the same form as
+    ``uuid.uuid4().hex`` and remain unique across processes and hosts.  A new
+    prefix is drawn in forked child processes.
+
+    Thread safe.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._prefix = None
+        self._counter = None
+
+    def __call__(self):
+        """Obtains the next operation id.
+
+        Returns:
+          string: a 32 character hex string
+        """
+        if self._pid != os.getpid():
+            self._reset()
+        return u'%s%016x' % (self._prefix, next(self._counter) & _COUNTER_MASK)
+
+    def _reset(self):
+        with self._lock:
+            pid = os.getpid()
+            if self._pid != pid:
+                self._prefix = uuid.uuid4().hex[:16]
+                self._counter = itertools.count()
+                self._pid = pid
+
+
+_COUNTER_MASK = (1 << 64) - 1
+_next_operation_id = OperationIdGenerator()
+
+
 def _request_method(environ):
     return environ.get(u'HTTP_X_HTTP_METHOD_OVERRIDE', environ[u'REQUEST_METHOD'])
 
 
+class RequestContext(object):
+    """Holds the values derived from a request that the middleware share.
+
+    It is created by the first middleware that needs it, and stored in the
+    WSGI environment so that the others reuse it.  Values are computed the
+    first time they are accessed.
+    """
+    # pylint: disable=too-few-public-methods
+
+    ENVIRON_KEY = u'google.api.request_context'
+
+    def __init__(self, environ):
+        self._environ = environ
+        self._http_method = None
+        self._parsed_uri = None
+        self._query_params = None
+        self._api_key_lookup = None
+
+    @classmethod
+    def of(cls, environ):
+        """Obtains the context stored in ``environ``, adding one if necessary.
+
+        Args:
+          environ (dict): a WSGI environment
+
+        Returns:
+          :class:`RequestContext`: the context of the request
+        """
+        context = environ.get(cls.ENVIRON_KEY)
+        if context is None:
+            context = cls(environ)
+            environ[cls.ENVIRON_KEY] = context
+        return context
+
+    @property
+    def http_method(self):
+        """The HTTP method of the request, taking any override into account."""
+        if self._http_method is None:
+            self._http_method = _request_method(self._environ)
+        return self._http_method
+
+    @property
+    def parsed_uri(self):
+        """The :class:`urlparse.ParseResult` of the request URI."""
+        if self._parsed_uri is None:
+            self._parsed_uri = urlparse.urlparse(
+                wsgiref.util.request_uri(self._environ))
+        return self._parsed_uri
+
+    @property
+    def query_params(self):
+        """The parsed query parameters, as a dict of lists of values."""
+        if self._query_params is None:
+            self._query_params = urlparse.parse_qs(
+                self._environ.get(u'QUERY_STRING', u''))
+        return self._query_params
+
+    def api_key(self, method_info):
+        """Finds the API key of the request.
+
+        Args:
+          method_info (:class:`endpoints_management.control.service.MethodInfo`):
+            the method being called, which determines where the key is sought
+
+        Returns:
+          string: the API key, or None if the request does not have one
+        """
+        lookup = self._api_key_lookup
+        if lookup is None or lookup[0] is not method_info:
+            api_key = _find_api_key_param(method_info, self.query_params)
+            if not api_key:
+                api_key = _find_api_key_header(method_info, self._environ)
+            if not api_key:
+                api_key = _find_default_api_key_param(self.query_params)
+            lookup = (method_info, api_key)
+            self._api_key_lookup = lookup
+        return lookup[1]
+
+    @property
+    def auth_token(self):
+        """The bearer token of the request, or None if it does not have one."""
+        auth_header = self._environ.get(u"HTTP_AUTHORIZATION")
+        if auth_header:
+            if auth_header.startswith(_BEARER_TOKEN_PREFIX):
+                return auth_header[_BEARER_TOKEN_PREFIX_LEN:]
+            return None
+
+        # Then try to read auth token from query.
+        if _ACCESS_TOKEN_PARAM_NAME in self.query_params:
+            auth_token, = self.query_params[_ACCESS_TOKEN_PARAM_NAME]
+            return auth_token
+        return None
+
+
 class EnvironmentMiddleware(object):
     """A WSGI middleware that sets related variables in the environment.
 
@@ -227,6 +565,10 @@ class EnvironmentMiddleware(object):
     - google.api.config.method_registry
     - google.api.config.reporting_rules
     - google.api.config.method_info
+
+    The method registry and reporting rules are restored from the snapshot
+    named by :data:`endpoints_management.control.snapshot.SNAPSHOT_VAR` when it
+    matches the service, and are otherwise derived from the service.
     """
     # pylint: disable=too-few-public-methods
 
@@ -255,6 +597,10 @@ class EnvironmentMiddleware(object):
         self._reporting_rules = reporting_rules
 
     def _configure(self):
+        configured = snapshot.restore_from_environment(self._service)
+        if configured is not None:
+            return configured
+
         registry = service.MethodRegistry(self._service)
         logs, metric_names, label_names = service.extract_report_spec(self._service)
         reporting_rules = report_request.ReportingRules.from_known_inputs(
@@ -269,9 +615,9 @@ class EnvironmentMiddleware(object):
         environ[self.SERVICE_NAME] = self._service.name
         environ[self.METHOD_REGISTRY] = self._method_registry
         environ[self.REPORTING_RULES] = self._reporting_rules
-        parsed_uri = urlparse.urlparse(wsgiref.util.request_uri(environ))
-        http_method = _request_method(environ)
-        method_info = self._method_registry.lookup(http_method, parsed_uri.path)
+        context = RequestContext.of(environ)
+        method_info = self._method_registry.lookup(context.http_method,
+                                                   context.parsed_uri.path)
         if method_info:
             environ[self.METHOD_INFO] = method_info
 
@@ -311,8 +657,10 @@ class Middleware(object):
                  application,
                  project_id,
                  control_client,
-                 next_operation_id=_next_operation_uuid,
-                 timer=datetime.utcnow):
+                 next_operation_id=_next_operation_id,
+                 timer=datetime.utcnow,
+                 latency_tracker=None,
+                 share_operation_id=False):
         """Initializes a new Middleware instance.
 
         Args:
@@ -321,12 +669,19 @@ class Middleware(object):
            control_client: the service control client instance
            next_operation_id (func): produces the next operation
            timer (func[[datetime.datetime]]): a func that obtains the current time
+           latency_tracker (:class:`endpoints_management.control.latency.LatencyTracker`):
+              if set, records the latency of each reported request
+           share_operation_id (bool): if True, the quota operation of a
+              request uses the id of its check operation, rather than a new one
            """
         self._application = application
         self._project_id = project_id
         self._control_client = control_client
         self._next_operation_id = next_operation_id
         self._timer = timer
+        self._latency_tracker = latency_tracker
+        self._share_operation_id = share_operation_id
+        _platform_detector.start()
 
     def __call__(self, environ, start_response):
         # pylint: disable=too-many-locals
@@ -341,8 +696,9 @@ class Middleware(object):
         latency_timer.start()
 
         # Determine if the request can proceed
-        http_method = _request_method(environ)
-        parsed_uri = urlparse.urlparse(wsgiref.util.request_uri(environ))
+        context = RequestContext.of(environ)
+        http_method = context.http_method
+        parsed_uri = context.parsed_uri
         app_info = _AppInfo()
         # TODO: determine if any of the more complex ways of getting the request size
         # (e.g) buffering and counting the wsgi input stream is more appropriate here
@@ -358,24 +714,24 @@ class Middleware(object):
         # Default to 0 for consumer project number to disable per-consumer
         # metric reporting if the check request doesn't return one.
         consumer_project_number = 0
-        check_info = self._create_check_info(method_info, parsed_uri, environ)
+        check_info = self._create_check_info(method_info, context, environ)
         if not check_info.api_key and not method_info.allow_unregistered_calls:
             _logger.debug(u"skipping %s, no api key was provided", parsed_uri)
             error_msg = self._handle_missing_api_key(app_info, start_response)
         else:
-            check_req = check_info.as_check_request()
-            _logger.debug(u'checking %s with %s', method_info, check_request)
-            check_resp = self._control_client.check(check_req)
+            _logger.debug(u'checking %s with %s', method_info, check_info)
+            check_resp = self._control_client.check_info(check_info)
             error_msg = self._handle_check_response(app_info, check_resp, start_response)
             if (check_resp and check_resp.checkInfo and
                     check_resp.checkInfo.consumerInfo):
                 consumer_project_number = (
                     check_resp.checkInfo.consumerInfo.projectNumber)
             if error_msg is None:
-                quota_info = self._create_quota_info(method_info, parsed_uri, environ)
-                if not quota_info.quota_info:
+                if not method_info.quota_info:
                     _logger.debug(u'no metric costs for this method')
                 else:
+                    quota_info = self._create_quota_info(
+                        method_info, context, environ, check_info)
                     quota_request = quota_info.as_allocate_quota_request()
                     quota_response = self._control_client.allocate_quota(quota_request)
                     error_msg = self._handle_quota_response(
@@ -447,7 +803,7 @@ class Middleware(object):
             operation_name=check_info.operation_name,
             backend_time=latency_timer.backend_time,
             overhead_time=latency_timer.overhead_time,
-            platform=platform,
+            platform=get_platform(),
             producer_project_id=self._project_id,
             protocol=report_request.ReportedProtocols.HTTP,
             request_size=app_info.request_size,
@@ -458,20 +814,14 @@ class Middleware(object):
             service_name=check_info.service_name,
             url=app_info.url
         )
+        if self._latency_tracker is not None:
+            self._latency_tracker.record(report_info)
         return report_info.as_report_request(reporting_rules, timer=self._timer)
 
-    def _get_api_key_info(self, method_info, parsed_uri, environ):
-        api_key = _find_api_key_param(method_info, parsed_uri)
-        if not api_key:
-            api_key = _find_api_key_header(method_info, environ)
-        if not api_key:
-            api_key = _find_default_api_key_param(parsed_uri)
-        return api_key
-
-    def _create_check_info(self, method_info, parsed_uri, environ):
+    def _create_check_info(self, method_info, context, environ):
         service_name = environ.get(EnvironmentMiddleware.SERVICE_NAME)
         operation_id = self._next_operation_id()
-        api_key = self._get_api_key_info(method_info, parsed_uri, environ)
+        api_key = context.api_key(method_info)
 
         check_info = check_request.Info(
             android_cert_fingerprint=environ.get('HTTP_X_ANDROID_CERT', ''),
@@ -488,10 +838,13 @@ class Middleware(object):
         )
         return check_info
 
-    def _create_quota_info(self, method_info, parsed_uri, environ):
+    def _create_quota_info(self, method_info, context, environ, check_info):
         service_name = environ.get(EnvironmentMiddleware.SERVICE_NAME)
-        operation_id = self._next_operation_id()
-        api_key = self._get_api_key_info(method_info, parsed_uri, environ)
+        if self._share_operation_id:
+            operation_id = check_info.operation_id
+        else:
+            operation_id = self._next_operation_id()
+        api_key = context.api_key(method_info)
         service = environ.get(EnvironmentMiddleware.SERVICE)
 
         return quota_request.Info(
@@ -605,12 +958,11 @@ class _LatencyTimer(object):
         return None
 
 
-def _find_api_key_param(info, parsed_uri):
+def _find_api_key_param(info, param_dict):
     params = info.api_key_url_query_params
     if not params:
         return None
 
-    param_dict = urlparse.parse_qs(parsed_uri.query)
     if not param_dict:
         return None
 
@@ -627,8 +979,7 @@ def _find_api_key_param(info, parsed_uri):
 _DEFAULT_API_KEYS = (u'key', u'api_key')
 
 
-def _find_default_api_key_param(parsed_uri):
-    param_dict = urlparse.parse_qs(parsed_uri.query)
+def _find_default_api_key_param(param_dict):
     if not param_dict:
         return None
 
@@ -683,37 +1034,62 @@ def _create_authenticator(a_service):
         issuers_to_provider_ids[issuer] = provider.id
 
     key_uri_supplier = suppliers.KeyUriSupplier(issuer_uri_configs)
-    jwks_supplier = suppliers.JwksSupplier(key_uri_supplier)
+    jwks_supplier = suppliers.JwksSupplier(key_uri_supplier,
+                                           refresh_in_background=True)
     authenticator = tokens.Authenticator(issuers_to_provider_ids, jwks_supplier)
     return authenticator
 
 
+_request_local = threading.local()  # pylint: disable=invalid-name
+
+
+def get_user_info():
+    """Obtains the authentication result of the request being handled.
+
+    Returns:
+      :class:`endpoints_management.auth.tokens.UserInfo`: the user info of
+        the request that :class:`AuthenticationMiddleware` is handling on the
+        current thread, or None if the request was not authenticated
+    """
+    return getattr(_request_local, u'user_info', None)
+
+
 class AuthenticationMiddleware(object):
     """A WSGI middleware that does authentication checks for incoming
     requests.
 
-    In environments where os.environ is replaced with a request-local and
-    thread-independent copy (e.g. Google Appengine), authentication result is
-    added to os.environ so that the wrapped application can make use of the
-    authentication result.
+    The authentication result is added to the WSGI environ, and is available
+    from :func:`get_user_info` while the wrapped application handles the
+    request.
+
+    For compatibility with environments where os.environ is replaced with a
+    request-local and thread-independent copy (e.g. Google Appengine), the
+    authentication result can also be added to os.environ.
     """
     # pylint: disable=too-few-public-methods
 
     USER_INFO = u"google.api.auth.user_info"
 
-    def __init__(self, application, authenticator):
+    def __init__(self, application, authenticator, use_os_environ=None):
         """Initializes an authentication middleware instance.
 
         Args:
           application: a WSGI application to be wrapped
           authenticator (:class:`google.auth.tokens.Authenticator`): an
             authenticator that authenticates incoming requests
+          use_os_environ (bool): whether to add the authentication result to
+            os.environ; by default, it's added only if os.environ has been
+            replaced with a request-local copy
         """
         if not isinstance(authenticator, tokens.Authenticator):
             raise ValueError(u"Invalid authenticator")
 
         self._application = application
         self._authenticator = authenticator
+        if use_os_environ is None:
+            # pylint: disable=protected-access
+            use_os_environ = not isinstance(os.environ, os._Environ)
+        self._use_os_environ = use_os_environ
 
     def __call__(self, environ, start_response):
         method_info = environ.get(EnvironmentMiddleware.METHOD_INFO)
@@ -722,7 +1098,7 @@ class AuthenticationMiddleware(object):
             _logger.debug(u"authentication is not configured")
             return self._application(environ, start_response)
 
-        auth_token = _extract_auth_token(environ)
+        auth_token = RequestContext.of(environ).auth_token
         user_info = None
         if not auth_token:
             _logger.debug(u"No auth token is attached to the request")
@@ -737,11 +1113,17 @@ class AuthenticationMiddleware(object):
                               u"will not be able to retrieve user info", exc_info=True)
 
         environ[self.USER_INFO] = user_info
+        _request_local.user_info = user_info
+        try:
+            if self._use_os_environ:
+                return self._call_with_os_environ(user_info, environ,
+                                                  start_response)
+            return self._application(environ, start_response)
+        finally:
+            _request_local.user_info = None
 
-        # pylint: disable=protected-access
-        if user_info and not isinstance(os.environ, os._Environ):
-            # Set user info into os.environ only if os.environ is replaced
-            # with a request-local copy
+    def _call_with_os_environ(self, user_info, environ, start_response):
+        if user_info:
             os.environ[self.USER_INFO] = user_info
 
         response = self._application(environ, start_response)
@@ -756,18 +1138,3 @@ class AuthenticationMiddleware(object):
 _ACCESS_TOKEN_PARAM_NAME = u"access_token"
 _BEARER_TOKEN_PREFIX = u"Bearer "
 _BEARER_TOKEN_PREFIX_LEN = len(_BEARER_TOKEN_PREFIX)
-
-
-def _extract_auth_token(environ):
-    # First try to extract auth token from HTTP authorization header.
-    auth_header = environ.get(u"HTTP_AUTHORIZATION")
-    if auth_header:
-        if auth_header.startswith(_BEARER_TOKEN_PREFIX):
-            return auth_header[_BEARER_TOKEN_PREFIX_LEN:]
-        return
-
-    # Then try to read auth token from query.
-    parameters = urlparse.parse_qs(environ.get(u"QUERY_STRING", u""))
-    if _ACCESS_TOKEN_PARAM_NAME in parameters:
-        auth_token, = parameters[_ACCESS_TOKEN_PARAM_NAME]
-        return auth_token
@@ -39,17 +39,22 @@ install_requires = [
     "pylru>=1.0.9,<2.0",
     "pyjwkest>=1.0.0,<=1.0.9",
     "requests>=2.10.0,<3.0",
-    'strict-rfc3339>=0.7,<0.8',
     'urllib3>=1.16,<2.0',
     'webob>=1.7.4',
 ]
 
+extras_require = {
+    # verifies auth token signatures natively
+    'cryptography': ['cryptography>=2.1'],
+}
+
 tests_require = [
     "flask>=0.11.1",
     "httmock>=1.2",
     "mock>=2.0",
     "pytest",
-    "pytest-cov"
+    "pytest-cov",
+    "strict-rfc3339>=0.7,<0.8",
 ]
 
 setup(
@@ -74,6 +79,7 @@ setup(
         'Programming Language :: Python :: Implementation :: CPython',
     ],
     install_requires=install_requires,
+    extras_require=extras_require,
     setup_requires=["pytest_runner"],
     tests_require=tests_require,
     test_suite="tests"
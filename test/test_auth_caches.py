@@ -0,0 +1,318 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+
+import mock
+import random
+import threading
+import time
+import unittest
+
+from dogpile import cache
+
+from endpoints_management.auth import caches
+
+
+class _Timer(object):
+
+    def __init__(self):
+        self.now = 100
+
+    def __call__(self):
+        return self.now
+
+
+class ExpiringLruCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self._timer = _Timer()
+
+    def test_get_returns_none_for_missing_keys(self):
+        cache = caches.ExpiringLruCache(timer=self._timer)
+        self.assertIsNone(cache.get(u"missing"))
+
+    def test_entries_expire_at_their_own_time(self):
+        cache = caches.ExpiringLruCache(timer=self._timer)
+        cache.set(u"soon", 1, 110)
+        cache.set(u"later", 2, 200)
+        self._timer.now = 109
+        self.assertEqual(1, cache.get(u"soon"))
+        self._timer.now = 110
+        self.assertIsNone(cache.get(u"soon"))
+        self.assertEqual(2, cache.get(u"later"))
+        self.assertEqual(1, len(cache))
+
+    def test_evicts_the_least_recently_used_beyond_capacity(self):
+        cache = caches.ExpiringLruCache(capacity=2, timer=self._timer)
+        cache.set(u"a", 1, 200)
+        cache.set(u"b", 2, 200)
+        cache.get(u"a")
+        cache.set(u"c", 3, 200)
+        self.assertEqual(1, cache.get(u"a"))
+        self.assertIsNone(cache.get(u"b"))
+        self.assertEqual(3, cache.get(u"c"))
+
+    def test_evicts_the_least_recently_used_beyond_max_size(self):
+        cache = caches.ExpiringLruCache(max_size=10, timer=self._timer)
+        cache.set(u"a", 1, 200, size=4)
+        cache.set(u"b", 2, 200, size=4)
+        self.assertEqual(8, cache.size)
+        cache.set(u"c", 3, 200, size=4)
+        self.assertIsNone(cache.get(u"a"))
+        self.assertEqual(8, cache.size)
+
+    def test_replacing_and_deleting_entries_updates_the_size(self):
+        cache = caches.ExpiringLruCache(timer=self._timer)
+        cache.set(u"a", 1, 200, size=4)
+        cache.set(u"a", 2, 200, size=6)
+        self.assertEqual(6, cache.size)
+        self.assertEqual(2, cache.get(u"a"))
+        cache.delete(u"a")
+        self.assertEqual(0, cache.size)
+        self.assertEqual(0, len(cache))
+
+    def test_rejects_bad_capacities(self):
+        with self.assertRaises(ValueError):
+            caches.ExpiringLruCache(capacity=0)
+        with self.assertRaises(ValueError):
+            caches.ExpiringLruCache(num_shards=0)
+
+    def test_counts_hits_misses_and_evictions(self):
+        cache = caches.ExpiringLruCache(capacity=2, timer=self._timer)
+        cache.set(u"a", 1, 110)
+        cache.set(u"b", 2, 200)
+        cache.get(u"a")
+        cache.get(u"missing")
+        self._timer.now = 110
+        cache.get(u"a")  # expired
+        cache.set(u"c", 3, 200)
+        cache.set(u"d", 4, 200)
+        self.assertEqual({u"hits": 1, u"misses": 2, u"evictions": 1},
+                         cache.stats)
+
+    def test_spreads_capacity_and_size_over_the_shards(self):
+        cache = caches.ExpiringLruCache(capacity=20, max_size=40,
+                                        timer=self._timer, num_shards=4)
+        for i in range(100):
+            cache.set(i, i, 200, size=1)
+        self.assertEqual(20, len(cache))
+        self.assertEqual(20, cache.size)
+        for i in range(100, 200):
+            cache.set(i, i, 200, size=4)
+        self.assertLessEqual(cache.size, 40)
+
+    def test_concurrent_use(self):
+        capacity = 200
+        cache = caches.ExpiringLruCache(capacity=capacity, timer=self._timer,
+                                        num_shards=8)
+        num_threads = 8
+        num_gets = 5000
+        errors = []
+
+        def run(seed):
+            rnd = random.Random(seed)
+            try:
+                for _ in range(num_gets):
+                    key = rnd.randint(0, 4 * capacity)
+                    if cache.get(key) is None:
+                        cache.set(key, key, rnd.randint(90, 110), size=1)
+                    else:
+                        cache.delete(rnd.randint(0, 4 * capacity))
+            except Exception as e:  # pylint: disable=broad-except
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i,))
+                   for i in range(num_threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual([], errors)
+        self.assertLessEqual(len(cache), capacity)
+        self.assertEqual(len(cache), cache.size)
+        stats = cache.stats
+        self.assertEqual(num_threads * num_gets,
+                         stats[u"hits"] + stats[u"misses"])
+
+
+class LruBackendTest(unittest.TestCase):
+
+    def test_is_registered_for_the_lru_cache_region(self):
+        region = cache.make_region().configure(u"lru_cache",
+                                               arguments={u"capacity": 10})
+        creator_calls = []
+
+        def creator():
+            creator_calls.append(1)
+            return u"value"
+
+        self.assertEqual(u"value", region.get_or_create(u"key", creator))
+        self.assertEqual(u"value", region.get_or_create(u"key", creator))
+        self.assertEqual(1, len(creator_calls))
+        self.assertEqual(1, region.backend.stats[u"hits"])
+
+    def test_get_set_and_delete(self):
+        backend = caches.LruBackend({})
+        self.assertIs(cache.api.NO_VALUE, backend.get(u"a"))
+        backend.set_multi({u"a": 1, u"b": 2})
+        self.assertEqual([1, 2], backend.get_multi([u"a", u"b"]))
+        backend.delete_multi([u"a", u"b"])
+        self.assertEqual(0, len(backend))
+        self.assertEqual({u"hits": 2, u"misses": 1, u"evictions": 0},
+                         backend.stats)
+
+    def test_evicts_the_least_recently_used_beyond_capacity(self):
+        backend = caches.LruBackend({u"capacity": 2, u"num_shards": 1})
+        backend.set(u"a", 1)
+        backend.set(u"b", 2)
+        backend.get(u"a")
+        backend.set(u"c", 3)
+        self.assertIs(cache.api.NO_VALUE, backend.get(u"b"))
+        self.assertEqual(1, backend.get(u"a"))
+        self.assertEqual(1, backend.stats[u"evictions"])
+
+    def test_evicts_beyond_max_size(self):
+        backend = caches.LruBackend({u"max_size": 100, u"num_shards": 1,
+                                     u"sizer": lambda key, value: len(value)})
+        backend.set(u"a", u"x" * 60)
+        backend.set(u"b", u"x" * 60)
+        self.assertIs(cache.api.NO_VALUE, backend.get(u"a"))
+        self.assertEqual(1, len(backend))
+
+    def test_spreads_capacity_over_the_shards(self):
+        backend = caches.LruBackend({u"capacity": 20, u"num_shards": 4})
+        for i in range(100):
+            backend.set(i, i)
+        self.assertEqual(20, len(backend))
+
+    def test_rejects_bad_options(self):
+        with self.assertRaises(ValueError):
+            caches.LruBackend({u"capacity": 0})
+        with self.assertRaises(ValueError):
+            caches.LruBackend({u"num_shards": 0})
+
+    def test_concurrent_use(self):
+        capacity = 200
+        backend = caches.LruBackend({u"capacity": capacity})
+        num_threads = 8
+        num_gets = 5000
+        errors = []
+
+        def run(seed):
+            rnd = random.Random(seed)
+            try:
+                for _ in range(num_gets):
+                    key = rnd.randint(0, 4 * capacity)
+                    if backend.get(key) is cache.api.NO_VALUE:
+                        backend.set(key, key)
+                    else:
+                        backend.delete(rnd.randint(0, 4 * capacity))
+            except Exception as e:  # pylint: disable=broad-except
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i,))
+                   for i in range(num_threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual([], errors)
+        self.assertLessEqual(len(backend), capacity)
+        stats = backend.stats
+        self.assertEqual(num_threads * num_gets,
+                         stats[u"hits"] + stats[u"misses"])
+        self.assertGreater(stats[u"evictions"], 0)
+
+
+class _WaitCountingEvent(object):
+    """An event that counts the threads that wait for it."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self.waiters = 0
+
+    def wait(self):
+        with self._lock:
+            self.waiters += 1
+        self._event.wait()
+
+    def set(self):
+        self._event.set()
+
+
+class InFlightTest(unittest.TestCase):
+    _NUM_WAITERS = 4
+
+    def setUp(self):
+        self._in_flight = caches.InFlight()
+        self._events = []
+        patcher = mock.patch.object(caches, u"_Call", self._create_call)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _create_call(self, call_class=caches._Call):
+        call = call_class()
+        call.done = _WaitCountingEvent()
+        self._events.append(call.done)
+        return call
+
+    def _do_concurrently(self, func):
+        """Calls `func` via InFlight while other threads wait for the call."""
+        outcomes = []
+
+        def do(a_func):
+            try:
+                outcomes.append(self._in_flight.do(u"key", a_func))
+            except Exception as error:  # pylint: disable=broad-except
+                outcomes.append(error)
+
+        waiters = [threading.Thread(target=do, args=(func,))
+                   for _ in range(self._NUM_WAITERS)]
+
+        def start_waiters_then_call():
+            for waiter in waiters:
+                waiter.start()
+            deadline = time.time() + 5
+            while (self._events[0].waiters < self._NUM_WAITERS and
+                   time.time() < deadline):
+                time.sleep(0.001)
+            return func()
+
+        do(start_waiters_then_call)
+        for waiter in waiters:
+            waiter.join()
+        return outcomes
+
+    def test_do_shares_the_result(self):
+        func = mock.MagicMock(return_value=u"result")
+        outcomes = self._do_concurrently(func)
+        self.assertEqual([u"result"] * (self._NUM_WAITERS + 1), outcomes)
+        self.assertEqual(1, func.call_count)
+
+    def test_do_shares_the_error(self):
+        error = ValueError(u"failed")
+        func = mock.MagicMock(side_effect=error)
+        outcomes = self._do_concurrently(func)
+        self.assertEqual([error] * (self._NUM_WAITERS + 1), outcomes)
+        self.assertEqual(1, func.call_count)
+
+    def test_do_calls_again_once_a_call_completes(self):
+        func = mock.MagicMock(side_effect=[u"first", u"second"])
+        self.assertEqual(u"first", self._in_flight.do(u"key", func))
+        self.assertEqual(u"second", self._in_flight.do(u"key", func))
+        self.assertEqual({}, self._in_flight._calls)
@@ -311,6 +311,49 @@ class TestCachingAggregator(unittest2.TestCase):
         self.timer.tick() # now past expiry
         expect(len(agg.flush())).to(equal(1)) # got the cached check request
 
+    def test_should_find_responses_cached_for_requests_using_infos(self):
+        info = _make_test_info(self.SERVICE_NAME)
+        req = info.as_check_request(timer=self.timer)
+        fake_response = sc_messages.CheckResponse(
+            operationId=self.FAKE_OPERATION_ID)
+        agg = self.agg
+        expect(agg.check_info(info)).to(be_none)
+        agg.add_response(req, fake_response)
+        expect(agg.check_info(info)).to(equal(fake_response))
+        other_info = info._replace(referer=u'another_referer')
+        expect(agg.check_info(other_info)).to(be_none)
+
+    def test_should_fail_check_info_if_service_name_does_not_match(self):
+        info = _make_test_info(self.SERVICE_NAME + u'-will-not-match')
+        testf = lambda: self.agg.check_info(info)
+        expect(testf).to(raise_error(ValueError))
+        testf = lambda: self.agg.check_info(None)
+        expect(testf).to(raise_error(ValueError))
+
+    def test_does_flush_requests_that_have_been_updated_using_infos(self):
+        info = _make_test_info(self.SERVICE_NAME)
+        req = info.as_check_request(timer=self.timer)
+        fake_response = sc_messages.CheckResponse(
+            operationId=self.FAKE_OPERATION_ID
+        )
+        agg = self.agg
+        agg.add_response(req, fake_response)
+        expect(agg.check_info(info)).to(equal(fake_response))
+        self.timer.tick()
+        self.timer.tick() # now past the flush interval, a refresh is due
+        expect(agg.check_info(info)).to(be_none)
+        expect(len(agg.flush())).to(equal(0)) # nothing expired
+        self.timer.tick()
+        self.timer.tick() # now past expiry
+        flushed = agg.flush()
+        expect(len(flushed)).to(equal(1)) # got the cached check request
+        op = flushed[0].checkRequest.operation
+        expect(check_request.sign(flushed[0].checkRequest)).to(
+            equal(info.signature()))
+        expect(op.startTime).to(equal(_START_OF_EPOCH))
+        expect(op.endTime).to(equal(timestamp.to_rfc3339(
+            datetime.datetime(1970, 1, 1, 0, 0, 2))))
+
     def test_should_clear_requests(self):
         req = _make_test_request(self.SERVICE_NAME)
         fake_response = sc_messages.CheckResponse(
@@ -343,6 +386,17 @@ def _make_test_request(service_name, importance=None):
         checkRequest=check_request)
 
 
+def _make_test_info(service_name):
+    return check_request.Info(
+        api_key=u'an_api_key',
+        api_key_valid=True,
+        client_ip=u'127.0.0.1',
+        operation_id=u'an_op_id',
+        operation_name=u'an_op_name',
+        referer=u'a_referer',
+        service_name=service_name)
+
+
 _WANTED_USER_AGENT = label_descriptor.USER_AGENT
 _WANTED_SERVICE_AGENT = label_descriptor.SERVICE_AGENT
 _START_OF_EPOCH = timestamp.to_rfc3339(datetime.datetime(1970, 1, 1, 0, 0, 0))
@@ -448,6 +502,22 @@ class TestInfo(unittest2.TestCase):
             expect(got.checkRequest.operation).to(equal(want))
             expect(got.serviceName).to(equal(_TEST_SERVICE_NAME))
 
+    def test_should_sign_like_the_converted_check_request(self):
+        timer = _DateTimeTimer()
+        for info, want in _INFO_TESTS:
+            req = info.as_check_request(timer=timer)
+            if want.consumerId is None:
+                testf = lambda: info.signature()
+                expect(testf).to(raise_error(ValueError))
+            else:
+                expect(info.signature()).to(
+                    equal(check_request.sign(req.checkRequest)))
+
+    def test_should_fail_to_sign_an_incomplete_info(self):
+        for info in _INCOMPLETE_INFO_TESTS:
+            testf = lambda: info.signature()
+            expect(testf).to(raise_error(ValueError))
+
     def test_should_fail_as_check_request_on_incomplete_info(self):
         timer = _DateTimeTimer()
         for info in _INCOMPLETE_INFO_TESTS:
@@ -152,14 +152,17 @@ def _make_dummy_quota_request(project_id, service_name):
     return info.as_allocate_quota_request()
 
 
-def _make_dummy_check_request(project_id, service_name):
-    info = check_request.Info(
+def _make_dummy_check_info(project_id, service_name):
+    return check_request.Info(
         consumer_project_id=project_id,
         operation_id=u'an_op_id',
         operation_name=u'an_op_name',
         referer=u'a_referer',
         service_name=service_name)
-    return info.as_check_request()
+
+
+def _make_dummy_check_request(project_id, service_name):
+    return _make_dummy_check_info(project_id, service_name).as_check_request()
 
 
 class TestClientStartAndStop(unittest2.TestCase):
@@ -266,6 +269,31 @@ class TestClientCheck(unittest2.TestCase):
         self._mock_transport.services.Check.side_effect = exceptions.Error()
         expect(self._subject.check(dummy_request)).to(be_none)
 
+    @mock.patch(u"endpoints_management.control.client._THREAD_CLASS", spec=True)
+    def test_should_send_the_request_for_an_info_if_not_cached(self, dummy_thread_class):
+        self._subject.start()
+        info = _make_dummy_check_info(self.PROJECT_ID, self.SERVICE_NAME)
+        self._subject.check_info(info)
+        expect(self._mock_transport.services.Check.called).to(be_true)
+        req = self._mock_transport.services.Check.call_args[0][0]
+        expect(req.checkRequest.operation.operationId).to(
+            equal(info.operation_id))
+
+    @mock.patch(u"endpoints_management.control.client._THREAD_CLASS", spec=True)
+    def test_should_not_send_the_request_for_an_info_if_cached(self, dummy_thread_class):
+        t = self._mock_transport
+        self._subject.start()
+        info = _make_dummy_check_info(self.PROJECT_ID, self.SERVICE_NAME)
+        dummy_response = sc_messages.CheckResponse(
+            operationId=info.operation_id)
+        t.services.Check.return_value = dummy_response
+        expect(self._subject.check_info(info)).to(equal(dummy_response))
+        t.reset_mock()
+        expect(self._subject.check_info(info)).to(equal(dummy_response))
+        expect(self._subject.check(info.as_check_request())).to(
+            equal(dummy_response))
+        expect(t.services.Check.called).to(be_false)
+
 
 class TestClientQuota(unittest2.TestCase):
     SERVICE_NAME = u'quota'
@@ -15,8 +15,9 @@
 from __future__ import absolute_import
 
 import sys
+import mock
 import unittest2
-from expects import expect, equal, raise_error
+from expects import be_none, expect, equal, raise_error
 
 from endpoints_management.control import distribution, sc_messages
 
@@ -203,3 +204,199 @@ class TestMerge(unittest2.TestCase):
             want = [x + y for (x,y) in zip(d1_start, d2_start)]
             distribution.merge(d1, d2)
             expect(d2.bucketCounts).to(equal(want))
+
+
+_MAKE_DIST_FUNCS = (
+    _make_explicit_dist, _make_exponential_dist, _make_linear_dist)
+
+
+class TestHistogram(unittest2.TestCase):
+
+    def test_should_fail_if_no_buckets_are_set(self):
+        testf = lambda: distribution.Histogram.from_distribution(
+            sc_messages.Distribution())
+        expect(testf).to(raise_error(ValueError))
+
+    def test_should_add_samples_like_add_sample(self):
+        for make_dist_func in _MAKE_DIST_FUNCS:
+            for t in _TEST_SAMPLES_AND_BUCKETS:
+                want = make_dist_func()
+                histogram = distribution.Histogram.from_distribution(
+                    make_dist_func())
+                for s in t[u'samples']:
+                    distribution.add_sample(s, want)
+                    histogram.add_sample(s)
+                expect(histogram.as_distribution()).to(equal(want))
+
+    def test_should_merge_distributions_like_merge(self):
+        for make_dist_func in _MAKE_DIST_FUNCS:
+            d1 = make_dist_func()
+            distribution.add_sample(_LOW_SAMPLE, d1)
+            d2 = make_dist_func()
+            distribution.add_sample(_HIGH_SAMPLE, d2)
+            distribution.add_sample(_OVERFLOW_SAMPLE, d2)
+            histogram = distribution.Histogram.from_distribution(d1)
+            histogram.add_distribution(d2)
+            distribution.merge(d1, d2)
+            expect(histogram.as_distribution()).to(equal(d2))
+
+    def test_should_convert_an_empty_instance_to_an_empty_distribution(self):
+        for make_dist_func in _MAKE_DIST_FUNCS:
+            want = make_dist_func()
+            got = distribution.Histogram.from_distribution(want)
+            expect(got.as_distribution()).to(equal(want))
+
+    def test_should_fail_on_dissimilar_bucket_options(self):
+        histogram = distribution.Histogram.from_distribution(
+            _make_explicit_dist())
+        for other in (_make_linear_dist(), _make_exponential_dist(),
+                      distribution.create_explicit([0.1, 0.3])):
+            testf = lambda: histogram.add_distribution(other)
+            expect(testf).to(raise_error(ValueError))
+
+
+def _expect_dists_nearly_equal(test_case, got, want):
+    expect(got.bucketCounts).to(equal(want.bucketCounts))
+    expect(got.count).to(equal(want.count))
+    expect(got.minimum).to(equal(want.minimum))
+    expect(got.maximum).to(equal(want.maximum))
+    test_case.assertAlmostEqual(got.mean, want.mean)
+    test_case.assertAlmostEqual(got.sumOfSquaredDeviation,
+                                want.sumOfSquaredDeviation,
+                                delta=1e-9 * max(1, want.sumOfSquaredDeviation))
+
+
+class TestAddSamples(unittest2.TestCase):
+
+    def test_should_fail_if_no_buckets_are_set(self):
+        testf = lambda: distribution.add_samples([_LOW_SAMPLE],
+                                                 sc_messages.Distribution())
+        expect(testf).to(raise_error(ValueError))
+
+    def test_should_add_samples_like_add_sample(self):
+        self._expect_adds_samples_like_add_sample()
+
+    def test_should_add_samples_like_add_sample_without_numpy(self):
+        with mock.patch.object(distribution, u'numpy', None):
+            self._expect_adds_samples_like_add_sample()
+
+    def test_should_fall_back_if_numpy_is_not_installed(self):
+        with mock.patch.object(distribution, u'numpy', distribution._NOT_LOADED):
+            with mock.patch.dict(sys.modules, {u'numpy': None}):
+                self._expect_adds_samples_like_add_sample()
+                expect(distribution.numpy).to(be_none)
+
+    def test_should_ignore_an_empty_batch(self):
+        for make_dist_func in _MAKE_DIST_FUNCS:
+            d = make_dist_func()
+            distribution.add_samples([], d)
+            expect(d).to(equal(make_dist_func()))
+
+    def _expect_adds_samples_like_add_sample(self):
+        for make_dist_func in _MAKE_DIST_FUNCS:
+            for t in _TEST_SAMPLES_AND_BUCKETS:
+                want = make_dist_func()
+                got = make_dist_func()
+                for d in (want, got):
+                    distribution.add_sample(_HIGH_SAMPLE, d)
+                for s in t[u'samples']:
+                    distribution.add_sample(s, want)
+                distribution.add_samples(t[u'samples'], got)
+                _expect_dists_nearly_equal(self, got, want)
+
+
+class TestMergeMany(unittest2.TestCase):
+
+    def test_should_fail_if_there_is_nothing_to_merge(self):
+        testf = lambda: distribution.merge_many([])
+        expect(testf).to(raise_error(ValueError))
+
+    def test_should_fail_on_dissimilar_bucket_options(self):
+        testf = lambda: distribution.merge_many(
+            [_make_explicit_dist(), _make_linear_dist()])
+        expect(testf).to(raise_error(ValueError))
+
+    def test_should_fail_on_dissimilar_bucket_counts(self):
+        testf = lambda: distribution.merge_many(
+            [_make_linear_dist(), distribution.create_linear(4, 0.2, 0.1)])
+        expect(testf).to(raise_error(ValueError))
+
+    def test_should_merge_like_merge(self):
+        self._expect_merges_like_merge()
+
+    def test_should_merge_like_merge_without_numpy(self):
+        with mock.patch.object(distribution, u'numpy', None):
+            self._expect_merges_like_merge()
+
+    def _expect_merges_like_merge(self):
+        for make_dist_func in _MAKE_DIST_FUNCS:
+            dists = [make_dist_func() for _ in range(4)]
+            distribution.add_sample(_LOW_SAMPLE, dists[0])
+            distribution.add_samples([_HIGH_SAMPLE, _LOW_SAMPLE], dists[1])
+            distribution.add_sample(_OVERFLOW_SAMPLE, dists[3])
+            want = make_dist_func()
+            distribution.add_sample(_LOW_SAMPLE, want)
+            for d in dists[1:]:
+                distribution.merge(d, want)
+            got = distribution.merge_many(dists)
+            _expect_dists_nearly_equal(self, got, want)
+            expect(dists[2]).to(equal(make_dist_func()))
+
+
+class TestHistogramPercentile(unittest2.TestCase):
+
+    def test_should_fail_on_bad_fractions(self):
+        histogram = distribution.Histogram.from_distribution(
+            _make_linear_dist())
+        for bad in (-0.1, 1.1):
+            testf = lambda: histogram.percentile(bad)
+            expect(testf).to(raise_error(ValueError))
+
+    def test_should_return_none_when_empty(self):
+        for make_dist_func in _MAKE_DIST_FUNCS:
+            histogram = distribution.Histogram.from_distribution(
+                make_dist_func())
+            expect(histogram.percentile(0.5)).to(be_none)
+
+    def test_should_stay_within_the_samples(self):
+        samples = [_UNDERFLOW_SAMPLE, _LOW_SAMPLE, _HIGH_SAMPLE,
+                   _OVERFLOW_SAMPLE]
+        for make_dist_func in _MAKE_DIST_FUNCS:
+            histogram = distribution.Histogram.from_distribution(
+                make_dist_func())
+            for s in samples:
+                histogram.add_sample(s)
+            expect(histogram.percentile(0)).to(equal(_UNDERFLOW_SAMPLE))
+            expect(histogram.percentile(1)).to(equal(_OVERFLOW_SAMPLE))
+            prior = _UNDERFLOW_SAMPLE
+            for fraction in (0.1, 0.25, 0.5, 0.75, 0.9):
+                got = histogram.percentile(fraction)
+                self.assertTrue(prior <= got <= _OVERFLOW_SAMPLE)
+                prior = got
+
+    def test_should_interpolate_within_a_bucket(self):
+        histogram = distribution.Histogram.from_distribution(
+            distribution.create_linear(2, 1.0, 0.0))
+        for s in (0.0, 0.25, 0.5, 0.75, 1.0):
+            histogram.add_sample(s)
+        # 4 samples in [0, 1), 1 sample in [1, 2)
+        self.assertAlmostEqual(histogram.percentile(0.4), 0.5)
+        self.assertAlmostEqual(histogram.percentile(0.8), 1.0)
+
+    def test_should_add_histograms(self):
+        for make_dist_func in _MAKE_DIST_FUNCS:
+            want = distribution.Histogram.from_distribution(make_dist_func())
+            h1 = distribution.Histogram.from_distribution(make_dist_func())
+            h2 = distribution.Histogram.from_distribution(make_dist_func())
+            for s in (_LOW_SAMPLE, _HIGH_SAMPLE):
+                h1.add_sample(s)
+                want.add_sample(s)
+            h2.add_sample(_OVERFLOW_SAMPLE)
+            want.add_sample(_OVERFLOW_SAMPLE)
+            h1.add_histogram(h2)
+            _expect_dists_nearly_equal(
+                self, h1.as_distribution(), want.as_distribution())
+            testf = lambda: h1.add_histogram(
+                distribution.Histogram.from_distribution(
+                    distribution.create_linear(9, 0.2, 0.1)))
+            expect(testf).to(raise_error(ValueError))
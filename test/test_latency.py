@@ -0,0 +1,124 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+
+import datetime
+import unittest2
+from expects import be_none, equal, expect, raise_error
+
+from endpoints_management.control import latency, report_request
+
+
+class _DateTimeTimer(object):
+    def __init__(self, auto=False):
+        self.auto = auto
+        self.time = datetime.datetime(1970, 1, 1)
+
+    def __call__(self):
+        if self.auto:
+            self.tick()
+        return self.time
+
+    def tick(self):
+        self.time += datetime.timedelta(seconds=1)
+
+
+_METHOD = u'a.method'
+_OTHER_METHOD = u'another.method'
+_CONSUMER = u'project:a-consumer'
+_OTHER_CONSUMER = u'project:another-consumer'
+
+
+class TestLatencyTracker(unittest2.TestCase):
+
+    def setUp(self):
+        self.timer = _DateTimeTimer()
+        self.tracker = latency.LatencyTracker(
+            window=datetime.timedelta(seconds=10), num_slots=10,
+            timer=self.timer)
+
+    def test_should_fail_on_bad_construction_args(self):
+        testf = lambda: latency.LatencyTracker(window=datetime.timedelta(0))
+        expect(testf).to(raise_error(ValueError))
+        testf = lambda: latency.LatencyTracker(num_slots=0)
+        expect(testf).to(raise_error(ValueError))
+
+    def test_should_return_no_percentiles_when_nothing_is_tracked(self):
+        got = self.tracker.percentiles()
+        expect(sorted(got.keys())).to(equal(list(latency.DEFAULT_FRACTIONS)))
+        for value in got.values():
+            expect(value).to(be_none)
+
+    def test_should_estimate_percentiles_within_the_samples(self):
+        samples = [0.001 * i for i in range(1, 101)]
+        for s in samples:
+            self.tracker.add_sample(latency.LatencyKind.REQUEST, s,
+                                    method=_METHOD, consumer=_CONSUMER)
+        got = self.tracker.percentiles(fractions=(0, 0.5, 0.99, 1))
+        expect(got[0]).to(equal(min(samples)))
+        expect(got[1]).to(equal(max(samples)))
+        self.assertTrue(0.01 <= got[0.5] <= 0.1)
+        self.assertTrue(got[0.5] <= got[0.99] <= max(samples))
+
+    def test_should_filter_by_kind_method_and_consumer(self):
+        kind = latency.LatencyKind.REQUEST
+        self.tracker.add_sample(kind, 1.0, method=_METHOD, consumer=_CONSUMER)
+        self.tracker.add_sample(kind, 2.0, method=_OTHER_METHOD,
+                                consumer=_CONSUMER)
+        self.tracker.add_sample(kind, 3.0, method=_METHOD,
+                                consumer=_OTHER_CONSUMER)
+        self.tracker.add_sample(latency.LatencyKind.BACKEND, 4.0,
+                                method=_METHOD, consumer=_CONSUMER)
+        expect(self.tracker.histogram().count).to(equal(3))
+        expect(self.tracker.histogram(method=_METHOD).count).to(equal(2))
+        expect(self.tracker.histogram(consumer=_CONSUMER).count).to(equal(2))
+        got = self.tracker.histogram(method=_METHOD, consumer=_CONSUMER)
+        expect(got.count).to(equal(1))
+        expect(got.mean).to(equal(1.0))
+        got = self.tracker.histogram(kind=latency.LatencyKind.BACKEND)
+        expect(got.mean).to(equal(4.0))
+
+    def test_should_drop_samples_outside_the_window(self):
+        kind = latency.LatencyKind.REQUEST
+        self.tracker.add_sample(kind, 1.0)
+        for _ in range(5):
+            self.timer.tick()
+        self.tracker.add_sample(kind, 2.0)
+        expect(self.tracker.histogram().count).to(equal(2))
+        for _ in range(6):
+            self.timer.tick()
+        got = self.tracker.histogram()
+        expect(got.count).to(equal(1))
+        expect(got.mean).to(equal(2.0))
+        for _ in range(5):
+            self.timer.tick()
+        expect(self.tracker.histogram().count).to(equal(0))
+
+    def test_should_record_report_infos(self):
+        info = report_request.Info(
+            api_key=u'an_api_key',
+            api_key_valid=True,
+            operation_name=_METHOD,
+            request_time=datetime.timedelta(milliseconds=30),
+            backend_time=datetime.timedelta(milliseconds=20),
+            overhead_time=datetime.timedelta(milliseconds=10))
+        self.tracker.record(info)
+        for kind, want in ((latency.LatencyKind.REQUEST, 0.03),
+                           (latency.LatencyKind.BACKEND, 0.02),
+                           (latency.LatencyKind.OVERHEAD, 0.01)):
+            got = self.tracker.histogram(kind=kind, method=_METHOD,
+                                         consumer=u'api_key:an_api_key')
+            expect(got.count).to(equal(1))
+            expect(got.mean).to(equal(want))
@@ -249,7 +249,7 @@ class TestConsumerTotalLatencies(KnownMetricsBase, unittest2.TestCase):
     SUBJECT = _KNOWN.CONSUMER_TOTAL_LATENCIES
     WANTED_DISTRIBUTION = _wanted_distribution_with_sample(
         KnownMetricsBase.GIVEN_INFO.request_time.seconds,
-        *metric_descriptor._TIME_DISTRIBUTION_ARGS)
+        *metric_descriptor.TIME_DISTRIBUTION_ARGS)
     WANTED_ADDED_METRICS = sc_messages.MetricValueSet(
         metricName=SUBJECT.metric_name,
         metricValues=[metric_value.create(distributionValue=WANTED_DISTRIBUTION)])
@@ -260,7 +260,7 @@ class TestProducerByConsumerTotalLatencies(KnownMetricsBase,
     SUBJECT = _KNOWN.PRODUCER_BY_CONSUMER_TOTAL_LATENCIES
     WANTED_DISTRIBUTION = _wanted_distribution_with_sample(
         KnownMetricsBase.GIVEN_INFO.request_time.seconds,
-        *metric_descriptor._TIME_DISTRIBUTION_ARGS)
+        *metric_descriptor.TIME_DISTRIBUTION_ARGS)
     WANTED_ADDED_METRICS = sc_messages.MetricValueSet(
         metricName=SUBJECT.metric_name,
         metricValues=[metric_value.create(distributionValue=WANTED_DISTRIBUTION)])
@@ -275,7 +275,7 @@ class TestProducerTotalLatencies(KnownMetricsBase, unittest2.TestCase):
     SUBJECT = _KNOWN.PRODUCER_TOTAL_LATENCIES
     WANTED_DISTRIBUTION = _wanted_distribution_with_sample(
         KnownMetricsBase.GIVEN_INFO.request_time.seconds,
-        *metric_descriptor._TIME_DISTRIBUTION_ARGS)
+        *metric_descriptor.TIME_DISTRIBUTION_ARGS)
     WANTED_ADDED_METRICS = sc_messages.MetricValueSet(
         metricName=SUBJECT.metric_name,
         metricValues=[metric_value.create(distributionValue=WANTED_DISTRIBUTION)])
@@ -285,7 +285,7 @@ class TestConsumerRequestOverheadLatencies(KnownMetricsBase, unittest2.TestCase)
     SUBJECT = _KNOWN.CONSUMER_REQUEST_OVERHEAD_LATENCIES
     WANTED_DISTRIBUTION = _wanted_distribution_with_sample(
         KnownMetricsBase.GIVEN_INFO.overhead_time.seconds,
-        *metric_descriptor._TIME_DISTRIBUTION_ARGS)
+        *metric_descriptor.TIME_DISTRIBUTION_ARGS)
     WANTED_ADDED_METRICS = sc_messages.MetricValueSet(
         metricName=SUBJECT.metric_name,
         metricValues=[metric_value.create(distributionValue=WANTED_DISTRIBUTION)])
@@ -300,7 +300,7 @@ class TestProducerRequestOverheadLatencies(KnownMetricsBase, unittest2.TestCase)
     SUBJECT = _KNOWN.PRODUCER_REQUEST_OVERHEAD_LATENCIES
     WANTED_DISTRIBUTION = _wanted_distribution_with_sample(
         KnownMetricsBase.GIVEN_INFO.overhead_time.seconds,
-        *metric_descriptor._TIME_DISTRIBUTION_ARGS)
+        *metric_descriptor.TIME_DISTRIBUTION_ARGS)
     WANTED_ADDED_METRICS = sc_messages.MetricValueSet(
         metricName=SUBJECT.metric_name,
         metricValues=[metric_value.create(distributionValue=WANTED_DISTRIBUTION)])
@@ -310,7 +310,7 @@ class TestProducerByConsumerRequestOverheadLatencies(KnownMetricsBase, unittest2
     SUBJECT = _KNOWN.PRODUCER_BY_CONSUMER_REQUEST_OVERHEAD_LATENCIES
     WANTED_DISTRIBUTION = _wanted_distribution_with_sample(
         KnownMetricsBase.GIVEN_INFO.overhead_time.seconds,
-        *metric_descriptor._TIME_DISTRIBUTION_ARGS)
+        *metric_descriptor.TIME_DISTRIBUTION_ARGS)
     WANTED_ADDED_METRICS = sc_messages.MetricValueSet(
         metricName=SUBJECT.metric_name,
         metricValues=[metric_value.create(distributionValue=WANTED_DISTRIBUTION)])
@@ -320,7 +320,7 @@ class TestConsumerBackendLatencies(KnownMetricsBase, unittest2.TestCase):
     SUBJECT = _KNOWN.CONSUMER_BACKEND_LATENCIES
     WANTED_DISTRIBUTION = _wanted_distribution_with_sample(
         KnownMetricsBase.GIVEN_INFO.backend_time.seconds,
-        *metric_descriptor._TIME_DISTRIBUTION_ARGS)
+        *metric_descriptor.TIME_DISTRIBUTION_ARGS)
     WANTED_ADDED_METRICS = sc_messages.MetricValueSet(
         metricName=SUBJECT.metric_name,
         metricValues=[metric_value.create(distributionValue=WANTED_DISTRIBUTION)])
@@ -335,7 +335,7 @@ class TestProducerBackendLatencies(KnownMetricsBase, unittest2.TestCase):
     SUBJECT = _KNOWN.PRODUCER_BACKEND_LATENCIES
     WANTED_DISTRIBUTION = _wanted_distribution_with_sample(
         KnownMetricsBase.GIVEN_INFO.backend_time.seconds,
-        *metric_descriptor._TIME_DISTRIBUTION_ARGS)
+        *metric_descriptor.TIME_DISTRIBUTION_ARGS)
     WANTED_ADDED_METRICS = sc_messages.MetricValueSet(
         metricName=SUBJECT.metric_name,
         metricValues=[metric_value.create(distributionValue=WANTED_DISTRIBUTION)])
@@ -345,7 +345,7 @@ class TestProducerByConsumerBackendLatencies(KnownMetricsBase, unittest2.TestCas
     SUBJECT = _KNOWN.PRODUCER_BY_CONSUMER_BACKEND_LATENCIES
     WANTED_DISTRIBUTION = _wanted_distribution_with_sample(
         KnownMetricsBase.GIVEN_INFO.backend_time.seconds,
-        *metric_descriptor._TIME_DISTRIBUTION_ARGS)
+        *metric_descriptor.TIME_DISTRIBUTION_ARGS)
     WANTED_ADDED_METRICS = sc_messages.MetricValueSet(
         metricName=SUBJECT.metric_name,
         metricValues=[metric_value.create(distributionValue=WANTED_DISTRIBUTION)])
@@ -170,3 +170,33 @@ class TestMerge(unittest2.TestCase):
         got = metric_value.merge(MetricKind.DELTA, late_starting,
                                  early_starting)
         expect(got.startTime).to(equal(early_starting.startTime))
+
+
+class TestMergeValues(unittest2.TestCase):
+    A_FLOAT_VALUE = 1.0
+    EARLY = TestMerge.EARLY
+    LATER = TestMerge.LATER
+
+    def test_should_fail_for_metric_values_with_different_types(self):
+        v = metric_value.create(doubleValue=self.A_FLOAT_VALUE)
+        changed = metric_value.create(int64Value=1)
+        for kind in (MetricKind.GAUGE, MetricKind.CUMULATIVE, MetricKind.DELTA):
+            testf = lambda: metric_value.merge_values(kind, v, changed)
+            expect(testf).to(raise_error(ValueError))
+
+    def test_should_combine_delta_values_ignoring_timestamps(self):
+        early = metric_value.create(doubleValue=self.A_FLOAT_VALUE,
+                                    startTime=self.EARLY, endTime=self.EARLY)
+        later = metric_value.create(doubleValue=self.A_FLOAT_VALUE,
+                                    startTime=self.LATER, endTime=self.LATER)
+        got = metric_value.merge_values(MetricKind.DELTA, early, later)
+        expect(got.doubleValue).to(equal(2 * self.A_FLOAT_VALUE))
+        expect(got.startTime).to(equal(self.LATER))
+        expect(got.endTime).to(equal(self.LATER))
+
+    def test_should_return_the_latest_for_non_deltas(self):
+        prior = metric_value.create(doubleValue=self.A_FLOAT_VALUE)
+        latest = metric_value.create(doubleValue=2 * self.A_FLOAT_VALUE)
+        for kind in (MetricKind.GAUGE, MetricKind.CUMULATIVE):
+            got = metric_value.merge_values(kind, prior, latest)
+            expect(got.doubleValue).to(equal(2 * self.A_FLOAT_VALUE))
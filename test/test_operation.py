@@ -18,8 +18,8 @@ import datetime
 import unittest2
 from expects import be_none, expect, equal, raise_error
 
-from endpoints_management.control import (metric_value, operation, sc_messages,
-                                          timestamp)
+from endpoints_management.control import (distribution, metric_value, operation,
+                                          sc_messages, timestamp)
 from endpoints_management.control import MetricKind
 
 _A_FLOAT_VALUE = 1.1
@@ -284,11 +284,117 @@ _TESTS = [
                 )
             ]
         )
+    },
+    {
+        u'description': u'merge the start and end times of delta metric values',
+        u'kinds': None,
+        u'initial': sc_messages.Operation(
+            startTime=_EARLY,
+            endTime=_LATER,
+            metricValueSets = [
+                sc_messages.MetricValueSet(
+                    metricName=u'some_floats',
+                    metricValues=[
+                        metric_value.create(
+                            labels=_TEST_LABELS,
+                            doubleValue=_A_FLOAT_VALUE,
+                            startTime=_EARLY,
+                            endTime=_LATER
+                        ),
+                    ]
+                ),
+            ]
+        ),
+        u'ops': [
+            sc_messages.Operation(
+                startTime=_REALLY_EARLY,
+                endTime=_LATER_STILL,
+                metricValueSets = [
+                    sc_messages.MetricValueSet(
+                        metricName=u'some_floats',
+                        metricValues=[
+                            metric_value.create(
+                                labels=_TEST_LABELS,
+                                doubleValue=_A_FLOAT_VALUE,
+                                startTime=_REALLY_EARLY,
+                                endTime=_EARLY
+                            ),
+                        ]
+                    ),
+                ]
+            ),
+            sc_messages.Operation(
+                startTime=_LATER,
+                endTime=_LATER,
+                metricValueSets = [
+                    sc_messages.MetricValueSet(
+                        metricName=u'some_floats',
+                        metricValues=[
+                            metric_value.create(
+                                labels=_TEST_LABELS,
+                                doubleValue=_A_FLOAT_VALUE,
+                                startTime=_LATER,
+                                endTime=_LATER_STILL
+                            ),
+                        ]
+                    ),
+                ]
+            ),
+        ],
+        u'want': sc_messages.Operation(
+            startTime=_REALLY_EARLY,
+            endTime=_LATER_STILL,
+            metricValueSets = [
+                sc_messages.MetricValueSet(
+                    metricName=u'some_floats',
+                    metricValues=[
+                        metric_value.create(
+                            labels=_TEST_LABELS,
+                            doubleValue=_A_FLOAT_VALUE * 3,
+                            startTime=_REALLY_EARLY,
+                            endTime=_LATER_STILL
+                        ),
+                    ]
+                ),
+            ]
+        )
     }
 ]
 
 class TestOperationAggregation(unittest2.TestCase):
 
+    def test_should_aggregate_delta_distributions(self):
+        samples = (0.5, 2.0, 30.0)
+        want = distribution.create_exponential(8, 10.0, 1.0)
+        ops = []
+        for s in samples:
+            distribution.add_sample(s, want)
+            d = distribution.create_exponential(8, 10.0, 1.0)
+            distribution.add_sample(s, d)
+            ops.append(sc_messages.Operation(
+                startTime=_EARLY,
+                endTime=_LATER,
+                metricValueSets = [
+                    sc_messages.MetricValueSet(
+                        metricName=u'some_sizes',
+                        metricValues=[
+                            metric_value.create(
+                                labels=_TEST_LABELS,
+                                distributionValue=d
+                            ),
+                        ]
+                    ),
+                ]
+            ))
+        agg = operation.Aggregator(ops[0])
+        for o in ops[1:]:
+            agg.add(o)
+        got = agg.as_operation()
+        expect(len(got.metricValueSets)).to(equal(1))
+        got_values = got.metricValueSets[0].metricValues
+        expect(len(got_values)).to(equal(1))
+        expect(got_values[0].distributionValue).to(equal(want))
+
     def test_should_aggregate_as_expected(self):
         for t in _TESTS:
             desc = t[u'description']
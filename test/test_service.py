@@ -301,6 +301,64 @@ def fake_is_metric_supported(metric_desc):
     return not metric_desc.name.startswith(_NOT_SUPPORTED_PREFIX)
 
 
+_NUM_SYNTHETIC_DESCRIPTORS = 2000
+
+
+def _synthetic_service(num_descriptors):
+    label = lambda key: sm_messages.LabelDescriptor(key=key)
+    indices = range(num_descriptors)
+    return sm_messages.Service(
+        name=u'synthetic',
+        monitoredResources=[
+            sm_messages.MonitoredResourceDescriptor(
+                type=u'resource%d' % i, labels=[label(u'resource/%d' % i)])
+            for i in indices],
+        logs=[
+            sm_messages.LogDescriptor(
+                name=u'log%d' % i, labels=[label(u'log/%d' % i)])
+            for i in indices],
+        metrics=[
+            sm_messages.MetricDescriptor(
+                name=u'metric%d' % i, labels=[label(u'metric/%d' % i)])
+            for i in indices],
+        logging=sm_messages.Logging(producerDestinations=[
+            sm_messages.LoggingDestination(
+                monitoredResource=u'resource%d' % i, logs=[u'log%d' % i])
+            for i in indices]),
+        monitoring=sm_messages.Monitoring(consumerDestinations=[
+            sm_messages.MonitoringDestination(
+                monitoredResource=u'resource%d' % i,
+                metrics=[u'metric%d' % i])
+            for i in indices]))
+
+
+class TestLargeServiceConfig(unittest2.TestCase):
+    # Descriptors are looked up by index; scanning them for each destination
+    # takes several seconds at this size
+
+    def test_should_extract_all_the_descriptors(self):
+        n = _NUM_SYNTHETIC_DESCRIPTORS
+        logs, metrics, labels = service.extract_report_spec(
+            _synthetic_service(n),
+            label_is_supported=fake_is_label_supported,
+            metric_is_supported=fake_is_metric_supported)
+        expect(len(logs)).to(equal(n))
+        expect(len(metrics)).to(equal(n))
+        expect(len(labels)).to(equal(3 * n))
+
+    def test_should_use_the_first_of_duplicate_descriptors(self):
+        subject = _synthetic_service(1)
+        subject.metrics.append(sm_messages.MetricDescriptor(
+            name=u'metric0', labels=[
+                sm_messages.LabelDescriptor(key=u'duplicate/label')]))
+        _, metrics, labels = service.extract_report_spec(
+            subject,
+            label_is_supported=fake_is_label_supported,
+            metric_is_supported=fake_is_metric_supported)
+        expect(metrics).to(equal([u'metric0']))
+        expect(u'metric/0' in labels).to(be_true)
+        expect(u'duplicate/label' in labels).to(be_false)
+
 _NO_NAME_SERVICE_CONFIG_TEST = """
 {
     "name": ""
@@ -685,9 +743,10 @@ class TestAuthenticationConfig(_JsonServiceBase, unittest2.TestCase):
         self.assertIsNotNone(auth_info)
         self.assertTrue(auth_info.is_provider_allowed(u"shelves-provider"))
         self.assertFalse(auth_info.is_provider_allowed(u"random-provider"))
-        self.assertEqual([u"aud1", u"aud2"],
+        self.assertEqual(frozenset([u"aud1", u"aud2"]),
                          auth_info.get_allowed_audiences(u"shelves-provider"))
-        self.assertEqual([], auth_info.get_allowed_audiences(u"random-provider"))
+        self.assertEqual(frozenset(),
+                         auth_info.get_allowed_audiences(u"random-provider"))
 
     def test_lookup_method_without_authentication(self):
         registry = self._get_registry()
@@ -17,12 +17,14 @@ import httmock
 import json
 import mock
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 
 from apitools.base.py import encoding
 from endpoints_management.config import service_config
-from endpoints_management.control import sm_messages
+from endpoints_management.control import service, sm_messages, wsgi
 from oauth2client import client
 
 class ServiceConfigFetchTest(unittest.TestCase):
@@ -191,3 +193,222 @@ class ServiceConfigFetchTest(unittest.TestCase):
         token = ServiceConfigFetchTest._ACCESS_TOKEN
         access_token = client.AccessTokenInfo(access_token=token, expires_in=None)
         default_credential.get_access_token.return_value = access_token
+
+
+class ServiceConfigCacheTest(unittest.TestCase):
+
+    _SERVICE_NAME = u"test_service_name"
+    _OLD_VERSION = u"2017-01-01r0"
+    _NEW_VERSION = u"2017-02-01r0"
+
+    _credentials = mock.MagicMock()
+    _get_http_client = mock.MagicMock()
+
+    def setUp(self):
+        os.environ[u"ENDPOINTS_SERVICE_NAME"] = self._SERVICE_NAME
+        os.environ.pop(u"ENDPOINTS_SERVICE_VERSION", None)
+        self._cache_dir = tempfile.mkdtemp()
+        self._http_client = mock.MagicMock()
+        ServiceConfigCacheTest._get_http_client.return_value = self._http_client
+        ServiceConfigCacheTest._credentials.get_application_default.return_value \
+            .create_scoped.return_value.get_access_token.return_value = \
+            client.AccessTokenInfo(access_token=u"token", expires_in=None)
+
+    def tearDown(self):
+        shutil.rmtree(self._cache_dir)
+
+    def _config_json(self, version):
+        return json.dumps({u"name": self._SERVICE_NAME, u"id": version})
+
+    def _respond_with(self, *versions):
+        responses = []
+        for version in versions:
+            response = mock.MagicMock()
+            response.status = 200
+            if version is None:
+                response.data = json.dumps({u"serviceConfigs": []})
+            elif isinstance(version, list):
+                response.data = json.dumps({u"serviceConfigs": [
+                    {u"name": self._SERVICE_NAME, u"id": v} for v in version]})
+            else:
+                response.data = self._config_json(version)
+            responses.append(response)
+        self._http_client.request.reset_mock()
+        self._http_client.request.side_effect = responses
+
+    @mock.patch(u"endpoints_management.config.service_config.client.GoogleCredentials",
+                _credentials)
+    @mock.patch(u"endpoints_management.config.service_config._get_http_client", _get_http_client)
+    def test_should_use_a_cached_version_without_fetching(self):
+        self._respond_with(self._OLD_VERSION)
+        fetched = service_config.fetch_service_config(
+            service_version=self._OLD_VERSION, cache_dir=self._cache_dir)
+        self.assertEqual(self._OLD_VERSION, fetched.id)
+
+        self._respond_with()
+        with mock.patch.object(service_config, u"_start_revalidation") as revalidate:
+            cached = service_config.fetch_service_config(
+                service_version=self._OLD_VERSION, cache_dir=self._cache_dir)
+            self.assertFalse(revalidate.called)
+        self.assertEqual(fetched, cached)
+        self.assertFalse(self._http_client.request.called)
+
+    @mock.patch(u"endpoints_management.config.service_config.client.GoogleCredentials",
+                _credentials)
+    @mock.patch(u"endpoints_management.config.service_config._get_http_client", _get_http_client)
+    def test_should_use_the_cache_dir_from_the_environment(self):
+        self._respond_with(self._OLD_VERSION)
+        with mock.patch.dict(os.environ, {
+                u"ENDPOINTS_SERVICE_CONFIG_CACHE_DIR": self._cache_dir}):
+            service_config.fetch_service_config(
+                service_version=self._OLD_VERSION)
+            self._respond_with()
+            cached = service_config.fetch_service_config(
+                service_version=self._OLD_VERSION)
+        self.assertEqual(self._OLD_VERSION, cached.id)
+
+    @mock.patch(u"endpoints_management.config.service_config.client.GoogleCredentials",
+                _credentials)
+    @mock.patch(u"endpoints_management.config.service_config._get_http_client", _get_http_client)
+    def test_should_use_the_cached_latest_version_and_revalidate_it(self):
+        self._respond_with([self._OLD_VERSION], self._OLD_VERSION)
+        fetched = service_config.fetch_service_config(cache_dir=self._cache_dir)
+        self.assertEqual(self._OLD_VERSION, fetched.id)
+
+        self._respond_with()
+        with mock.patch.object(service_config, u"_start_revalidation") as revalidate:
+            cached = service_config.fetch_service_config(
+                cache_dir=self._cache_dir)
+            revalidate.assert_called_once_with(
+                self._cache_dir, self._SERVICE_NAME, self._OLD_VERSION)
+        self.assertEqual(fetched, cached)
+        self.assertFalse(self._http_client.request.called)
+
+    @mock.patch(u"endpoints_management.config.service_config.client.GoogleCredentials",
+                _credentials)
+    @mock.patch(u"endpoints_management.config.service_config._get_http_client", _get_http_client)
+    @mock.patch.object(service_config, u"_start_revalidation")
+    def test_should_reload_a_newer_config_than_the_cached_latest(self, revalidate):
+        self._respond_with([self._OLD_VERSION], self._OLD_VERSION)
+        service_config.fetch_service_config(cache_dir=self._cache_dir)
+
+        with mock.patch.dict(os.environ,
+                             {u"ENDPOINTS_SERVICE_CONFIG_CACHE_DIR": self._cache_dir}):
+            self._respond_with()
+            wrapper = wsgi.ConfigFetchWrapper(
+                mock.MagicMock(), u"project-id", mock.MagicMock(),
+                loader=service.Loaders.FROM_SERVICE_MANAGEMENT,
+                disable_threading=True)
+            self.assertEqual(self._OLD_VERSION, wrapper.service_config.id)
+            self.assertEqual(1, revalidate.call_count)
+
+            # the cached latest config is stale
+            self._respond_with([self._NEW_VERSION, self._OLD_VERSION],
+                               self._NEW_VERSION)
+            self.assertTrue(wrapper.try_reloading())
+            self.assertEqual(self._NEW_VERSION, wrapper.service_config.id)
+            self.assertEqual(1, revalidate.call_count)
+
+            self._respond_with([self._NEW_VERSION])
+            self.assertFalse(wrapper.try_reloading())
+            self.assertEqual(1, self._http_client.request.call_count)
+
+    @mock.patch(u"endpoints_management.config.service_config.client.GoogleCredentials",
+                _credentials)
+    @mock.patch(u"endpoints_management.config.service_config._get_http_client", _get_http_client)
+    def test_should_revalidate_by_config_id(self):
+        self._respond_with([self._OLD_VERSION], self._OLD_VERSION)
+        service_config.fetch_service_config(cache_dir=self._cache_dir)
+
+        # unchanged, so only the list of configs is fetched
+        self._respond_with([self._OLD_VERSION])
+        self.assertIsNone(service_config._revalidate_cached_service_config(
+            self._cache_dir, self._SERVICE_NAME, self._OLD_VERSION))
+        self.assertEqual(1, self._http_client.request.call_count)
+
+        self._respond_with([self._NEW_VERSION, self._OLD_VERSION],
+                           self._NEW_VERSION)
+        updated = service_config._revalidate_cached_service_config(
+            self._cache_dir, self._SERVICE_NAME, self._OLD_VERSION)
+        self.assertEqual(self._NEW_VERSION, updated.id)
+
+        self._respond_with()
+        with mock.patch.object(service_config, u"_start_revalidation"):
+            cached = service_config.fetch_service_config(
+                cache_dir=self._cache_dir)
+        self.assertEqual(updated, cached)
+
+    @mock.patch(u"endpoints_management.config.service_config.client.GoogleCredentials",
+                _credentials)
+    @mock.patch(u"endpoints_management.config.service_config._get_http_client", _get_http_client)
+    def test_should_keep_the_cache_if_revalidation_fails(self):
+        self._respond_with([self._OLD_VERSION], self._OLD_VERSION)
+        service_config.fetch_service_config(cache_dir=self._cache_dir)
+
+        self._respond_with(None)
+        self.assertIsNone(service_config._revalidate_cached_service_config(
+            self._cache_dir, self._SERVICE_NAME, self._OLD_VERSION))
+
+        self._respond_with()
+        with mock.patch.object(service_config, u"_start_revalidation"):
+            cached = service_config.fetch_service_config(
+                cache_dir=self._cache_dir)
+        self.assertEqual(self._OLD_VERSION, cached.id)
+
+    @mock.patch(u"endpoints_management.config.service_config.client.GoogleCredentials",
+                _credentials)
+    @mock.patch(u"endpoints_management.config.service_config._get_http_client", _get_http_client)
+    def test_should_fetch_the_latest_config_id_by_listing_configs(self):
+        self._respond_with([self._NEW_VERSION, self._OLD_VERSION])
+        self.assertEqual(self._NEW_VERSION,
+                         service_config.fetch_service_config_id())
+        self.assertEqual(1, self._http_client.request.call_count)
+
+        self._respond_with()
+        self.assertEqual(self._OLD_VERSION,
+                         service_config.fetch_service_config_id(
+                             service_version=self._OLD_VERSION))
+        self.assertFalse(self._http_client.request.called)
+
+    @mock.patch(u"endpoints_management.config.service_config.client.GoogleCredentials",
+                _credentials)
+    @mock.patch(u"endpoints_management.config.service_config._get_http_client", _get_http_client)
+    def test_should_ignore_bad_cached_configs(self):
+        path = service_config._cache_path(self._cache_dir, self._SERVICE_NAME,
+                                          self._OLD_VERSION)
+        os.makedirs(os.path.dirname(path))
+        with open(path, u"w") as f:
+            f.write(self._config_json(self._NEW_VERSION))
+
+        self._respond_with(self._OLD_VERSION)
+        fetched = service_config.fetch_service_config(
+            service_version=self._OLD_VERSION, cache_dir=self._cache_dir)
+        self.assertEqual(self._OLD_VERSION, fetched.id)
+        self.assertEqual(1, self._http_client.request.call_count)
+        with open(path) as f:
+            self.assertEqual(self._config_json(self._OLD_VERSION), f.read())
+
+    @mock.patch(u"endpoints_management.config.service_config.client.GoogleCredentials",
+                _credentials)
+    @mock.patch(u"endpoints_management.config.service_config._get_http_client", _get_http_client)
+    def test_should_ignore_malformed_cached_configs(self):
+        path = service_config._cache_path(self._cache_dir, self._SERVICE_NAME,
+                                          self._OLD_VERSION)
+        os.makedirs(os.path.dirname(path))
+        for content in (u"not json", u"[]", u'{"name": 5}', u'{"apis": 3}'):
+            with open(path, u"w") as f:
+                f.write(content)
+            self._respond_with(self._OLD_VERSION)
+            fetched = service_config.fetch_service_config(
+                service_version=self._OLD_VERSION, cache_dir=self._cache_dir)
+            self.assertEqual(self._OLD_VERSION, fetched.id)
+            self.assertEqual(1, self._http_client.request.call_count)
+
+    def test_should_not_leave_temporary_files_if_caching_fails(self):
+        with mock.patch(u"os.rename", side_effect=OSError(u"rename failed")):
+            service_config._save_cached_service_config(
+                self._cache_dir, self._SERVICE_NAME, self._OLD_VERSION,
+                self._config_json(self._OLD_VERSION))
+        path = service_config._cache_path(self._cache_dir, self._SERVICE_NAME,
+                                          self._OLD_VERSION)
+        self.assertEqual([], os.listdir(os.path.dirname(path)))
@@ -17,9 +17,10 @@ from __future__ import absolute_import
 import hashlib
 
 import unittest2
+from apitools.base.py import encoding
 from expects import equal, expect
 
-from endpoints_management.control import signing
+from endpoints_management.control import sc_messages, signing
 
 
 class TestAddDictToHash(unittest2.TestCase):
@@ -40,3 +41,26 @@ class TestAddDictToHash(unittest2.TestCase):
         signing.add_dict_to_hash(got_hash, same_dict)
         got = got_hash.digest()
         expect(got).to(equal(want))
+
+
+class TestAddPropertiesToHash(unittest2.TestCase):
+    NOTHING_ADDED = hashlib.md5().digest()
+
+    def test_should_add_nothing_when_message_is_none(self):
+        md5 = hashlib.md5()
+        signing.add_properties_to_hash(md5, None)
+        expect(md5.digest()).to(equal(self.NOTHING_ADDED))
+
+    def test_should_match_adding_the_converted_dict(self):
+        for i in range(20):
+            labels = dict((u'label/%d-%d' % (i, j), u'value-%d' % j)
+                          for j in range(i))
+            labels[u'\u00e9t\u00e9'] = u'caf\u00e9'
+            a_message = encoding.PyValueToMessage(
+                sc_messages.Operation.LabelsValue, labels)
+            want_hash = hashlib.md5()
+            signing.add_dict_to_hash(want_hash,
+                                     encoding.MessageToPyValue(a_message))
+            got_hash = hashlib.md5()
+            signing.add_properties_to_hash(got_hash, a_message)
+            expect(got_hash.digest()).to(equal(want_hash.digest()))
@@ -0,0 +1,227 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+
+import json
+import mock
+import os
+import shutil
+import tempfile
+import unittest2
+
+from apitools.base.py import encoding
+from expects import be_none, expect, equal, raise_error
+
+from endpoints_management.control import (service, sm_messages, snapshot,
+                                          wsgi)
+
+
+_SERVICE_CONFIG = u"""
+{
+    "name": "bookstore-http-api",
+    "id": "2017-05-01r0",
+    "authentication": {
+        "rules": [{
+            "selector": "Bookstore.ListShelves",
+            "requirements": [{
+                "providerId": "shelves-provider",
+                "audiences": "aud1,aud2"
+            }]
+        }]
+    },
+    "quota": {
+        "metricRules": [{
+            "selector": "Bookstore.CreateBook",
+            "metricCosts": {
+                "metric_a": 1,
+                "metric_b": 2
+            }
+        }]
+    },
+    "http": {
+        "rules": [{
+            "selector": "Bookstore.ListShelves",
+            "get": "/shelves"
+        }, {
+            "selector": "Bookstore.ListBooks",
+            "get": "/shelves/{shelf}/books"
+        },{
+            "selector": "Bookstore.CreateBook",
+            "post": "/shelves/{shelf}/books",
+            "body": "book"
+        }]
+    },
+    "usage": {
+        "rules": [{
+            "selector" : "Bookstore.ListShelves",
+            "allowUnregisteredCalls" : true
+        }]
+    },
+    "systemParameters": {
+        "rules": [{
+            "selector": "Bookstore.ListBooks",
+            "parameters": [{
+                "name": "api_key",
+                "httpHeader": "ApiKeyHeader",
+                "urlQueryParameter": "ApiKeyParam"
+            }]
+        }]
+    },
+    "monitoredResources": [{
+        "type": "endpoints.googleapis.com/endpoints",
+        "labels": [{
+            "key": "/protocol"
+        }]
+    }],
+    "metrics": [{
+        "name": "serviceruntime.googleapis.com/api/consumer/request_count",
+        "metricKind": "DELTA",
+        "valueType": "INT64"
+    }],
+    "monitoring": {
+        "consumerDestinations": [{
+            "monitoredResource": "endpoints.googleapis.com/endpoints",
+            "metrics": [
+                "serviceruntime.googleapis.com/api/consumer/request_count"
+            ]
+        }]
+    },
+    "logs": [{
+        "name": "endpoints-log"
+    }],
+    "logging": {
+        "producerDestinations": [{
+            "monitoredResource": "endpoints.googleapis.com/endpoints",
+            "logs": ["endpoints-log"]
+        }]
+    }
+}
+"""
+
+_LOOKUPS = (
+    (u'GET', u'/shelves'),
+    (u'GET', u'/shelves/88/books'),
+    (u'POST', u'/shelves/88/books'),
+    (u'OPTIONS', u'/shelves'),
+    (u'GET', u'/shelves/88'),
+    (u'DELETE', u'/shelves'),
+)
+
+
+def _service():
+    return encoding.JsonToMessage(sm_messages.Service, _SERVICE_CONFIG)
+
+
+class TestSnapshot(unittest2.TestCase):
+
+    def setUp(self):
+        self._service = _service()
+        # round-trip via JSON, as happens with snapshot files
+        self._snapshot = json.loads(json.dumps(snapshot.create(self._service)))
+
+    def test_should_restore_an_equivalent_registry(self):
+        want = service.MethodRegistry(self._service)
+        got, _ = snapshot.restore(self._snapshot, self._service)
+        for http_method, path in _LOOKUPS:
+            want_info = want.lookup(http_method, path)
+            got_info = got.lookup(http_method, path)
+            if want_info is None:
+                expect(got_info).to(be_none)
+                continue
+            expect(got_info.to_dict()).to(equal(want_info.to_dict()))
+
+    def test_should_restore_method_details(self):
+        registry, _ = snapshot.restore(self._snapshot, self._service)
+        info = registry.lookup(u'GET', u'/shelves')
+        expect(info.allow_unregistered_calls).to(equal(True))
+        expect(info.auth_info.get_allowed_audiences(u'shelves-provider')).to(
+            equal(frozenset([u'aud1', u'aud2'])))
+        info = registry.lookup(u'GET', u'/shelves/88/books')
+        expect(info.api_key_http_header).to(equal((u'ApiKeyHeader',)))
+        expect(info.api_key_url_query_params).to(equal((u'ApiKeyParam',)))
+        info = registry.lookup(u'POST', u'/shelves/88/books')
+        expect(info.body_field_path).to(equal(u'book'))
+        expect(info.quota_info).to(equal({u'metric_a': 1, u'metric_b': 2}))
+
+    def test_should_restore_the_reporting_rules(self):
+        logs, metric_names, label_names = service.extract_report_spec(
+            self._service)
+        want = wsgi.report_request.ReportingRules.from_known_inputs(
+            logs=logs, metric_names=metric_names, label_names=label_names)
+        _, got = snapshot.restore(self._snapshot, self._service)
+        expect(got).to(equal(want))
+        expect(got.logs).to(equal(set([u'endpoints-log'])))
+        expect(len(got.metrics)).to(equal(1))
+        expect(len(got.labels)).to(equal(1))
+
+    def test_should_fail_if_the_service_config_id_differs(self):
+        self._service.id = u'2017-06-01r0'
+        testf = lambda: snapshot.restore(self._snapshot, self._service)
+        expect(testf).to(raise_error(ValueError))
+
+    def test_should_fail_if_the_format_is_unsupported(self):
+        self._snapshot[u'formatVersion'] = snapshot.FORMAT_VERSION + 1
+        testf = lambda: snapshot.restore(self._snapshot)
+        expect(testf).to(raise_error(ValueError))
+
+    def test_should_fail_if_the_snapshot_is_bad(self):
+        del self._snapshot[u'methodRegistry'][u'methods'][0]
+        testf = lambda: snapshot.restore(self._snapshot)
+        expect(testf).to(raise_error(ValueError))
+
+
+class TestSnapshotFiles(unittest2.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._config_file = os.path.join(self._dir, u'service.json')
+        self._snapshot_file = os.path.join(self._dir, u'snapshot.json')
+        with open(self._config_file, u'w') as f:
+            f.write(_SERVICE_CONFIG)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_should_write_a_snapshot_from_the_command_line(self):
+        expect(snapshot.main([self._config_file, self._snapshot_file])).to(
+            equal(0))
+        with open(self._snapshot_file) as f:
+            expect(json.load(f)).to(equal(snapshot.create(_service())))
+
+    def test_should_restore_from_the_environment(self):
+        snapshot.main([self._config_file, self._snapshot_file])
+        with mock.patch.dict(os.environ,
+                             {snapshot.SNAPSHOT_VAR: self._snapshot_file}):
+            registry, _ = snapshot.restore_from_environment(_service())
+        info = registry.lookup(u'GET', u'/shelves')
+        expect(info.selector).to(equal(u'Bookstore.ListShelves'))
+
+    def test_should_not_restore_a_missing_snapshot(self):
+        with mock.patch.dict(os.environ,
+                             {snapshot.SNAPSHOT_VAR: self._snapshot_file}):
+            expect(snapshot.restore_from_environment(_service())).to(be_none)
+
+    def test_should_not_restore_if_the_environment_is_not_set(self):
+        with mock.patch.dict(os.environ, clear=True):
+            expect(snapshot.restore_from_environment(_service())).to(be_none)
+
+    def test_should_be_used_by_environment_middleware(self):
+        snapshot.main([self._config_file, self._snapshot_file])
+        with mock.patch.dict(os.environ,
+                             {snapshot.SNAPSHOT_VAR: self._snapshot_file}):
+            with mock.patch.object(service, u'MethodRegistry') as registry_class:
+                registry_class.from_dict = service.MethodRegistry.from_dict
+                wsgi.EnvironmentMiddleware(mock.MagicMock(), _service())
+                expect(registry_class.called).to(equal(False))
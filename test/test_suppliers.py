@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import json
+import os
 import unittest
 import httmock
 import mock
@@ -190,3 +191,241 @@ class JwksSupplierTest(unittest.TestCase):
             JwksSupplierTest._mock_timer.return_value += 5 * 60
             self._jwks_uri_supplier.supply(issuer)
             self.assertEqual(2, len(self._jwks_uri_supplier.supply(issuer)))
+
+
+    @mock.patch(u"time.time", _mock_timer)
+    def test_supply_jwks_for_the_advertised_max_age(self):
+        JwksSupplierTest._mock_timer.return_value = 10
+        self._key_uri_supplier.supply.return_value = u"https://issuer.com"
+        request_headers = []
+
+        @httmock.urlmatch(scheme=u"https", netloc=u"issuer.com")
+        def _mock_response(url, request):  # pylint: disable=unused-argument
+            request_headers.append(request.headers)
+            if request.headers.get(u"If-None-Match") == u'"v1"':
+                return httmock.response(304, headers={
+                    u"Cache-Control": u"public, max-age=3600"})
+            return httmock.response(200, json.dumps({u"keys": []}), headers={
+                u"Cache-Control": u"public, max-age=3600", u"ETag": u'"v1"'})
+
+        with httmock.HTTMock(_mock_response):
+            keys = self._jwks_uri_supplier.supply(u"issuer.com")
+
+            # the keys are cached for longer than the default ttl
+            JwksSupplierTest._mock_timer.return_value += 3599
+            self.assertIs(keys, self._jwks_uri_supplier.supply(u"issuer.com"))
+            self.assertEqual(1, len(request_headers))
+            self.assertNotIn(u"If-None-Match", request_headers[0])
+
+            # they are refetched conditionally, and kept if not modified
+            JwksSupplierTest._mock_timer.return_value += 1
+            self.assertIs(keys, self._jwks_uri_supplier.supply(u"issuer.com"))
+            self.assertEqual(2, len(request_headers))
+            self.assertEqual(u'"v1"', request_headers[1][u"If-None-Match"])
+
+    @mock.patch(u"time.time", _mock_timer)
+    def test_supply_jwks_for_at_least_the_ttl(self):
+        JwksSupplierTest._mock_timer.return_value = 10
+        self._key_uri_supplier.supply.return_value = u"https://issuer.com"
+        request_count = []
+
+        @httmock.urlmatch(scheme=u"https", netloc=u"issuer.com")
+        def _mock_response(url, request):  # pylint: disable=unused-argument
+            request_count.append(1)
+            return httmock.response(200, json.dumps({u"keys": []}), headers={
+                u"Cache-Control": u"no-cache"})
+
+        with httmock.HTTMock(_mock_response):
+            self._jwks_uri_supplier.supply(u"issuer.com")
+            JwksSupplierTest._mock_timer.return_value += 5 * 60 - 1
+            self._jwks_uri_supplier.supply(u"issuer.com")
+            self.assertEqual(1, len(request_count))
+
+    def test_fetches_use_a_shared_session_with_a_timeout(self):
+        self._key_uri_supplier.supply.return_value = u"https://issuer.com/jwks"
+        with mock.patch.object(suppliers, u"_session") as session:
+            session.get.return_value.json.return_value = {}
+            session.get.return_value.headers = {}
+            self._jwks_uri_supplier.supply(u"issuer.com")
+            suppliers._discover_jwks_uri(u"issuer.com")
+        self.assertEqual([
+            mock.call(u"https://issuer.com/jwks", headers={},
+                      timeout=suppliers._HTTP_TIMEOUT_SECS),
+            mock.call(u"https://issuer.com/" + suppliers._OPEN_ID_CONFIG_PATH,
+                      headers=None, timeout=suppliers._HTTP_TIMEOUT_SECS)],
+                         session.get.call_args_list)
+
+
+class MaxAgeTest(unittest.TestCase):
+
+    def _max_age(self, cache_control):
+        response = mock.MagicMock()
+        response.headers = {}
+        if cache_control is not None:
+            response.headers[u"Cache-Control"] = cache_control
+        return suppliers._max_age(response)
+
+    def test_max_age(self):
+        self.assertIsNone(self._max_age(None))
+        self.assertIsNone(self._max_age(u"public"))
+        self.assertEqual(60, self._max_age(u"max-age=60"))
+        self.assertEqual(60, self._max_age(u"public, Max-Age=60, must-revalidate"))
+        self.assertEqual(0, self._max_age(u"max-age=60, no-cache"))
+        self.assertEqual(0, self._max_age(u"no-store"))
+        self.assertIsNone(self._max_age(u"max-age=soon"))
+
+class _FakeKey(object):
+
+    def __init__(self, kid, kty=u"RSA"):
+        self.kid = kid
+        self.kty = kty
+
+
+class JwksSupplierKeyIndexTest(unittest.TestCase):
+    _ISSUER = u"issuer.com"
+
+    def setUp(self):
+        self._rsa_keys = [_FakeKey(u"rsa-%d" % i) for i in range(100)]
+        self._ec_keys = [_FakeKey(None, kty=u"EC")]
+        self._keys = self._rsa_keys + self._ec_keys
+        self._supplier = suppliers.JwksSupplier(mock.MagicMock())
+        self._supplier._retrieve_jwks = mock.MagicMock(
+            return_value=(self._keys, None, None))
+
+    def test_supply_keys_with_the_kid(self):
+        self.assertEquals([self._rsa_keys[42]],
+                          self._supplier.supply(self._ISSUER, kid=u"rsa-42",
+                                                alg=u"RS256"))
+
+    def test_supply_keys_of_the_alg_type_without_a_kid(self):
+        self.assertEquals(self._rsa_keys,
+                          self._supplier.supply(self._ISSUER, alg=u"RS256"))
+        self.assertEquals(self._ec_keys,
+                          self._supplier.supply(self._ISSUER, alg=u"ES256"))
+        self.assertEquals([],
+                          self._supplier.supply(self._ISSUER, alg=u"HS256"))
+
+    def test_supply_all_keys_otherwise(self):
+        self.assertEquals(self._keys, self._supplier.supply(self._ISSUER))
+        self.assertEquals(self._keys,
+                          self._supplier.supply(self._ISSUER, alg=u"unknown"))
+
+    def test_supply_shares_fetches_of_the_issuer(self):
+        with mock.patch.object(self._supplier._fetches, u"do",
+                               wraps=self._supplier._fetches.do) as do:
+            self._supplier.supply(self._ISSUER)
+            do.assert_called_once_with(self._ISSUER, mock.ANY)
+
+
+class JwksSupplierRefreshTest(unittest.TestCase):
+    _mock_timer = mock.MagicMock()
+    _ISSUER = u"issuer.com"
+
+    def setUp(self):
+        JwksSupplierRefreshTest._mock_timer.return_value = 1000
+        self._supplier = suppliers.JwksSupplier(mock.MagicMock(),
+                                                refresh_in_background=True)
+        self._retrieve = mock.MagicMock()
+        self._supplier._retrieve_jwks = self._retrieve
+        self._old_keys = [_FakeKey(u"old")]
+        self._new_keys = [_FakeKey(u"new")]
+        # (keys, max-age, ETag)
+        self._old_response = (self._old_keys, None, None)
+        self._new_response = (self._new_keys, None, None)
+        self._retrieve.side_effect = [self._old_response, self._new_response]
+
+    def _advance(self, delta):
+        JwksSupplierRefreshTest._mock_timer.return_value += delta.total_seconds()
+
+    @mock.patch(u"time.time", _mock_timer)
+    @mock.patch(u"threading.Thread")
+    def test_supply_starts_a_refresh_thread(self, thread_class):
+        self._supplier.supply(self._ISSUER)
+        self._supplier.supply(self._ISSUER)
+        thread_class.assert_called_once_with(
+            target=suppliers._refresh_periodically, args=mock.ANY)
+        self.assertTrue(thread_class.return_value.daemon)
+        self.assertTrue(thread_class.return_value.start.called)
+
+    @mock.patch(u"time.time", _mock_timer)
+    @mock.patch(u"threading.Thread")
+    def test_supply_restarts_the_refresh_thread_after_a_fork(self,
+                                                            thread_class):
+        self._supplier.supply(self._ISSUER)
+        # a forked process does not inherit the refresh thread
+        with mock.patch(u"os.getpid", return_value=os.getpid() + 1):
+            self._supplier.supply(self._ISSUER)
+            self._supplier.supply(self._ISSUER)
+        self.assertEqual(2, thread_class.call_count)
+
+    @mock.patch(u"time.time", _mock_timer)
+    @mock.patch(u"threading.Thread")
+    def test_supply_serves_stale_keys_while_refreshing(self, _thread_class):
+        self.assertEqual(self._old_keys, self._supplier.supply(self._ISSUER))
+        self._advance(suppliers._JWKS_TTL + suppliers._JWKS_MAX_STALENESS / 2)
+        self.assertEqual(self._old_keys, self._supplier.supply(self._ISSUER))
+        self.assertEqual(1, self._retrieve.call_count)
+
+    @mock.patch(u"time.time", _mock_timer)
+    @mock.patch(u"threading.Thread")
+    def test_supply_fetches_keys_that_are_too_stale(self, _thread_class):
+        self._supplier.supply(self._ISSUER)
+        self._advance(suppliers._JWKS_TTL + suppliers._JWKS_MAX_STALENESS)
+        self.assertEqual(self._new_keys, self._supplier.supply(self._ISSUER))
+
+    @mock.patch(u"time.time", _mock_timer)
+    @mock.patch(u"threading.Thread")
+    def test_supply_fetches_expired_keys_if_the_thread_fails(self, thread_class):
+        thread_class.return_value.start.side_effect = RuntimeError()
+        self._supplier.supply(self._ISSUER)
+        self._advance(suppliers._JWKS_TTL)
+        self.assertEqual(self._new_keys, self._supplier.supply(self._ISSUER))
+
+    @mock.patch(u"time.time", _mock_timer)
+    @mock.patch(u"threading.Thread")
+    def test_refresh_due_refreshes_keys_before_they_expire(self, _thread_class):
+        self._supplier.supply(self._ISSUER)
+        wait_secs = self._supplier._refresh_due()
+        self.assertEqual(1, self._retrieve.call_count)
+        # it wakes often enough to refresh issuers added while it waits
+        self.assertEqual(suppliers._JWKS_REFRESH_AHEAD.total_seconds(),
+                         wait_secs)
+
+        self._advance(suppliers._JWKS_TTL - suppliers._JWKS_REFRESH_AHEAD)
+        self._supplier._refresh_due()
+        self.assertEqual(self._new_keys, self._supplier.supply(self._ISSUER))
+
+    @mock.patch(u"time.time", _mock_timer)
+    @mock.patch(u"threading.Thread")
+    def test_refresh_due_keeps_keys_that_fail_to_refresh(self, _thread_class):
+        self._retrieve.side_effect = [
+            self._old_response, suppliers.UnauthenticatedException()]
+        self._supplier.supply(self._ISSUER)
+        self._advance(suppliers._JWKS_TTL)
+        wait_secs = self._supplier._refresh_due()
+        self.assertEqual(suppliers._JWKS_MIN_REFRESH_INTERVAL.total_seconds(),
+                         wait_secs)
+        self.assertEqual(self._old_keys, self._supplier.supply(self._ISSUER))
+
+    @mock.patch(u"time.time", _mock_timer)
+    @mock.patch(u"threading.Thread")
+    def test_supply_refreshes_for_unknown_key_ids(self, _thread_class):
+        self._retrieve.side_effect = [
+            self._old_response, self._new_response, self._old_response]
+        self._supplier.supply(self._ISSUER, kid=u"old")
+        self.assertEqual(self._old_keys,
+                         self._supplier.supply(self._ISSUER, kid=u"new"))
+
+        # refreshes are rate limited
+        self._advance(suppliers._JWKS_MIN_REFRESH_INTERVAL)
+        self.assertEqual(self._new_keys,
+                         self._supplier.supply(self._ISSUER, kid=u"new"))
+        self.assertEqual(self._new_keys,
+                         self._supplier.supply(self._ISSUER, kid=u"other"))
+        self.assertEqual(2, self._retrieve.call_count)
+
+    def test_refresh_thread_ends_with_its_supplier(self):
+        stopped = mock.MagicMock()
+        stopped.is_set.return_value = False
+        suppliers._refresh_periodically(lambda: None, stopped)
+        self.assertFalse(stopped.wait.called)
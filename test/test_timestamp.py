@@ -16,6 +16,7 @@ from __future__ import absolute_import
 
 import datetime
 
+import strict_rfc3339
 import unittest2
 from expects import be_below_or_equal, expect, equal, raise_error
 
@@ -27,7 +28,9 @@ class TestToRfc3339(unittest2.TestCase):
     TESTS = [
         (A_LONG_TIME_AGO, u'1971-12-31T21:00:20.021Z'),
         (A_LONG_TIME_AGO - datetime.datetime(1970, 1, 1),
-         u'1971-12-31T21:00:20.021Z')
+         u'1971-12-31T21:00:20.021Z'),
+        (63061220.021, u'1971-12-31T21:00:20.021Z'),
+        (0, u'1970-01-01T00:00:00Z'),
     ]
 
     def test_should_converts_correctly(self):
@@ -38,6 +41,22 @@ class TestToRfc3339(unittest2.TestCase):
         testf = lambda: timestamp.to_rfc3339(u'this will not work')
         expect(testf).to(raise_error(ValueError))
 
+    def test_should_format_like_strict_rfc3339(self):
+        base = 1500000000
+        for t in (base, base + 0.5, base + 0.000001, base + 0.999999,
+                  base + 1.25, base - 0.5, -86400.75, 4102444800.123):
+            expect(timestamp.to_rfc3339(t)).to(equal(
+                strict_rfc3339.timestamp_to_rfc3339_utcoffset(t)))
+
+    def test_should_format_values_within_the_same_second(self):
+        start = datetime.datetime(2017, 6, 1, 12, 30, 15)
+        expect(timestamp.to_rfc3339(start)).to(
+            equal(u'2017-06-01T12:30:15Z'))
+        expect(timestamp.to_rfc3339(start.replace(microsecond=120))).to(
+            equal(u'2017-06-01T12:30:15.00012Z'))
+        expect(timestamp.to_rfc3339(start.replace(second=16))).to(
+            equal(u'2017-06-01T12:30:16Z'))
+
 
 class TestFromRfc3339(unittest2.TestCase):
     TOLERANCE = 10000  # 1e-5 * 1e9
@@ -81,6 +100,47 @@ class TestFromRfc3339(unittest2.TestCase):
             expect(epsilon).to(be_below_or_equal(self.TOLERANCE))
 
 
+class TestToEpochSeconds(unittest2.TestCase):
+    TESTS = [
+        (u'1971-12-31T21:00:20.021Z', 63061220.021),
+        (u'1996-12-19T16:39:57-08:00', 851042397),
+        (u'1970-01-01T00:00:00Z', 0),
+    ]
+
+    def test_should_convert_correctly(self):
+        for text, want in self.TESTS:
+            expect(timestamp.to_epoch_seconds(text)).to(equal(want))
+
+    def test_should_round_trip_with_to_rfc3339(self):
+        for text, _ in self.TESTS[:1]:
+            got = timestamp.to_rfc3339(timestamp.to_epoch_seconds(text))
+            expect(got).to(equal(text))
+
+    INVALID = [
+        u'this will not work',
+        u'1971-12-31T21:00:20',
+        u'1971-12-31 21:00:20Z',
+        u'1971-12-31T21:00:20.Z',
+        u'1971-02-29T21:00:20Z',
+        u'1971-12-31T24:00:20Z',
+        u'1971-13-31T21:00:20Z',
+        u'1971-12-31T21:00:20+24:00',
+    ]
+
+    def test_should_fail_on_invalid_input(self):
+        for text in self.INVALID:
+            testf = lambda: timestamp.to_epoch_seconds(text)
+            expect(testf).to(raise_error(ValueError))
+
+    def test_should_parse_like_strict_rfc3339(self):
+        for text in (u'1971-12-31T21:00:20.021Z',
+                     u'1971-12-31T21:00:20.5+01:30',
+                     u'1971-12-31T21:00:20-01:30',
+                     u'2000-02-29T23:59:59.999999Z'):
+            expect(timestamp.to_epoch_seconds(text)).to(equal(
+                strict_rfc3339.rfc3339_to_timestamp(text)))
+
+
 class TestCompare(unittest2.TestCase):
     TESTS = [
         # Strings
@@ -13,8 +13,11 @@
 # limitations under the License.
 
 import copy
+import datetime
+import jwkest
 import mock
 import json
+import threading
 import time
 import unittest
 
@@ -26,6 +29,7 @@ from test import token_utils
 
 from endpoints_management.auth import suppliers
 from endpoints_management.auth import tokens
+from endpoints_management.auth import verifiers
 
 
 class AuthenticatorTest(unittest.TestCase):
@@ -69,6 +73,14 @@ class AuthenticatorTest(unittest.TestCase):
         actual_jwt_claims = self._authenticator.get_jwt_claims(auth_token)
         self.assertEqual(self._jwt_claims, actual_jwt_claims)
 
+    def test_get_jwt_claims_supplies_keys_for_the_kid(self):
+        auth_token = token_utils.generate_auth_token(self._jwt_claims,
+                                                     self._jwks._keys,
+                                                     kid=self._ec_kid)
+        self._authenticator.get_jwt_claims(auth_token)
+        self._jwks_supplier.supply.assert_called_once_with(
+            self._jwt_claims[u"iss"], kid=self._ec_kid, alg=u"ES256")
+
     def test_get_jwt_claims_without_kid(self):
         auth_token = token_utils.generate_auth_token(self._jwt_claims,
                                                      self._jwks._keys)
@@ -116,8 +128,66 @@ class AuthenticatorTest(unittest.TestCase):
         with self.assertRaises(suppliers.UnauthenticatedException):
             self._authenticator.get_jwt_claims(auth_token)
 
+    @mock.patch(u"time.time", _mock_timer)
+    def test_get_jwt_claims_caches_until_the_token_expires(self):
+        AuthenticatorTest._mock_timer.return_value = 1000
+        self._jwt_claims[u"exp"] = 1030
+        auth_token = token_utils.generate_auth_token(self._jwt_claims,
+                                                     self._jwks._keys)
+        self._authenticator.get_jwt_claims(auth_token)
+
+        # Reset the returned JWKS so the signature verification will fail next
+        # time.
+        self._jwks_supplier.supply.return_value = jwk.KEYS()
+
+        # This call should succeed since the auth_token is cached.
+        AuthenticatorTest._mock_timer.return_value = 1029
+        self._authenticator.get_jwt_claims(auth_token)
+
+        # The token has expired, so it's no longer cached.
+        AuthenticatorTest._mock_timer.return_value = 1030
+        with self.assertRaises(suppliers.UnauthenticatedException):
+            self._authenticator.get_jwt_claims(auth_token)
+
+    @mock.patch(u"time.time", _mock_timer)
+    def test_get_jwt_claims_does_not_cache_expired_tokens(self):
+        AuthenticatorTest._mock_timer.return_value = 1000
+        self._jwt_claims[u"exp"] = 1000
+        auth_token = token_utils.generate_auth_token(self._jwt_claims,
+                                                     self._jwks._keys)
+        self._authenticator.get_jwt_claims(auth_token)
+        self.assertEqual(0, len(self._authenticator._cache))
+
+    def test_get_jwt_claims_caches_by_token_digest(self):
+        auth_token = token_utils.generate_auth_token(self._jwt_claims,
+                                                     self._jwks._keys)
+        self._authenticator.get_jwt_claims(auth_token)
+        self.assertEqual(1, len(self._authenticator._cache))
+        self.assertIsNone(self._authenticator._cache.get(auth_token))
+        self.assertEqual(self._jwt_claims, self._authenticator._cache.get(
+            tokens._cache_key(auth_token)))
+
+    def test_auth_token_cache_max_bytes(self):
+        auth_token1 = token_utils.generate_auth_token(self._jwt_claims,
+                                                      self._jwks._keys)
+        # a single shard bounds the size of the whole cache
+        authenticator = tokens.Authenticator(
+            {}, self._jwks_supplier, cache_max_bytes=len(auth_token1) + 40,
+            cache_num_shards=1)
+        authenticator.get_jwt_claims(auth_token1)
+        self.assertEqual(1, len(authenticator._cache))
+
+        self._jwt_claims[u"email"] = u"2@email.com"
+        auth_token2 = token_utils.generate_auth_token(self._jwt_claims,
+                                                      self._jwks._keys)
+        authenticator.get_jwt_claims(auth_token2)
+        self.assertEqual(1, len(authenticator._cache))
+        self.assertIsNone(authenticator._cache.get(
+            tokens._cache_key(auth_token1)))
+
     def test_auth_token_cache_capacity(self):
-        authenticator = tokens.Authenticator({}, self._jwks_supplier, cache_capacity=2)
+        authenticator = tokens.Authenticator({}, self._jwks_supplier, cache_capacity=2,
+                                             cache_num_shards=1)
 
         self._jwt_claims[u"email"] = u"1@email.com"
         auth_token1 = token_utils.generate_auth_token(self._jwt_claims,
@@ -154,6 +224,47 @@ class AuthenticatorTest(unittest.TestCase):
         with self.assertRaises(suppliers.UnauthenticatedException):
             authenticator.get_jwt_claims(auth_token1)
 
+    def test_concurrent_get_jwt_claims_verifies_once(self):
+        auth_token = token_utils.generate_auth_token(self._jwt_claims,
+                                                     self._jwks._keys)
+        supplying = threading.Event()
+        release = threading.Event()
+
+        def supply(*args, **kwargs):  # pylint: disable=unused-argument
+            supplying.set()
+            release.wait()
+            return self._jwks
+        self._jwks_supplier.supply.side_effect = supply
+
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(
+                self._authenticator.get_jwt_claims(auth_token)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        supplying.wait()
+        time.sleep(0.05)  # lets the other threads miss the cache meanwhile
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([self._jwt_claims] * 4, results)
+        self.assertEqual(1, self._jwks_supplier.supply.call_count)
+        self.assertEqual(1, self._authenticator.stats[u"verifications"])
+
+    def test_cache_stats(self):
+        auth_token = token_utils.generate_auth_token(self._jwt_claims,
+                                                     self._jwks._keys)
+        for _ in range(3):
+            self._authenticator.get_jwt_claims(auth_token)
+        stats = self._authenticator.cache_stats
+        self.assertEqual({u"hits": 2, u"misses": 1, u"evictions": 0},
+                         stats[u"jwt_claims"])
+        self.assertEqual({u"hits": 0, u"misses": 1, u"evictions": 0},
+                         stats[u"rejected_tokens"])
+        self.assertEqual(8, len(self._authenticator._cache._shards))
+
     def test_verify_fails(self):
         auth_token = token_utils.generate_auth_token(self._jwt_claims,
                                                      self._jwks._keys,
@@ -169,6 +280,93 @@ class AuthenticatorTest(unittest.TestCase):
         with self.assertRaises(suppliers.UnauthenticatedException):
             self._authenticator.get_jwt_claims(auth_token)
 
+    def test_rejected_tokens_are_not_verified_again(self):
+        auth_token = token_utils.generate_auth_token(self._jwt_claims,
+                                                     self._jwks._keys,
+                                                     kid=self._ec_kid)
+        new_jwk = jwk.ECKey(use=u"sig").load_key(ecc.P256)
+        new_jwk.kid = self._ec_kid
+        self._jwks_supplier.supply.return_value = [new_jwk]
+
+        for _ in range(3):
+            with self.assertRaises(suppliers.UnauthenticatedException):
+                self._authenticator.get_jwt_claims(auth_token)
+        self._jwks_supplier.supply.assert_called_once_with(
+            self._jwt_claims[u"iss"], kid=self._ec_kid, alg=u"ES256")
+        self.assertEqual({u"verifications": 1,
+                          u"rejected_tokens": 1,
+                          u"rejected_token_hits": 2},
+                         self._authenticator.stats)
+
+    def test_malformed_tokens_are_not_decoded_again(self):
+        with mock.patch.object(tokens.jwt, u"JWT") as jwt_class:
+            jwt_class.return_value.unpack.side_effect = jwkest.BadSyntax(
+                u"bad", u"token")
+            for _ in range(3):
+                with self.assertRaises(jwkest.BadSyntax):
+                    self._authenticator.get_jwt_claims(u"bad-token")
+            jwt_class.return_value.unpack.assert_called_once_with(u"bad-token")
+        self.assertEqual(2, self._authenticator.stats[u"rejected_token_hits"])
+
+    @mock.patch(u"time.time", _mock_timer)
+    def test_rejected_tokens_are_verified_again_after_the_ttl(self):
+        AuthenticatorTest._mock_timer.return_value = 1000
+        authenticator = tokens.Authenticator(
+            {}, self._jwks_supplier,
+            rejected_token_ttl=datetime.timedelta(seconds=10))
+        with mock.patch.object(tokens.jwt, u"JWT") as jwt_class:
+            jwt_class.return_value.unpack.side_effect = jwkest.BadSyntax(
+                u"bad", u"token")
+            with self.assertRaises(jwkest.BadSyntax):
+                authenticator.get_jwt_claims(u"bad-token")
+            AuthenticatorTest._mock_timer.return_value += 11
+            with self.assertRaises(jwkest.BadSyntax):
+                authenticator.get_jwt_claims(u"bad-token")
+            self.assertEqual(2, jwt_class.return_value.unpack.call_count)
+
+    def test_key_supply_failures_are_not_cached(self):
+        auth_token = token_utils.generate_auth_token(self._jwt_claims,
+                                                     self._jwks._keys,
+                                                     kid=self._ec_kid)
+        self._jwks_supplier.supply.side_effect = [
+            suppliers.UnauthenticatedException(u"cannot retrieve keys"),
+            self._jwks]
+        with self.assertRaises(suppliers.UnauthenticatedException):
+            self._authenticator.get_jwt_claims(auth_token)
+        self.assertEqual(self._jwt_claims,
+                         self._authenticator.get_jwt_claims(auth_token))
+        self.assertEqual(0, self._authenticator.stats[u"rejected_tokens"])
+
+    def test_tokens_without_a_supplied_key_are_not_cached(self):
+        auth_token = token_utils.generate_auth_token(self._jwt_claims,
+                                                     self._jwks._keys,
+                                                     kid=self._ec_kid)
+        # the supplier has yet to refresh the keys, e.g after a key rotation
+        old_jwk = jwk.ECKey(use=u"sig").load_key(ecc.P256)
+        old_jwk.kid = u"old-key-id"
+        for verifier in (verifiers.create_verifier(),
+                         verifiers.JwkestVerifier()):
+            authenticator = tokens.Authenticator({}, self._jwks_supplier,
+                                                 verifier=verifier)
+            self._jwks_supplier.supply.side_effect = [[old_jwk], self._jwks]
+            with self.assertRaises(suppliers.UnauthenticatedException):
+                authenticator.get_jwt_claims(auth_token)
+            self.assertEqual(self._jwt_claims,
+                             authenticator.get_jwt_claims(auth_token))
+            self.assertEqual(0, authenticator.stats[u"rejected_tokens"])
+
+    def test_rejected_token_cache_can_be_disabled(self):
+        authenticator = tokens.Authenticator({}, self._jwks_supplier,
+                                             rejected_token_capacity=0)
+        with mock.patch.object(tokens.jwt, u"JWT") as jwt_class:
+            jwt_class.return_value.unpack.side_effect = jwkest.BadSyntax(
+                u"bad", u"token")
+            for _ in range(2):
+                with self.assertRaises(jwkest.BadSyntax):
+                    authenticator.get_jwt_claims(u"bad-token")
+            self.assertEqual(2, jwt_class.return_value.unpack.call_count)
+        self.assertEqual(0, authenticator.stats[u"rejected_tokens"])
+
     def test_authenticate_successfully(self):
         auth_token = token_utils.generate_auth_token(self._jwt_claims,
                                                      self._jwks._keys,
@@ -182,6 +380,64 @@ class AuthenticatorTest(unittest.TestCase):
                               self._jwt_claims[u"email"], self._jwt_claims[u"sub"],
                               self._jwt_claims[u"iss"])
 
+    def test_authenticate_caches_successes(self):
+        auth_token = token_utils.generate_auth_token(self._jwt_claims,
+                                                     self._jwks._keys,
+                                                     kid=self._ec_kid)
+        self._method_info.get_allowed_audiences.return_value = frozenset(
+            [u"first.com"])
+        self._issuers_to_provider_ids[self._jwt_claims[u"iss"]] = u"provider-id"
+        user_info = self._authenticator.authenticate(auth_token,
+                                                     self._method_info,
+                                                     u"service.name.com")
+        self._method_info.is_provider_allowed.return_value = False
+        self.assertIs(user_info,
+                      self._authenticator.authenticate(auth_token,
+                                                       self._method_info,
+                                                       u"service.name.com"))
+        self.assertEqual(1, self._method_info.is_provider_allowed.call_count)
+
+        # the success is only for the same method and service
+        other_method_info = mock.MagicMock()
+        other_method_info.is_provider_allowed.return_value = False
+        with self.assertRaises(suppliers.UnauthenticatedException):
+            self._authenticator.authenticate(auth_token, other_method_info,
+                                             u"service.name.com")
+        with self.assertRaises(suppliers.UnauthenticatedException):
+            self._authenticator.authenticate(auth_token, self._method_info,
+                                             u"other.name.com")
+
+    @mock.patch(u"time.time", _mock_timer)
+    def test_authenticate_caches_successes_until_the_token_expires(self):
+        AuthenticatorTest._mock_timer.return_value = 1000
+        self._jwt_claims[u"exp"] = 1010
+        auth_token = token_utils.generate_auth_token(self._jwt_claims,
+                                                     self._jwks._keys,
+                                                     kid=self._ec_kid)
+        self._method_info.get_allowed_audiences.return_value = frozenset(
+            [u"first.com"])
+        self._issuers_to_provider_ids[self._jwt_claims[u"iss"]] = u"provider-id"
+        self._authenticator.authenticate(auth_token, self._method_info,
+                                         u"service.name.com")
+        AuthenticatorTest._mock_timer.return_value = 1010
+        with self.assertRaises(suppliers.UnauthenticatedException):
+            self._authenticator.authenticate(auth_token, self._method_info,
+                                             u"service.name.com")
+
+    def test_authenticate_does_not_cache_failures(self):
+        auth_token = token_utils.generate_auth_token(self._jwt_claims,
+                                                     self._jwks._keys,
+                                                     kid=self._ec_kid)
+        self._method_info.get_allowed_audiences.return_value = frozenset()
+        self._issuers_to_provider_ids[self._jwt_claims[u"iss"]] = u"provider-id"
+        with self.assertRaises(suppliers.UnauthenticatedException):
+            self._authenticator.authenticate(auth_token, self._method_info,
+                                             u"service.name.com")
+        self._method_info.get_allowed_audiences.return_value = frozenset(
+            [u"second.com"])
+        self._authenticator.authenticate(auth_token, self._method_info,
+                                         u"service.name.com")
+
     def test_authenticate_with_single_audience(self):
         aud = u"first.aud.com"
         self._jwt_claims[u"aud"] = aud
@@ -0,0 +1,164 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+import time
+import unittest
+
+from Crypto import PublicKey
+from jwkest import ecc
+from jwkest import jwk
+from jwkest import jwt
+from test import token_utils
+
+from endpoints_management.auth import suppliers
+from endpoints_management.auth import verifiers
+
+
+_CLAIMS = {
+    u"aud": u"first.com",
+    u"exp": int(time.time()) + 60,
+    u"iss": u"https://issuer.com",
+    u"sub": u"subject-id"}
+
+
+def _unpack(auth_token):
+    return jwt.JWT().unpack(auth_token)
+
+
+def _verifies(verifier, auth_token, keys):
+    try:
+        verifier.verify(_unpack(auth_token), keys)
+        return True
+    except suppliers.UnauthenticatedException:
+        return False
+
+
+def _tamper(auth_token):
+    header, payload, signature = auth_token.split(u".")
+    index = len(signature) // 2
+    flipped = u"A" if signature[index] != u"A" else u"B"
+    signature = signature[:index] + flipped + signature[index + 1:]
+    return u".".join([header, payload, signature])
+
+
+def _rsa_key(kid):
+    key = jwk.RSAKey(use=u"sig").load_key(PublicKey.RSA.generate(1024))
+    key.kid = kid
+    return key
+
+
+def _ec_key(kid, curve=ecc.P256):
+    key = jwk.ECKey(use=u"sig").load_key(curve)
+    key.kid = kid
+    return key
+
+
+@unittest.skipUnless(verifiers.has_cryptography(), u"needs cryptography")
+class CryptographyVerifierTest(unittest.TestCase):
+
+    def setUp(self):
+        self._rsa_key = _rsa_key(u"rsa-key-id")
+        self._keys = {
+            u"RS256": self._rsa_key,
+            u"RS384": self._rsa_key,
+            u"RS512": self._rsa_key,
+            u"PS256": self._rsa_key,
+            u"ES256": _ec_key(u"p256-key-id"),
+            u"ES384": _ec_key(u"p384-key-id", ecc.P384),
+            u"ES512": _ec_key(u"p521-key-id", ecc.P521),
+        }
+        self._other_keys = [_rsa_key(u"rsa-key-id"), _ec_key(u"p256-key-id")]
+        self._verifier = verifiers.CryptographyVerifier()
+        self._jwkest_verifier = verifiers.JwkestVerifier()
+
+    def _check_like_jwkest(self, auth_token, keys, want):
+        self.assertEqual(want, _verifies(self._jwkest_verifier, auth_token, keys))
+        self.assertEqual(want, _verifies(self._verifier, auth_token, keys))
+
+    def test_verify_like_jwkest(self):
+        all_keys = list(set(self._keys.values()))
+        for alg, key in self._keys.items():
+            for kid in (None, key.kid):
+                auth_token = token_utils.generate_auth_token(_CLAIMS, [key],
+                                                             alg=alg, kid=kid)
+                self._check_like_jwkest(auth_token, all_keys, True)
+                self._check_like_jwkest(_tamper(auth_token), all_keys, False)
+                self._check_like_jwkest(auth_token, self._other_keys, False)
+
+    def test_verify_with_the_key_for_the_kid_like_jwkest(self):
+        signing_key = jwk.RSAKey(use=u"sig", kid=u"unknown-key-id").load_key(
+            self._rsa_key.key)
+        auth_token = token_utils.generate_auth_token(_CLAIMS, [signing_key],
+                                                     alg=u"RS256",
+                                                     kid=u"unknown-key-id")
+        self._check_like_jwkest(auth_token, [self._rsa_key], False)
+
+    def test_verify_with_keys_for_the_alg_like_jwkest(self):
+        auth_token = token_utils.generate_auth_token(_CLAIMS, [self._rsa_key],
+                                                     alg=u"RS256")
+        self._rsa_key.alg = u"RS512"
+        self._check_like_jwkest(auth_token, [self._rsa_key], False)
+
+    def test_verify_other_algs_like_jwkest(self):
+        key = jwk.SYMKey(key=u"secret", kid=u"sym-key-id")
+        auth_token = token_utils.generate_auth_token(_CLAIMS, [key],
+                                                     alg=u"HS256")
+        self._check_like_jwkest(auth_token, [key], True)
+        self._check_like_jwkest(_tamper(auth_token), [key], False)
+
+    def test_verify_does_not_allow_alg_none(self):
+        auth_token = token_utils.generate_auth_token(_CLAIMS, [], alg=u"none")
+        self._check_like_jwkest(auth_token, [self._rsa_key], False)
+
+    def test_verify_loads_each_key_once(self):
+        auth_token = token_utils.generate_auth_token(_CLAIMS, [self._rsa_key],
+                                                     alg=u"RS256")
+        with mock.patch.object(verifiers, u"_load_public_key",
+                               wraps=verifiers._load_public_key) as load:
+            for _ in range(3):
+                self._verifier.verify(_unpack(auth_token), [self._rsa_key])
+            load.assert_called_once_with(self._rsa_key)
+
+    def test_load_public_keys(self):
+        for key in set(self._keys.values()):
+            self.assertIsNotNone(verifiers._load_public_key(key))
+            # keys from a JSON Web Key Set name their curve
+            loaded = type(key)(**key.serialize())
+            self.assertIsNotNone(verifiers._load_public_key(loaded))
+
+    def test_verify_with_jwkest_if_a_key_cannot_be_loaded(self):
+        auth_token = token_utils.generate_auth_token(_CLAIMS, [self._rsa_key],
+                                                     alg=u"RS256")
+        with mock.patch.object(verifiers, u"_load_public_key",
+                               return_value=None):
+            self._verifier.verify(_unpack(auth_token), [self._rsa_key])
+            with self.assertRaises(suppliers.UnauthenticatedException):
+                self._verifier.verify(_unpack(_tamper(auth_token)),
+                                      [self._rsa_key])
+
+
+class CreateVerifierTest(unittest.TestCase):
+
+    @unittest.skipUnless(verifiers.has_cryptography(), u"needs cryptography")
+    def test_create_verifier_with_cryptography(self):
+        self.assertIsInstance(verifiers.create_verifier(),
+                              verifiers.CryptographyVerifier)
+
+    @mock.patch.object(verifiers, u"cryptography", None)
+    def test_create_verifier_without_cryptography(self):
+        self.assertIsInstance(verifiers.create_verifier(),
+                              verifiers.JwkestVerifier)
+        with self.assertRaises(ImportError):
+            verifiers.CryptographyVerifier()
@@ -15,17 +15,23 @@
 from __future__ import absolute_import
 
 from apitools.base.py import encoding
+from datetime import timedelta
 import mock
 import os
+import subprocess
+import sys
 import tempfile
+import time
 import unittest2
 import webtest
 from expects import be_false, be_none, be_true, expect, equal, raise_error
 
 from endpoints_management.auth import suppliers
 from endpoints_management.auth import tokens
-from endpoints_management.control import (client, report_request, service,
-                                          sc_messages, sm_messages, wsgi)
+from endpoints_management.config.service_config import ServiceConfigException
+from endpoints_management.control import (client, latency, report_request,
+                                          service, sc_messages, sm_messages,
+                                          wsgi)
 
 
 def _dummy_start_response(status, response_headers, exc_info=None):
@@ -78,6 +84,77 @@ class TestEnvironmentMiddleware(unittest2.TestCase):
         assert given[cls.METHOD_INFO].selector == 'allow-all.PATCH'
 
 
+class TestOperationIdGenerator(unittest2.TestCase):
+
+    def test_should_generate_distinct_uuid_like_ids(self):
+        generator = wsgi.OperationIdGenerator()
+        ids = set(generator() for _ in range(1000))
+        expect(len(ids)).to(equal(1000))
+        for an_id in ids:
+            expect(len(an_id)).to(equal(32))
+            int(an_id, 16)  # raises if it's not hex
+
+    def test_should_use_distinct_prefixes_per_instance(self):
+        first = wsgi.OperationIdGenerator()()
+        second = wsgi.OperationIdGenerator()()
+        expect(first[:16]).not_to(equal(second[:16]))
+
+    def test_should_use_a_new_prefix_after_a_fork(self):
+        generator = wsgi.OperationIdGenerator()
+        with mock.patch(u'os.getpid', return_value=1):
+            parent_id = generator()
+        with mock.patch(u'os.getpid', return_value=2):
+            child_id = generator()
+        expect(child_id[:16]).not_to(equal(parent_id[:16]))
+        expect(child_id[16:]).to(equal(parent_id[16:]))
+
+
+class TestRequestContext(unittest2.TestCase):
+
+    def setUp(self):
+        self.environ = {
+            u'wsgi.url_scheme': u'http',
+            u'PATH_INFO': u'/any',
+            u'QUERY_STRING': u'key=a-default-key&my_key=a-key',
+            u'HTTP_HOST': u'localhost',
+            u'HTTP_X_HTTP_METHOD_OVERRIDE': u'PATCH',
+            u'REQUEST_METHOD': u'GET'}
+
+    def test_should_be_stored_in_and_reused_from_the_environ(self):
+        context = wsgi.RequestContext.of(self.environ)
+        expect(self.environ[wsgi.RequestContext.ENVIRON_KEY]).to(
+            equal(context))
+        expect(wsgi.RequestContext.of(self.environ) is context).to(be_true)
+
+    def test_should_parse_the_request_once(self):
+        context = wsgi.RequestContext.of(self.environ)
+        expect(context.http_method).to(equal(u'PATCH'))
+        expect(context.parsed_uri.path).to(equal(u'/any'))
+        expect(context.parsed_uri is context.parsed_uri).to(be_true)
+        expect(context.query_params[u'my_key']).to(equal([u'a-key']))
+        expect(context.query_params is context.query_params).to(be_true)
+
+    def test_should_find_the_api_key(self):
+        method_info = service.MethodInfo(u'a.selector', None, None)
+        method_info.add_url_query_param(u'api_key', u'my_key')
+        context = wsgi.RequestContext.of(self.environ)
+        expect(context.api_key(method_info)).to(equal(u'a-key'))
+        other_method_info = service.MethodInfo(u'another.selector', None, None)
+        expect(context.api_key(other_method_info)).to(
+            equal(u'a-default-key'))
+
+    def test_should_find_the_auth_token(self):
+        context = wsgi.RequestContext.of(self.environ)
+        expect(context.auth_token).to(be_none)
+        self.environ[u'QUERY_STRING'] = u'access_token=a-query-token'
+        context = wsgi.RequestContext(self.environ)
+        expect(context.auth_token).to(equal(u'a-query-token'))
+        self.environ[u'HTTP_AUTHORIZATION'] = u'Bearer a-header-token'
+        expect(context.auth_token).to(equal(u'a-header-token'))
+        self.environ[u'HTTP_AUTHORIZATION'] = u'Basic not-a-bearer-token'
+        expect(context.auth_token).to(be_none)
+
+
 class TestMiddleware(unittest2.TestCase):
     PROJECT_ID = u'middleware'
 
@@ -96,7 +173,7 @@ class TestMiddleware(unittest2.TestCase):
             operationId=u'fake_operation_id')
         wrapped = wsgi.Middleware(wrappee, self.PROJECT_ID, control_client)
         wrapped(given, _dummy_start_response)
-        expect(control_client.check.called).to(be_false)
+        expect(control_client.check_info.called).to(be_false)
         expect(control_client.report.called).to(be_false)
         expect(control_client.allocate_quota.called).to(be_false)
 
@@ -116,13 +193,35 @@ class TestMiddleware(unittest2.TestCase):
         with_control = wsgi.Middleware(wrappee, self.PROJECT_ID, control_client)
         wrapped = wsgi.EnvironmentMiddleware(with_control,
                                              service.Loaders.SIMPLE.load())
-        control_client.check.return_value = dummy_response
+        control_client.check_info.return_value = dummy_response
         wrapped(given, _dummy_start_response)
-        expect(control_client.check.called).to(be_true)
+        expect(control_client.check_info.called).to(be_true)
         expect(control_client.report.called).to(be_true)
         # no quota definitions in this service config
         expect(control_client.allocate_quota.called).to(be_false)
 
+    def test_should_record_latencies_if_a_tracker_is_set(self):
+        wrappee = _DummyWsgiApp()
+        control_client = mock.MagicMock(spec=client.Client)
+        given = {
+            u'wsgi.url_scheme': u'http',
+            u'PATH_INFO': u'/any',
+            u'REMOTE_ADDR': u'192.168.0.3',
+            u'HTTP_HOST': u'localhost',
+            u'HTTP_REFERER': u'example.myreferer.com',
+            u'REQUEST_METHOD': u'GET'}
+        tracker = latency.LatencyTracker()
+        with_control = wsgi.Middleware(wrappee, self.PROJECT_ID, control_client,
+                                       latency_tracker=tracker)
+        wrapped = wsgi.EnvironmentMiddleware(with_control,
+                                             service.Loaders.SIMPLE.load())
+        control_client.check_info.return_value = sc_messages.CheckResponse(
+            operationId=u'fake_operation_id')
+        wrapped(given, _dummy_start_response)
+        expect(tracker.histogram().count).to(equal(1))
+        expect(tracker.histogram(
+            consumer=u'project:' + self.PROJECT_ID).count).to(equal(1))
+
     def test_should_send_report_request_if_check_fails(self):
         wrappee = _DummyWsgiApp()
         control_client = mock.MagicMock(spec=client.Client)
@@ -144,9 +243,9 @@ class TestMiddleware(unittest2.TestCase):
                                self.PROJECT_ID,
                                control_client,
                                loader=service.Loaders.SIMPLE)
-        control_client.check.return_value = dummy_response
+        control_client.check_info.return_value = dummy_response
         wrapped(given, _dummy_start_response)
-        expect(control_client.check.called).to(be_true)
+        expect(control_client.check_info.called).to(be_true)
         expect(control_client.report.called).to(be_true)
         expect(control_client.allocate_quota.called).to(be_false)
 
@@ -162,7 +261,7 @@ class TestMiddleware(unittest2.TestCase):
             u'REQUEST_METHOD': u'GET'}
         dummy_response = sc_messages.CheckResponse(
             operationId=u'fake_operation_id')
-        control_client.check.return_value = dummy_response
+        control_client.check_info.return_value = dummy_response
 
         loader = mock.MagicMock()
         # fail to load twice, then load
@@ -182,6 +281,155 @@ class TestMiddleware(unittest2.TestCase):
 
 
 
+def _simple_service(config_id):
+    a_service = service.Loaders.SIMPLE.load()
+    a_service.id = config_id
+    return a_service
+
+
+class TestConfigFetchWrapperReloading(unittest2.TestCase):
+    PROJECT_ID = u'middleware'
+    RELOAD_INTERVAL = timedelta(seconds=0.01)
+
+    def setUp(self):
+        self.control_client = mock.MagicMock(spec=client.Client)
+        self.control_client.check_info.return_value = sc_messages.CheckResponse(
+            operationId=u'fake_operation_id')
+        self.loader = mock.MagicMock()
+        self.loader.load.return_value = _simple_service(u'config-1')
+        # unless a test says otherwise, the loader cannot obtain config ids
+        self.loader.latest_id.return_value = None
+
+    def _wrapper(self, **kw):
+        return wsgi.ConfigFetchWrapper(
+            _DummyWsgiApp(), self.PROJECT_ID, self.control_client,
+            loader=self.loader, disable_threading=True, **kw)
+
+    def test_should_not_replace_the_backend_for_the_same_config_id(self):
+        wrapper = self._wrapper()
+        backend = wrapper.wsgi_backend
+        expect(wrapper.try_reloading()).to(be_false)
+        expect(wrapper.wsgi_backend is backend).to(be_true)
+
+    def test_should_replace_the_backend_for_a_new_config_id(self):
+        wrapper = self._wrapper()
+        backend = wrapper.wsgi_backend
+        new_service = _simple_service(u'config-2')
+        self.loader.load.return_value = new_service
+        expect(wrapper.try_reloading()).to(be_true)
+        expect(wrapper.service_config).to(equal(new_service))
+        expect(wrapper.wsgi_backend is backend).to(be_false)
+        expect(wrapper.wsgi_backend._service).to(equal(new_service))
+
+        test_app = webtest.TestApp(wrapper)
+        resp = test_app.get(u'/any')
+        expect(resp.status_code).to(equal(200))
+        expect(self.control_client.check_info.called).to(be_true)
+
+    def test_should_only_load_the_config_if_its_id_is_new(self):
+        wrapper = self._wrapper()
+        self.loader.load.reset_mock()
+        self.loader.latest_id.return_value = u'config-1'
+        expect(wrapper.try_reloading()).to(be_false)
+        expect(self.loader.load.called).to(be_false)
+
+        self.loader.latest_id.return_value = u'config-2'
+        self.loader.load.return_value = _simple_service(u'config-2')
+        expect(wrapper.try_reloading()).to(be_true)
+        self.loader.load.assert_called_once_with(service_version=u'config-2')
+
+    def test_should_load_the_config_if_its_id_is_unknown(self):
+        wrapper = self._wrapper()
+        self.loader.latest_id.return_value = None
+        self.loader.load.return_value = _simple_service(u'config-2')
+        expect(wrapper.try_reloading()).to(be_true)
+
+    def test_should_keep_the_backend_if_the_config_id_is_unavailable(self):
+        wrapper = self._wrapper()
+        backend = wrapper.wsgi_backend
+        self.loader.load.reset_mock()
+        self.loader.latest_id.side_effect = ServiceConfigException()
+        expect(wrapper.try_reloading()).to(be_false)
+        expect(wrapper.wsgi_backend is backend).to(be_true)
+        expect(self.loader.load.called).to(be_false)
+
+    def test_should_pass_the_middleware_options_to_new_backends(self):
+        tracker = latency.LatencyTracker()
+        with mock.patch.object(wsgi, u'Middleware',
+                               wraps=wsgi.Middleware) as middleware_class:
+            wrapper = self._wrapper(latency_tracker=tracker,
+                                    share_operation_id=True)
+            self.loader.load.return_value = _simple_service(u'config-2')
+            wrapper.try_reloading()
+        expect(middleware_class.call_count).to(equal(2))
+        for call in middleware_class.call_args_list:
+            expect(call[1]).to(equal({u'latency_tracker': tracker,
+                                      u'share_operation_id': True}))
+
+    @mock.patch.object(wsgi, u'ConfigFetchWrapper')
+    def test_add_all_should_pass_the_middleware_options(self, wrapper_class):
+        tracker = latency.LatencyTracker()
+        wsgi.add_all(_DummyWsgiApp(), self.PROJECT_ID, self.control_client,
+                     loader=self.loader, latency_tracker=tracker,
+                     share_operation_id=True)
+        expect(wrapper_class.call_args[1]).to(equal({
+            u'reload_interval': None,
+            u'latency_tracker': tracker,
+            u'share_operation_id': True}))
+
+    def test_should_keep_the_backend_if_reloading_fails(self):
+        wrapper = self._wrapper()
+        backend = wrapper.wsgi_backend
+        for failure in (None, ValueError(), ServiceConfigException()):
+            self.loader.load.side_effect = [failure]
+            expect(wrapper.try_reloading()).to(be_false)
+            expect(wrapper.wsgi_backend is backend).to(be_true)
+
+    def test_should_reload_periodically_until_stopped(self):
+        wrapper = self._wrapper(reload_interval=self.RELOAD_INTERVAL)
+        new_service = _simple_service(u'config-2')
+
+        def load_then_stop():
+            if self.loader.load.call_count > 3:
+                wrapper.stop_reloading()
+            return new_service
+
+        self.loader.load.side_effect = load_then_stop
+        wrapper.reload_periodically()
+        # includes the initial load
+        expect(self.loader.load.call_count).to(equal(4))
+        expect(wrapper.service_config).to(equal(new_service))
+
+    def test_should_keep_reloading_after_unexpected_failures(self):
+        wrapper = self._wrapper(reload_interval=self.RELOAD_INTERVAL)
+
+        def fail_then_stop():
+            if self.loader.load.call_count > 2:
+                wrapper.stop_reloading()
+            raise IOError()
+
+        self.loader.load.side_effect = fail_then_stop
+        wrapper.reload_periodically()
+        expect(self.loader.load.call_count).to(equal(3))
+
+    @mock.patch.object(client, u'create_thread')
+    def test_should_launch_a_reloading_thread(self, create_thread):
+        wrapper = wsgi.ConfigFetchWrapper(
+            _DummyWsgiApp(), self.PROJECT_ID, self.control_client,
+            loader=self.loader, reload_interval=self.RELOAD_INTERVAL)
+        create_thread.assert_called_once_with(
+            target=wrapper.reload_periodically)
+        expect(create_thread.return_value.start.called).to(be_true)
+        expect(create_thread.return_value.daemon).to(be_true)
+
+    @mock.patch.object(client, u'create_thread')
+    def test_should_not_launch_a_thread_by_default(self, create_thread):
+        wsgi.ConfigFetchWrapper(
+            _DummyWsgiApp(), self.PROJECT_ID, self.control_client,
+            loader=self.loader)
+        expect(create_thread.called).to(be_false)
+
+
 _SYSTEM_PARAMETER_CONFIG_TEST = b"""
 {
     "name": "system-parameter-config",
@@ -326,11 +574,11 @@ class TestMiddlewareWithParams(unittest2.TestCase):
                                self.PROJECT_ID,
                                control_client,
                                loader=service.Loaders.ENVIRONMENT)
-        control_client.check.return_value = dummy_response
+        control_client.check_info.return_value = dummy_response
         wrapped(given, _dummy_start_response)
-        expect(control_client.check.called).to(be_true)
-        req = control_client.check.call_args[0][0]
-        expect(req.checkRequest.operation.consumerId).to(
+        expect(control_client.check_info.called).to(be_true)
+        req = control_client.check_info.call_args[0][0]
+        expect(req.consumer_id).to(
             equal(u'project:middleware-with-params'))
         expect(control_client.report.called).to(be_true)
         expect(control_client.allocate_quota.called).to(be_false)
@@ -351,17 +599,43 @@ class TestMiddlewareWithParams(unittest2.TestCase):
                                self.PROJECT_ID,
                                control_client,
                                loader=service.Loaders.ENVIRONMENT)
-        control_client.check.return_value = dummy_response
+        control_client.check_info.return_value = dummy_response
         control_client.allocate_quota.side_effect = lambda req: sc_messages.AllocateQuotaResponse(
             operationId=req.allocateQuotaRequest.allocateOperation.operationId)
         wrapped(given, _dummy_start_response)
-        expect(control_client.check.called).to(be_true)
-        req = control_client.check.call_args[0][0]
-        expect(req.checkRequest.operation.consumerId).to(
+        expect(control_client.check_info.called).to(be_true)
+        req = control_client.check_info.call_args[0][0]
+        expect(req.consumer_id).to(
             equal(u'project:middleware-with-params'))
         expect(control_client.report.called).to(be_true)
         expect(control_client.allocate_quota.called).to(be_true)
 
+    def test_should_share_operation_ids_if_configured(self):
+        for share in (True, False):
+            wrappee = _DummyWsgiApp()
+            control_client = mock.MagicMock(spec=client.Client)
+            given = {
+                u'wsgi.url_scheme': u'http',
+                u'PATH_INFO': u'/uvw/method2/with_no_param',
+                u'REMOTE_ADDR': u'192.168.0.3',
+                u'HTTP_HOST': u'localhost',
+                u'HTTP_REFERER': u'example.myreferer.com',
+                u'REQUEST_METHOD': u'GET'}
+            with_control = wsgi.Middleware(wrappee, self.PROJECT_ID,
+                                           control_client,
+                                           share_operation_id=share)
+            wrapped = wsgi.EnvironmentMiddleware(
+                with_control, service.Loaders.ENVIRONMENT.load())
+            control_client.check_info.return_value = sc_messages.CheckResponse(
+                operationId=u'fake_operation_id')
+            control_client.allocate_quota.side_effect = lambda req: sc_messages.AllocateQuotaResponse(
+                operationId=req.allocateQuotaRequest.allocateOperation.operationId)
+            wrapped(given, _dummy_start_response)
+            check_info = control_client.check_info.call_args[0][0]
+            quota_req = control_client.allocate_quota.call_args[0][0]
+            quota_op_id = quota_req.allocateQuotaRequest.allocateOperation.operationId
+            expect(quota_op_id == check_info.operation_id).to(equal(share))
+
     def test_should_send_requests_with_configured_query_param_api_key(self):
         wrappee = _DummyWsgiApp()
         control_client = mock.MagicMock(spec=client.Client)
@@ -379,11 +653,11 @@ class TestMiddlewareWithParams(unittest2.TestCase):
                                self.PROJECT_ID,
                                control_client,
                                loader=service.Loaders.ENVIRONMENT)
-        control_client.check.return_value = dummy_response
+        control_client.check_info.return_value = dummy_response
         wrapped(given, _dummy_start_response)
-        expect(control_client.check.called).to(be_true)
-        check_req = control_client.check.call_args[0][0]
-        expect(check_req.checkRequest.operation.consumerId).to(
+        expect(control_client.check_info.called).to(be_true)
+        check_req = control_client.check_info.call_args[0][0]
+        expect(check_req.consumer_id).to(
             equal(u'api_key:my-query-value'))
         expect(control_client.report.called).to(be_true)
         report_req = control_client.report.call_args[0][0]
@@ -408,12 +682,12 @@ class TestMiddlewareWithParams(unittest2.TestCase):
                                self.PROJECT_ID,
                                control_client,
                                loader=service.Loaders.ENVIRONMENT)
-        control_client.check.return_value = dummy_response
+        control_client.check_info.return_value = dummy_response
         wrapped(given, _dummy_start_response)
-        expect(control_client.check.called).to(be_true)
-        check_request = control_client.check.call_args_list[0].checkRequest
-        check_req = control_client.check.call_args[0][0]
-        expect(check_req.checkRequest.operation.consumerId).to(
+        expect(control_client.check_info.called).to(be_true)
+        check_request = control_client.check_info.call_args_list[0].checkRequest
+        check_req = control_client.check_info.call_args[0][0]
+        expect(check_req.consumer_id).to(
             equal(u'api_key:my-header-value'))
         expect(control_client.report.called).to(be_true)
         report_req = control_client.report.call_args[0][0]
@@ -439,12 +713,12 @@ class TestMiddlewareWithParams(unittest2.TestCase):
                                    self.PROJECT_ID,
                                    control_client,
                                    loader=service.Loaders.ENVIRONMENT)
-            control_client.check.return_value = dummy_response
+            control_client.check_info.return_value = dummy_response
             wrapped(given, _dummy_start_response)
-            expect(control_client.check.called).to(be_true)
-            check_request = control_client.check.call_args_list[0].checkRequest
-            check_req = control_client.check.call_args[0][0]
-            expect(check_req.checkRequest.operation.consumerId).to(
+            expect(control_client.check_info.called).to(be_true)
+            check_request = control_client.check_info.call_args_list[0].checkRequest
+            check_req = control_client.check_info.call_args[0][0]
+            expect(check_req.consumer_id).to(
                 equal(u'api_key:my-default-api-key-value'))
             expect(control_client.report.called).to(be_true)
             report_req = control_client.report.call_args[0][0]
@@ -468,9 +742,9 @@ class TestMiddlewareWithParams(unittest2.TestCase):
                                self.PROJECT_ID,
                                control_client,
                                loader=service.Loaders.ENVIRONMENT)
-        control_client.check.return_value = dummy_response
+        control_client.check_info.return_value = dummy_response
         wrapped(given, _dummy_start_response)
-        expect(control_client.check.called).to(be_false)
+        expect(control_client.check_info.called).to(be_false)
         expect(control_client.report.called).to(be_true)
         report_req = control_client.report.call_args[0][0]
         expect(report_req.reportRequest.operations[0].consumerId).to(
@@ -570,10 +844,60 @@ class TestAuthenticationMiddleware(unittest2.TestCase):
                                                     _dummy_start_response))
         self.assertFalse(self.patched_environ)
 
+    @mock.patch(u"os.environ", patched_environ)
+    def test_set_user_info_only_in_the_request_context(self):
+        environ = {
+            u"QUERY_STRING": u"access_token=test-token",
+            wsgi.EnvironmentMiddleware.METHOD_INFO: mock.MagicMock(),
+            wsgi.EnvironmentMiddleware.SERVICE_NAME: u"test-service-name"}
+        auth_middleware = AuthMiddleware(self.UserInfoWsgiApp(),
+                                         self._mock_authenticator,
+                                         use_os_environ=False)
+        user_info = mock.MagicMock()
+        self._mock_authenticator.authenticate.return_value = user_info
+        self.assertIsNone(auth_middleware(environ, _dummy_start_response))
+
+        context_app = AuthMiddleware(self.ContextUserInfoWsgiApp(),
+                                     self._mock_authenticator)
+        self.assertEqual(user_info, context_app(environ, _dummy_start_response))
+        self.assertIsNone(wsgi.get_user_info())
+        self.assertFalse(self.patched_environ)
+
+    def test_does_not_use_a_process_wide_os_environ(self):
+        environ = {
+            u"QUERY_STRING": u"access_token=test-token",
+            wsgi.EnvironmentMiddleware.METHOD_INFO: mock.MagicMock(),
+            wsgi.EnvironmentMiddleware.SERVICE_NAME: u"test-service-name"}
+        user_info = mock.MagicMock()
+        self._mock_authenticator.authenticate.return_value = user_info
+        context_app = AuthMiddleware(self.ContextUserInfoWsgiApp(),
+                                     self._mock_authenticator)
+        with mock.patch.dict(u"os.environ"):
+            with mock.patch.object(os.environ, u"__setitem__") as setitem:
+                self.assertEqual(user_info,
+                                 context_app(environ, _dummy_start_response))
+                self.assertFalse(setitem.called)
+
+    def test_clears_the_user_info_if_the_application_fails(self):
+        environ = {
+            u"QUERY_STRING": u"access_token=test-token",
+            wsgi.EnvironmentMiddleware.METHOD_INFO: mock.MagicMock(),
+            wsgi.EnvironmentMiddleware.SERVICE_NAME: u"test-service-name"}
+        self._mock_authenticator.authenticate.return_value = mock.MagicMock()
+        application = mock.MagicMock(side_effect=RuntimeError())
+        auth_middleware = AuthMiddleware(application, self._mock_authenticator)
+        with self.assertRaises(RuntimeError):
+            auth_middleware(environ, _dummy_start_response)
+        self.assertIsNone(wsgi.get_user_info())
+
     class UserInfoWsgiApp(object):
         def __call__(self, environ, start_response):
             return os.environ.get(wsgi.AuthenticationMiddleware.USER_INFO)
 
+    class ContextUserInfoWsgiApp(object):
+        def __call__(self, environ, start_response):
+            return wsgi.get_user_info()
+
 
 class TestCreateAuthenticator(unittest2.TestCase):
     def test_create_without_service(self):
@@ -596,6 +920,48 @@ class TestCreateAuthenticator(unittest2.TestCase):
         self.assertIsNotNone(wsgi._create_authenticator(service))
 
 
+_IMPORT_CHECK = u"""
+import sys
+import time
+start = time.time()
+from endpoints_management.control import service, wsgi
+print(time.time() - start)
+print(u'numpy' in sys.modules)
+print(service._SIMPLE_CORE is not None)
+print(wsgi._platform_detector._started)
+"""
+
+_LAZY_IMPORT_CHECK = u"""
+import sys
+_GEN = u'endpoints_management.gen.servicemanagement_v1_messages'
+import endpoints_management.auth
+import endpoints_management.control as control
+print(_GEN in sys.modules)
+print(control.MetricKind is control.sm_messages.MetricDescriptor.MetricKindValueValuesEnum)
+print(_GEN in sys.modules)
+"""
+
+
+class TestImport(unittest2.TestCase):
+    # Importing wsgi should be cheap and not touch the network; this makes
+    # sure the slow parts stay deferred until they're needed
+    MAX_IMPORT_SECS = 5
+
+    def test_should_defer_slow_initialization(self):
+        output = subprocess.check_output([sys.executable, u'-c', _IMPORT_CHECK])
+        import_secs, loaded_numpy, loaded_simple, started_detection = (
+            output.split())
+        expect(float(import_secs) < self.MAX_IMPORT_SECS).to(be_true)
+        expect(loaded_numpy).to(equal(u'False'))
+        expect(loaded_simple).to(equal(u'False'))
+        expect(started_detection).to(equal(u'False'))
+
+    def test_should_import_the_generated_modules_when_first_used(self):
+        output = subprocess.check_output(
+            [sys.executable, u'-c', _LAZY_IMPORT_CHECK])
+        expect(output.split()).to(equal([u'False', u'True', u'True']))
+
+
 patched_platform_environ = {}
 @mock.patch.dict(u'os.environ', patched_platform_environ, clear=True)
 class TestPlatformDetection(unittest2.TestCase):
@@ -632,6 +998,96 @@ class TestPlatformDetection(unittest2.TestCase):
         self.assertEqual(report_request.ReportedPlatforms.UNKNOWN,
                          wsgi._get_platform())
 
+    @mock.patch.object(wsgi, u'_running_on_gce', return_value=False)
+    def test_override(self, _running_on_gce):
+        os.environ[wsgi.PLATFORM_VAR] = u'gce'
+        self.assertEqual(report_request.ReportedPlatforms.GCE,
+                         wsgi._get_platform())
+        expect(_running_on_gce.called).to(be_false)
+
+    @mock.patch.object(wsgi, u'_running_on_gce', return_value=False)
+    def test_ignores_unknown_override(self, _running_on_gce):
+        os.environ[wsgi.PLATFORM_VAR] = u'not-a-platform'
+        self.assertEqual(report_request.ReportedPlatforms.UNKNOWN,
+                         wsgi._get_platform())
+
+
+@mock.patch.dict(u'os.environ', patched_platform_environ, clear=True)
+class TestPlatformDetector(unittest2.TestCase):
+
+    def setUp(self):
+        self._detector = wsgi._PlatformDetector()
+
+    @mock.patch.object(wsgi, u'_running_on_gce', return_value=True)
+    def test_should_not_detect_until_needed(self, _running_on_gce):
+        with mock.patch(u'threading.Thread') as thread_class:
+            wsgi._PlatformDetector()
+            expect(thread_class.called).to(be_false)
+        expect(_running_on_gce.called).to(be_false)
+
+    @mock.patch.object(wsgi, u'_running_on_gce', return_value=True)
+    def test_should_not_probe_until_detection_completes(self, _running_on_gce):
+        with mock.patch(u'threading.Thread') as thread_class:
+            self.assertEqual(report_request.ReportedPlatforms.UNKNOWN,
+                             self._detector.get())
+            self.assertEqual(report_request.ReportedPlatforms.UNKNOWN,
+                             self._detector.get())
+            expect(thread_class.call_count).to(equal(1))
+            expect(_running_on_gce.called).to(be_false)
+
+            # complete detection as the thread would have
+            thread_class.call_args[1][u'target']()
+            self.assertEqual(report_request.ReportedPlatforms.GCE,
+                             self._detector.get())
+            expect(_running_on_gce.call_count).to(equal(1))
+
+    @mock.patch.object(wsgi, u'_running_on_gce', return_value=True)
+    def test_should_detect_in_the_background(self, _running_on_gce):
+        self._detector.start()
+        for _ in range(100):
+            if self._detector._platform is not None:
+                break
+            time.sleep(0.01)
+        self.assertEqual(report_request.ReportedPlatforms.GCE,
+                         self._detector.get())
+
+    @mock.patch.object(wsgi, u'_running_on_gce', return_value=True)
+    def test_should_restart_detection_after_a_fork(self, _running_on_gce):
+        with mock.patch(u'threading.Thread') as thread_class:
+            self._detector.start()
+            self._detector.start()
+            expect(thread_class.call_count).to(equal(1))
+
+            # a forked process does not inherit the detection thread
+            with mock.patch(u'os.getpid', return_value=os.getpid() + 1):
+                self._detector.get()
+                self._detector.get()
+            expect(thread_class.call_count).to(equal(2))
+
+            thread_class.call_args[1][u'target']()
+            with mock.patch(u'os.getpid', return_value=os.getpid() + 2):
+                self._detector.get()
+            expect(thread_class.call_count).to(equal(2))
+
+    @mock.patch.object(wsgi, u'_running_on_gce', return_value=True)
+    def test_should_use_the_platform_that_is_set(self, _running_on_gce):
+        self._detector.set(report_request.ReportedPlatforms.GKE)
+        self._detector.start()
+        self._detector._detect()
+        self.assertEqual(report_request.ReportedPlatforms.GKE,
+                         self._detector.get())
+
+    @mock.patch.object(wsgi, u'_running_on_gce', return_value=True)
+    def test_should_not_probe_if_the_thread_fails_to_start(self,
+                                                          _running_on_gce):
+        with mock.patch(u'threading.Thread') as thread_class:
+            thread_class.return_value.start.side_effect = RuntimeError()
+            self.assertEqual(report_request.ReportedPlatforms.UNKNOWN,
+                             self._detector.get())
+        expect(_running_on_gce.called).to(be_false)
+        self.assertEqual(report_request.ReportedPlatforms.UNKNOWN,
+                         self._detector.get())
+
 
 def _read_service_from_json(json):
     return encoding.JsonToMessage(sm_messages.Service, json)
@@ -58,7 +58,7 @@ def test_handle_missing_api_key(control_client, test_app):
     url = '/uvw/method_needs_api_key/more_stuff'
     check_resp = sc_messages.CheckResponse(
         operationId=u'fake_operation_id')
-    control_client.check.return_value = check_resp
+    control_client.check_info.return_value = check_resp
     resp = test_app.get(url, expect_errors=True)
     assert resp.status_code == 401
     assert resp.content_type == 'application/json'
@@ -75,7 +75,7 @@ def test_handle_out_of_quota(control_client, test_app):
     )
     check_resp = sc_messages.CheckResponse(
         operationId=u'fake_operation_id')
-    control_client.check.return_value = check_resp
+    control_client.check_info.return_value = check_resp
     control_client.allocate_quota.return_value = quota_resp
     url = '/uvw/method2/with_no_param'
     resp = test_app.get(url, expect_errors=True)